@@ -0,0 +1,61 @@
+"""
+Quality and fast modes of AI calls.
+
+In quality mode the model reasons in the planning field of the response and thinks
+as much as it decides. Fast mode uses response schemas without planning, an explicit
+thinking budget and a tight limit of output tokens, since output tokens dominate latency.
+"""
+
+from dataclasses import dataclass
+
+from google import genai
+from pydantic_ai.models.google import GoogleModelSettings
+
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.deutsh_enums import AICallType, AIMode
+from deutsch_tg_bot.load_shedding import LoadLevel, load_shedder
+
+# Prompts ask to reason in the planning field, which fast mode schemas don't have
+FAST_MODE_PROMPT_NOTE = """
+
+IMPORTANT: The response schema has no 'planning' field. Don't write out your reasoning,
+fill in only the fields of the schema. Keep the explanations short.
+"""
+
+
+@dataclass(frozen=True)
+class AICallConfig:
+    mode: AIMode
+    thinking_budget: int | None = None  # Model default if None
+    max_output_tokens: int | None = None
+
+    @property
+    def is_fast(self) -> bool:
+        return self.mode is AIMode.FAST
+
+    def get_thinking_config(self) -> genai.types.ThinkingConfig | None:
+        if self.thinking_budget is None:
+            return None
+        return genai.types.ThinkingConfig(thinking_budget=self.thinking_budget)
+
+    def get_google_model_settings(self) -> GoogleModelSettings:
+        """Settings of pydantic-ai agents, merged with the settings of the agent."""
+        model_settings = GoogleModelSettings()
+        if self.thinking_budget is not None:
+            model_settings["google_thinking_config"] = {"thinking_budget": self.thinking_budget}
+        if self.max_output_tokens is not None:
+            model_settings["max_tokens"] = self.max_output_tokens
+        return model_settings
+
+
+def get_ai_call_config(call_type: AICallType) -> AICallConfig:
+    mode = settings.AI_CALL_MODES.get(call_type, AIMode.QUALITY)
+    if load_shedder.is_active(LoadLevel.LIGHT_MODELS):
+        mode = AIMode.FAST
+    if mode is AIMode.QUALITY:
+        return AICallConfig(mode=mode)
+    return AICallConfig(
+        mode=mode,
+        thinking_budget=settings.AI_FAST_MODE_THINKING_BUDGETS.get(call_type),
+        max_output_tokens=settings.AI_FAST_MODE_MAX_OUTPUT_TOKENS.get(call_type),
+    )
@@ -0,0 +1,222 @@
+"""
+Central scheduler of AI calls: priority classes, fair queuing between chats
+and concurrency limit of each model.
+"""
+
+import asyncio
+import heapq
+import time
+from collections import deque
+from collections.abc import AsyncGenerator, Coroutine
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any
+
+from deutsch_tg_bot.ai_tracing import AICallTrace, ai_call_span
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.deutsh_enums import AICallType, AIMode
+from deutsch_tg_bot.tg_timing import timed_stage
+
+
+class AIPriority(IntEnum):
+    INTERACTIVE = 0  # The user waits for the answer
+    PREFETCH = 1  # Work for the next turn, like sentence prefetch
+    MAINTENANCE = 2  # Offline work, like generation of situation presets
+
+
+# Set by update handling and inherited by tasks it creates
+current_chat_id: ContextVar[int | None] = ContextVar("current_chat_id", default=None)
+current_ai_priority: ContextVar[AIPriority] = ContextVar(
+    "current_ai_priority", default=AIPriority.INTERACTIVE
+)
+
+
+@dataclass
+class AICallSlot:
+    model: str
+    priority: AIPriority
+    trace: AICallTrace
+    queue_wait_seconds: float = 0.0
+
+
+@dataclass(order=True)
+class _Waiter:
+    finish_tag: float
+    sequence: int
+    start_tag: float = field(compare=False)
+    chat_id: int | None = field(compare=False)
+    future: asyncio.Future[None] = field(compare=False)
+
+
+class _ModelQueue:
+    """
+    Waiters of one model. Classes are served in strict priority order.
+    Inside a class, chats are served by start-time fair queuing: each call costs 1,
+    so a chat with many queued calls can't delay the first call of another chat.
+    """
+
+    def __init__(self, concurrency: int) -> None:
+        self.concurrency = concurrency
+        self.active_calls = 0
+        self.waiters: dict[AIPriority, list[_Waiter]] = {priority: [] for priority in AIPriority}
+        self.virtual_time = 0.0
+        self.chat_finish_tags: dict[int | None, float] = {}
+
+    def has_waiters(self) -> bool:
+        return any(self.waiters.values())
+
+    def get_waiters_number(self) -> int:
+        return sum(
+            not waiter.future.cancelled() for waiters in self.waiters.values() for waiter in waiters
+        )
+
+    def enqueue(self, priority: AIPriority, chat_id: int | None, sequence: int) -> _Waiter:
+        start_tag = max(self.virtual_time, self.chat_finish_tags.get(chat_id, 0.0))
+        waiter = _Waiter(
+            finish_tag=start_tag + 1.0,
+            sequence=sequence,
+            start_tag=start_tag,
+            chat_id=chat_id,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self.chat_finish_tags[chat_id] = waiter.finish_tag
+        heapq.heappush(self.waiters[priority], waiter)
+        return waiter
+
+    def dispatch(self) -> None:
+        while self.active_calls < self.concurrency:
+            waiter = self._pop_next_waiter()
+            if waiter is None:
+                break
+            self.virtual_time = waiter.start_tag
+            self.active_calls += 1
+            waiter.future.set_result(None)
+
+        if not self.has_waiters():
+            # Tags are relative to virtual time, they carry no information without contention
+            self.chat_finish_tags.clear()
+
+    def promote(self, chat_id: int, priority: AIPriority) -> None:
+        for lower_priority in AIPriority:
+            if lower_priority <= priority:
+                continue
+            waiters = self.waiters[lower_priority]
+            promoted = [waiter for waiter in waiters if waiter.chat_id == chat_id]
+            if not promoted:
+                continue
+            waiters[:] = [waiter for waiter in waiters if waiter.chat_id != chat_id]
+            heapq.heapify(waiters)
+            for waiter in promoted:
+                heapq.heappush(self.waiters[priority], waiter)
+
+    def _pop_next_waiter(self) -> _Waiter | None:
+        for waiters in self.waiters.values():
+            while waiters:
+                waiter = heapq.heappop(waiters)
+                # Cancelled waiters are removed lazily
+                if not waiter.future.cancelled():
+                    return waiter
+        return None
+
+
+class AIScheduler:
+    def __init__(
+        self, model_concurrency: dict[str, int] | None = None, default_concurrency: int = 8
+    ) -> None:
+        self._model_concurrency = model_concurrency or {}
+        self._default_concurrency = default_concurrency
+        self._queues: dict[str, _ModelQueue] = {}
+        self._sequence = 0
+        # Finish time and latency, with queue wait, of recent interactive calls
+        self._interactive_latencies: deque[tuple[float, float]] = deque(maxlen=1000)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        model: str,
+        call_type: AICallType,
+        mode: AIMode | None = None,
+        prompt_version: str | None = None,
+        priority: AIPriority | None = None,
+        chat_id: int | None = None,
+    ) -> AsyncGenerator[AICallSlot, None]:
+        """
+        Wait for a free slot of the model and hold it during the call, traced in one span
+        with the queue wait. Priority and chat id default to the ones of the current context.
+        """
+        if priority is None:
+            priority = current_ai_priority.get()
+        if chat_id is None:
+            chat_id = current_chat_id.get()
+        queue = self._get_queue(model)
+
+        with ai_call_span(call_type, model, mode, prompt_version) as trace:
+            trace.set_scheduling(priority.name, chat_id)
+            call_slot = AICallSlot(model=model, priority=priority, trace=trace)
+            start_time = time.perf_counter()
+            if queue.active_calls < queue.concurrency and not queue.has_waiters():
+                queue.active_calls += 1
+            else:
+                self._sequence += 1
+                waiter = queue.enqueue(priority, chat_id, self._sequence)
+                try:
+                    with timed_stage("ai_queue_wait"):
+                        await waiter.future
+                except asyncio.CancelledError:
+                    if waiter.future.done() and not waiter.future.cancelled():
+                        # Slot was granted right before cancellation
+                        self._release(queue)
+                    raise
+            call_slot.queue_wait_seconds = time.perf_counter() - start_time
+            trace.record_queue_wait(call_slot.queue_wait_seconds)
+
+            try:
+                with timed_stage(f"ai:{model}"):
+                    yield call_slot
+            finally:
+                self._release(queue)
+                if priority is AIPriority.INTERACTIVE:
+                    finish_time = time.perf_counter()
+                    self._interactive_latencies.append((finish_time, finish_time - start_time))
+
+    def promote_chat(self, chat_id: int, priority: AIPriority = AIPriority.INTERACTIVE) -> None:
+        """Raise priority of queued calls of the chat, e.g. when the user waits for a prefetch."""
+        for queue in self._queues.values():
+            queue.promote(chat_id, priority)
+
+    def get_queue_depth(self) -> int:
+        """Number of calls waiting for a slot, of all models."""
+        return sum(queue.get_waiters_number() for queue in self._queues.values())
+
+    def get_recent_interactive_latencies(self, window_seconds: float) -> list[float]:
+        min_finish_time = time.perf_counter() - window_seconds
+        return [
+            latency
+            for finish_time, latency in self._interactive_latencies
+            if finish_time >= min_finish_time
+        ]
+
+    def _get_queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            concurrency = self._model_concurrency.get(model, self._default_concurrency)
+            queue = self._queues[model] = _ModelQueue(concurrency)
+        return queue
+
+    def _release(self, queue: _ModelQueue) -> None:
+        queue.active_calls -= 1
+        queue.dispatch()
+
+
+async def run_with_ai_priority[T](priority: AIPriority, coro: Coroutine[Any, Any, T]) -> T:
+    """Run AI calls of the coroutine with the priority. Use it as the coroutine of a task."""
+    current_ai_priority.set(priority)
+    return await coro
+
+
+ai_scheduler = AIScheduler(
+    model_concurrency=settings.AI_MODEL_CONCURRENCY,
+    default_concurrency=settings.AI_DEFAULT_MODEL_CONCURRENCY,
+)
@@ -0,0 +1,92 @@
+"""
+Tracing of AI calls. Each call, raw genai or pydantic-ai agent, gets a span with the same
+attributes: model, call type, mode, prompt version, token usage, retries and queue wait.
+Prompts are not recorded: they contain messages of users.
+Spans are nested in the span of the Telegram update which triggered the call.
+"""
+
+import hashlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cache
+
+import logfire
+from google import genai
+from pydantic_ai.usage import RunUsage
+
+from deutsch_tg_bot.deutsh_enums import AICallType, AIMode
+from deutsch_tg_bot.tg_timing import get_current_update_id
+
+# Attempt of the current call, set when a result is rejected and generated again
+_current_ai_call_retries: ContextVar[int] = ContextVar("current_ai_call_retries", default=0)
+
+
+@contextmanager
+def ai_call_retries(retries: int) -> Iterator[None]:
+    """Mark AI calls of the block as retries of a rejected result."""
+    token = _current_ai_call_retries.set(retries)
+    try:
+        yield
+    finally:
+        _current_ai_call_retries.reset(token)
+
+
+@cache
+def get_prompt_version(prompt_template: str) -> str:
+    return hashlib.sha256(prompt_template.encode()).hexdigest()[:12]
+
+
+class AICallTrace:
+    def __init__(self, span: logfire.LogfireSpan) -> None:
+        self._span = span
+
+    def set_scheduling(self, priority: str, chat_id: int | None) -> None:
+        self._span.set_attributes({"priority": priority, "chat_id": chat_id})
+
+    def record_queue_wait(self, seconds: float) -> None:
+        self._span.set_attribute("queue_wait_seconds", seconds)
+
+    def record_genai_usage(
+        self, usage: genai.types.GenerateContentResponseUsageMetadata | None
+    ) -> None:
+        if usage is None:
+            return
+        self._span.set_attributes(
+            {
+                "input_tokens": usage.prompt_token_count or 0,
+                "cached_tokens": usage.cached_content_token_count or 0,
+                "output_tokens": usage.candidates_token_count or 0,
+                "thinking_tokens": usage.thoughts_token_count or 0,
+            }
+        )
+
+    def record_agent_usage(self, usage: RunUsage) -> None:
+        """Agents send the request again when the output fails validation."""
+        self._span.set_attributes(
+            {
+                "input_tokens": usage.input_tokens,
+                "cached_tokens": usage.cache_read_tokens,
+                "output_tokens": usage.output_tokens,
+                "retries": _current_ai_call_retries.get() + max(usage.requests - 1, 0),
+            }
+        )
+
+
+@contextmanager
+def ai_call_span(
+    call_type: AICallType,
+    model: str,
+    mode: AIMode | None = None,
+    prompt_version: str | None = None,
+) -> Iterator[AICallTrace]:
+    with logfire.span(
+        "AI call {call_type} {model}",
+        call_type=call_type.value,
+        model=model,
+        mode=None if mode is None else mode.value,
+        prompt_version=prompt_version,
+        retries=_current_ai_call_retries.get(),
+        update_id=get_current_update_id(),
+    ) as span:
+        yield AICallTrace(span)
@@ -0,0 +1 @@
+"""Microbenchmarks of local hot paths, compared against a stored baseline."""
@@ -0,0 +1,166 @@
+"""
+Deterministic fixtures sized like long real sessions: full sentence and message histories,
+scenes with many NPCs which know many facts, and AI responses with long explanations.
+"""
+
+import json
+import random
+
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.data_types import Sentence
+from deutsch_tg_bot.deutsh_enums import DEUTCH_LEVEL_TENSES, DeutschLevel, SentenceType
+from deutsch_tg_bot.situation_training.ai.data_types import GameState, NPCState, PlayerState
+from deutsch_tg_bot.user_session import HistoryMessage, SituationTrainingState
+
+_GERMAN_WORDS = (
+    "ich du er sie wir ihr der die das ein eine nicht heute morgen gestern oft immer "
+    "Haus Schule Arbeit Freund Familie Stadt Zug Buch Kaffee Wetter Wochenende Geschenk "
+    "gehen kaufen lesen schreiben kochen fahren besuchen helfen warten spielen lernen "
+    "schnell langsam gern zusammen wieder noch schon leider endlich"
+).split()
+_UKRAINIAN_WORDS = (
+    "я ти він вона ми ви не сьогодні завтра вчора часто завжди дім школа робота друг "
+    "родина місто потяг книжка кава погода вихідні подарунок йти купувати читати писати "
+    "готувати їхати відвідувати допомагати чекати грати вчити швидко повільно разом знову"
+).split()
+_MOODS = ("neutral", "happy", "curious", "annoyed", "tired", "excited")
+_VOCABULARY_SIZE = 5000
+_SYLLABLES = "ba be bi bo bu ka ke ko ma me mi mo na ne no ra re ri ro ta te to la le lo".split()
+
+
+def make_message_words(rng: random.Random, number: int) -> str:
+    """Message text with a Zipf-like word distribution: few frequent words, many rare ones."""
+    words = []
+    for _ in range(number):
+        rank = int(_VOCABULARY_SIZE ** rng.random())
+        if rank <= len(_GERMAN_WORDS):
+            words.append(_GERMAN_WORDS[rank - 1])
+        else:
+            words.append("".join(_SYLLABLES[int(digit)] for digit in str(rank)))
+    return " ".join(words)
+
+
+def make_words(rng: random.Random, words: tuple[str, ...] | list[str], number: int) -> str:
+    return " ".join(rng.choice(words) for _ in range(number))
+
+
+def make_sentences(number: int = settings.SENTENCES_HISTORY_LIMIT, seed: int = 0) -> list[Sentence]:
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(number):
+        level = rng.choice(list(DeutschLevel))
+        sentences.append(
+            Sentence(
+                sentence_type=rng.choice(list(SentenceType)),
+                ukrainian_sentence=make_words(rng, _UKRAINIAN_WORDS, rng.randint(6, 14)) + ".",
+                german_sentence=make_words(rng, _GERMAN_WORDS, rng.randint(6, 14)) + ".",
+                level=level,
+                tense=rng.choice(DEUTCH_LEVEL_TENSES[level]),
+                is_translation_correct=rng.random() < 0.7,
+                theme="daily routine",
+            )
+        )
+    return sentences
+
+
+def make_situation_training_state(
+    npcs_number: int = 8,
+    facts_number: int = 12,
+    messages_number: int = settings.MEMORY_MESSAGES_LIMIT,
+    seed: int = 0,
+) -> SituationTrainingState:
+    rng = random.Random(seed)
+    npc_ids = [f"npc_{i}" for i in range(npcs_number)]
+    game_state = GameState(
+        session_id="benchmark",
+        game_language_code="de",
+        situation_name="Am Bahnhof",
+        situation_description=make_words(rng, _GERMAN_WORDS, 60),
+        time_of_day="Abend",
+        location_name="Hauptbahnhof",
+        location_description=make_words(rng, _GERMAN_WORDS, 30),
+        world_facts=[make_words(rng, _GERMAN_WORDS, 8) for _ in range(facts_number)],
+        active_npcs=npc_ids,
+    )
+    npc_states = [
+        NPCState(
+            npc_id=npc_id,
+            name=f"Person {npc_id}",
+            personality=make_words(rng, _GERMAN_WORDS, 20),
+            mood=rng.choice(_MOODS),
+            knows_about_player=[make_message_words(rng, 5) for _ in range(facts_number)],
+            goals=[make_message_words(rng, 6) for _ in range(3)],
+        )
+        for npc_id in npc_ids
+    ]
+    player_state = PlayerState(
+        name="Alex",
+        description=make_words(rng, _GERMAN_WORDS, 20),
+        inventory=[make_words(rng, _GERMAN_WORDS, 2) for _ in range(6)],
+    )
+    situation_training_state = SituationTrainingState(
+        game_state=game_state, npc_states=npc_states, player_state=player_state
+    )
+    senders = ["player", "narrator", *npc_ids]
+    for _ in range(messages_number):
+        situation_training_state.add_message(
+            rng.choice(senders), make_message_words(rng, rng.randint(8, 40))
+        )
+    return situation_training_state
+
+
+def make_history_messages(number: int, seed: int = 0) -> list[HistoryMessage]:
+    rng = random.Random(seed)
+    senders = ["player", "narrator", "npc_0", "npc_1"]
+    return [
+        HistoryMessage(rng.choice(senders), make_message_words(rng, rng.randint(8, 40)))
+        for _ in range(number)
+    ]
+
+
+def make_completion_with_tag(tag: str, length: int = 20_000, seed: int = 0) -> str:
+    """Long completion with the tag at the end, like a reply after the reasoning."""
+    rng = random.Random(seed)
+    reasoning = make_words(rng, _GERMAN_WORDS, length // 6)
+    return f"<planning>{reasoning}</planning>\n<{tag}>{make_words(rng, _GERMAN_WORDS, 20)}</{tag}>"
+
+
+def make_response_payloads(seed: int = 0) -> dict[str, str]:
+    """JSON responses of AI calls, by the name of the response model."""
+    rng = random.Random(seed)
+
+    def evaluation() -> dict[str, object]:
+        return {
+            "planning": make_words(rng, _UKRAINIAN_WORDS, 150),
+            "is_translation_correct": rng.random() < 0.5,
+            "correct_translation": make_words(rng, _GERMAN_WORDS, 12),
+            "explanation": make_words(rng, _UKRAINIAN_WORDS, 60),
+        }
+
+    payloads: dict[str, object] = {
+        "GenerateSentenceResponse": {
+            "planning": make_words(rng, _UKRAINIAN_WORDS, 200),
+            "ukrainian_sentence": make_words(rng, _UKRAINIAN_WORDS, 12),
+            "german_reference": make_words(rng, _GERMAN_WORDS, 12),
+            "grammar_explanation": make_words(rng, _UKRAINIAN_WORDS, 40),
+        },
+        "TranslationEvaluationResult": evaluation(),
+        "BatchTranslationEvaluationResult": {"results": [evaluation() for _ in range(10)]},
+        "NarratorResponse": {"narrator_action": make_words(rng, _GERMAN_WORDS, 80)},
+        "NarratorEventValidation": {
+            "is_consistent": False,
+            "refreshed_narrator_action": make_words(rng, _GERMAN_WORDS, 80),
+        },
+        "NPCResponse": {
+            "npc_id": "npc_0",
+            "action_or_speech": make_words(rng, _GERMAN_WORDS, 60),
+            "mood_update": "happy",
+            "learns_about_player": [make_words(rng, _GERMAN_WORDS, 4) for _ in range(3)],
+        },
+        "GrammarCheckResult": {
+            "has_errors": True,
+            "brief_feedback": make_words(rng, _UKRAINIAN_WORDS, 30),
+            "corrected_text": make_words(rng, _GERMAN_WORDS, 20),
+        },
+    }
+    return {name: json.dumps(payload, ensure_ascii=False) for name, payload in payloads.items()}
@@ -0,0 +1,435 @@
+"""
+Microbenchmarks of pure-Python hot paths: sentence spec selection, prompt parameters
+and templates, instruction builders of situation agents and validation of AI responses.
+
+Results depend on the machine, so each run also times a reference loop, and baseline
+times are scaled by how much faster or slower the reference is than in the baseline.
+Each time is the median of many short rounds. The baseline is measured in several passes
+and keeps the spread of each benchmark between passes, which is added to the allowed
+regression: a benchmark which is noisy on the machine needs a larger slowdown to fail.
+"""
+
+import json
+import os
+import platform
+import statistics
+import timeit
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from itertools import cycle
+
+from pydantic import BaseModel
+from pydantic_ai import RunContext
+from pydantic_ai.models.test import TestModel
+from pydantic_ai.usage import RunUsage
+from rich import get_console
+from rich import print as rprint
+from rich.table import Table
+
+from deutsch_tg_bot.benchmarks.fixtures import (
+    make_completion_with_tag,
+    make_history_messages,
+    make_response_payloads,
+    make_sentences,
+    make_situation_training_state,
+)
+from deutsch_tg_bot.data_types import SentenceSpec
+from deutsch_tg_bot.deutsh_enums import DeutschLevel, DeutschTense, SentenceType
+from deutsch_tg_bot.situation_training.ai import narrator_agent, npc_agent
+from deutsch_tg_bot.situation_training.ai.data_types import (
+    GrammarCheckResult,
+    NarratorEventValidation,
+    NarratorResponse,
+    NPCResponse,
+)
+from deutsch_tg_bot.situation_training.ai.scene_context import render_scene_context
+from deutsch_tg_bot.situation_training.ai.situation_generator import GameStateGenerationResponse
+from deutsch_tg_bot.translation_training.ai import sentence_generator
+from deutsch_tg_bot.translation_training.ai.translation_evaluation import (
+    BatchTranslationEvaluationResult,
+    TranslationEvaluationResult,
+)
+from deutsch_tg_bot.user_session import SituationTrainingState
+from deutsch_tg_bot.utils.prompt_utils import (
+    extract_tag_content,
+    load_prompt_template_from_file,
+    replace_promt_placeholder,
+)
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+REFERENCE_BENCHMARK = "reference_loop"
+ROUND_SECONDS = 0.02
+# Allowed regression grows by this multiple of the spread measured with the baseline
+NOISE_TOLERANCE_FACTOR = 2.0
+
+RESPONSE_MODELS: list[type[BaseModel]] = [
+    sentence_generator.GenerateSentenceResponse,
+    TranslationEvaluationResult,
+    BatchTranslationEvaluationResult,
+    NarratorResponse,
+    NarratorEventValidation,
+    NPCResponse,
+    GrammarCheckResult,
+    GameStateGenerationResponse,
+]
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    # Builds the fixtures and returns the measured call
+    setup: Callable[[], Callable[[], object]]
+
+
+class BenchmarkBaseline(BaseModel):
+    python_version: str
+    machine: str
+    seconds_per_call: dict[str, float]
+    # Relative spread of scaled times between baseline passes, (max - min) / median
+    noise: dict[str, float] = {}
+
+    def get_allowed_slowdown(self, name: str, max_regression: float) -> float:
+        return 1 + max_regression + NOISE_TOLERANCE_FACTOR * self.noise.get(name, 0.0)
+
+
+def get_benchmarks() -> list[Benchmark]:
+    benchmarks = [
+        Benchmark(REFERENCE_BENCHMARK, _setup_reference_loop),
+        Benchmark("spec_selector_select", _setup_spec_selector_select),
+        Benchmark("sentence_generator_params", _setup_sentence_generator_params),
+        Benchmark(
+            "sentence_themes_parse", lambda: sentence_generator.get_sentence_themes.__wrapped__
+        ),
+        Benchmark("replace_promt_placeholder", _setup_replace_promt_placeholder),
+        Benchmark("extract_tag_content", _setup_extract_tag_content),
+        Benchmark("scene_context_render", _setup_scene_context_render),
+        Benchmark("narrator_instructions", _setup_narrator_instructions),
+        Benchmark("npc_instructions", _setup_npc_instructions),
+        Benchmark("message_memory_add", _setup_message_memory_add),
+    ]
+    payloads = make_response_payloads()
+    payloads[GameStateGenerationResponse.__name__] = _get_game_state_generation_payload()
+    for response_model in RESPONSE_MODELS:
+        benchmarks.append(
+            Benchmark(
+                f"validate_{response_model.__name__}",
+                _make_validation_setup(response_model, payloads[response_model.__name__]),
+            )
+        )
+    return benchmarks
+
+
+def run_benchmarks(
+    names: list[str] | None = None,
+    update_baseline: bool = False,
+    max_regression: float = 0.25,
+    baseline_path: str = DEFAULT_BASELINE_PATH,
+    rounds: int = 25,
+    baseline_passes: int = 3,
+) -> None:
+    """
+    Time local hot paths and compare them with the baseline.
+    Exits with code 1 if any benchmark is slower than the baseline by more than
+    `max_regression` plus its noise measured with the baseline.
+
+    Args:
+        names: Names of benchmarks to run. All benchmarks if not set.
+        update_baseline: Save the results as the new baseline instead of comparing.
+        max_regression: Allowed slowdown relative to the baseline, 0.25 is 25%.
+        baseline_path: JSON file with baseline results.
+        rounds: Number of timing rounds of each benchmark, the median one is taken.
+        baseline_passes: Number of passes over all benchmarks to measure the baseline.
+    """
+    benchmarks = get_benchmarks()
+    if names:
+        benchmarks = [
+            benchmark
+            for benchmark in benchmarks
+            if benchmark.name in names or benchmark.name == REFERENCE_BENCHMARK
+        ]
+
+    if update_baseline:
+        seconds_per_call, noise = measure_passes(benchmarks, rounds, baseline_passes)
+        if names and os.path.exists(baseline_path):
+            # Other times of the baseline are kept, so new ones are scaled to its speed
+            previous_baseline = load_baseline(baseline_path)
+            speed_factor = get_speed_factor(seconds_per_call, previous_baseline)
+            seconds_per_call = previous_baseline.seconds_per_call | {
+                name: seconds / speed_factor
+                for name, seconds in seconds_per_call.items()
+                if name != REFERENCE_BENCHMARK
+            }
+            noise = previous_baseline.noise | noise
+        save_baseline(baseline_path, seconds_per_call, noise)
+        rprint(render_results_table(seconds_per_call, baseline=None, max_regression=max_regression))
+        rprint(f"Baseline saved to {baseline_path}")
+        return
+
+    seconds_per_call = measure_pass(benchmarks, rounds)
+    baseline = load_baseline(baseline_path) if os.path.exists(baseline_path) else None
+    rprint(render_results_table(seconds_per_call, baseline, max_regression))
+    if baseline is None:
+        rprint(f"No baseline at {baseline_path}, run with --update-baseline to save one")
+        return
+
+    regressions = get_regressions(seconds_per_call, baseline, max_regression)
+    if regressions:
+        rprint(f"[red]Regressed beyond the allowed slowdown: {', '.join(regressions)}[/red]")
+        raise SystemExit(1)
+
+
+def measure_pass(benchmarks: list[Benchmark], rounds: int) -> dict[str, float]:
+    """
+    Rounds of each benchmark alternate with rounds of the reference loop, and the time is
+    the median ratio to the reference, times the reference time. So slowdowns of the machine
+    for a few seconds, which are common on shared machines, affect both sides of a ratio.
+    """
+    reference_benchmark = next(
+        benchmark for benchmark in benchmarks if benchmark.name == REFERENCE_BENCHMARK
+    )
+    reference_timer = _make_round_timer(reference_benchmark.setup())
+    reference_seconds = statistics.median(reference_timer() for _ in range(rounds))
+    seconds_per_call = {REFERENCE_BENCHMARK: reference_seconds}
+    with get_console().status("Running benchmarks") as status:
+        for benchmark in benchmarks:
+            if benchmark.name == REFERENCE_BENCHMARK:
+                continue
+            status.update(f"Running {benchmark.name}")
+            benchmark_timer = _make_round_timer(benchmark.setup())
+            ratios = [benchmark_timer() / reference_timer() for _ in range(rounds)]
+            seconds_per_call[benchmark.name] = statistics.median(ratios) * reference_seconds
+    return seconds_per_call
+
+
+def measure_passes(
+    benchmarks: list[Benchmark], rounds: int, passes: int
+) -> tuple[dict[str, float], dict[str, float]]:
+    """
+    Median times of several passes, scaled to the speed of the first pass,
+    and the relative spread of each benchmark between passes.
+    """
+    pass_results = [measure_pass(benchmarks, rounds) for _ in range(passes)]
+    reference_seconds = pass_results[0][REFERENCE_BENCHMARK]
+    seconds_per_call: dict[str, float] = {}
+    noise: dict[str, float] = {}
+    for benchmark in benchmarks:
+        scaled_seconds = [
+            result[benchmark.name] * reference_seconds / result[REFERENCE_BENCHMARK]
+            for result in pass_results
+        ]
+        median_seconds = statistics.median(scaled_seconds)
+        seconds_per_call[benchmark.name] = median_seconds
+        noise[benchmark.name] = (max(scaled_seconds) - min(scaled_seconds)) / median_seconds
+    return seconds_per_call, noise
+
+
+def _make_round_timer(func: Callable[[], object]) -> Callable[[], float]:
+    """Function which times one round of about `ROUND_SECONDS` and returns seconds per call."""
+    timer = timeit.Timer(func)
+    number, seconds = timer.autorange()
+    number = max(1, round(number * ROUND_SECONDS / seconds))
+    return lambda: timer.timeit(number) / number
+
+
+def get_speed_factor(seconds_per_call: dict[str, float], baseline: BenchmarkBaseline) -> float:
+    """How much slower this run is than the baseline run on the reference loop."""
+    reference_seconds = seconds_per_call.get(REFERENCE_BENCHMARK)
+    baseline_reference_seconds = baseline.seconds_per_call.get(REFERENCE_BENCHMARK)
+    if reference_seconds is None or baseline_reference_seconds is None:
+        return 1.0
+    return reference_seconds / baseline_reference_seconds
+
+
+def get_slowdowns(
+    seconds_per_call: dict[str, float], baseline: BenchmarkBaseline
+) -> dict[str, float]:
+    """Ratio of each time to the baseline time, scaled to the speed of this run."""
+    speed_factor = get_speed_factor(seconds_per_call, baseline)
+    return {
+        name: seconds / (baseline.seconds_per_call[name] * speed_factor)
+        for name, seconds in seconds_per_call.items()
+        if name != REFERENCE_BENCHMARK and name in baseline.seconds_per_call
+    }
+
+
+def get_regressions(
+    seconds_per_call: dict[str, float], baseline: BenchmarkBaseline, max_regression: float
+) -> list[str]:
+    slowdowns = get_slowdowns(seconds_per_call, baseline)
+    return [
+        name
+        for name, slowdown in slowdowns.items()
+        if slowdown > baseline.get_allowed_slowdown(name, max_regression)
+    ]
+
+
+def render_results_table(
+    seconds_per_call: dict[str, float], baseline: BenchmarkBaseline | None, max_regression: float
+) -> Table:
+    table = Table(title="Benchmarks")
+    for column in ("Benchmark", "Time", "Baseline", "Change", "Allowed"):
+        table.add_column(column, justify="left" if column == "Benchmark" else "right")
+
+    slowdowns = get_slowdowns(seconds_per_call, baseline) if baseline is not None else {}
+    for name, seconds in seconds_per_call.items():
+        baseline_seconds = baseline.seconds_per_call.get(name) if baseline is not None else None
+        slowdown = slowdowns.get(name)
+        change = allowed = ""
+        if slowdown is not None and baseline is not None:
+            allowed_slowdown = baseline.get_allowed_slowdown(name, max_regression)
+            color = "red" if slowdown > allowed_slowdown else "green" if slowdown < 1 else ""
+            change = f"{slowdown - 1:+.0%}"
+            if color:
+                change = f"[{color}]{change}[/{color}]"
+            allowed = f"{allowed_slowdown - 1:+.0%}"
+        table.add_row(
+            name,
+            _format_seconds(seconds),
+            _format_seconds(baseline_seconds) if baseline_seconds is not None else "-",
+            change,
+            allowed,
+        )
+    return table
+
+
+def load_baseline(path: str) -> BenchmarkBaseline:
+    with open(path, "r", encoding="utf-8") as f:
+        return BenchmarkBaseline.model_validate_json(f.read())
+
+
+def save_baseline(path: str, seconds_per_call: dict[str, float], noise: dict[str, float]) -> None:
+    baseline = BenchmarkBaseline(
+        python_version=platform.python_version(),
+        machine=platform.machine(),
+        seconds_per_call=seconds_per_call,
+        noise=noise,
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(baseline.model_dump_json(indent=2) + "\n")
+
+
+def _setup_reference_loop() -> Callable[[], object]:
+    # Plain interpreter work, to compare the speed of machines
+    return lambda: sum(i * i for i in range(1000))
+
+
+def _setup_spec_selector_select() -> Callable[[], object]:
+    selector = sentence_generator.create_sentence_spec_selector(list(DeutschLevel), seed=0)
+    return selector.select
+
+
+def _setup_sentence_generator_params() -> Callable[[], object]:
+    sentences_history = make_sentences()
+    theme = sentence_generator.get_sentence_theme_keys()[0]
+    sentence_spec = SentenceSpec(
+        DeutschLevel.B1, DeutschTense.PERFEKT, SentenceType.AFFIRMATIVE, theme
+    )
+    return lambda: sentence_generator.get_sentence_generator_params(
+        sentence_spec, sentences_history
+    )
+
+
+def _setup_replace_promt_placeholder() -> Callable[[], object]:
+    prompt = load_prompt_template_from_file(sentence_generator.PROMPTS_DIR, "generate_sentence.txt")
+    return lambda: replace_promt_placeholder(prompt)
+
+
+def _setup_extract_tag_content() -> Callable[[], object]:
+    completion = make_completion_with_tag("translation")
+    return lambda: extract_tag_content(completion, "translation")
+
+
+def _setup_scene_context_render() -> Callable[[], object]:
+    situation_training_state = make_situation_training_state()
+    return lambda: render_scene_context(situation_training_state)
+
+
+def _setup_narrator_instructions() -> Callable[[], object]:
+    """Instructions of a narrator turn, after an NPC reaction changed its state."""
+    situation_training_state = make_situation_training_state()
+    ctx = _make_run_context(situation_training_state)
+    npc_responses = _make_mood_changes(situation_training_state)
+    instruction_builders = [
+        narrator_agent.add_scene_context,
+        narrator_agent.add_scene_state,
+        narrator_agent.add_message_history,
+    ]
+
+    def build_instructions() -> list[str | None]:
+        situation_training_state.npc_registry.apply_npc_response(next(npc_responses))
+        return [build(ctx) for build in instruction_builders]
+
+    return build_instructions
+
+
+def _setup_npc_instructions() -> Callable[[], object]:
+    """Instructions of all NPC reactions of a turn, each reaction changes the NPC state."""
+    situation_training_state = make_situation_training_state()
+    npc_responses = _make_mood_changes(situation_training_state)
+    contexts = [
+        _make_run_context(
+            npc_agent.NPCContext(
+                situation_training_state=situation_training_state,
+                current_npc_state=situation_training_state.npc_registry[npc_id],
+            )
+        )
+        for npc_id in situation_training_state.game_state.active_npcs
+    ]
+    instruction_builders = [
+        npc_agent.add_scene_context,
+        npc_agent.add_scene_state,
+        npc_agent.add_current_npc_state,
+        npc_agent.add_message_history,
+    ]
+
+    def build_instructions() -> list[str | None]:
+        instructions: list[str | None] = []
+        for ctx in contexts:
+            instructions.extend(build(ctx) for build in instruction_builders)
+            situation_training_state.npc_registry.apply_npc_response(next(npc_responses))
+        return instructions
+
+    return build_instructions
+
+
+def _setup_message_memory_add() -> Callable[[], object]:
+    """Incremental update of a full index, with eviction of the oldest message."""
+    situation_training_state = make_situation_training_state()
+    messages = cycle(make_history_messages(100, seed=1))
+    return lambda: situation_training_state.message_memory.add(next(messages))
+
+
+def _make_validation_setup(
+    response_model: type[BaseModel], payload: str
+) -> Callable[[], Callable[[], object]]:
+    return lambda: lambda: response_model.model_validate_json(payload)
+
+
+def _make_run_context[T](deps: T) -> RunContext[T]:
+    return RunContext(deps=deps, model=TestModel(), usage=RunUsage())
+
+
+def _make_mood_changes(situation_training_state: SituationTrainingState) -> Iterator[NPCResponse]:
+    return cycle(
+        NPCResponse(npc_id=npc_id, action_or_speech="", mood_update=mood)
+        for npc_id in situation_training_state.game_state.active_npcs
+        for mood in ("happy", "annoyed")
+    )
+
+
+def _get_game_state_generation_payload() -> str:
+    situation_training_state = make_situation_training_state()
+    return json.dumps(
+        {
+            "game_state": situation_training_state.game_state.model_dump(),
+            "npc_states": [npc.model_dump() for npc in situation_training_state.npc_states],
+            "player_state": situation_training_state.player_state.model_dump(),
+        },
+        ensure_ascii=False,
+    )
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds * 1e6:.2f}µs"
@@ -1,3 +1,5 @@
+import asyncio
+
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
@@ -13,7 +15,19 @@ from icecream import ic
 
 from deutsch_tg_bot.config import settings
 from deutsch_tg_bot.deutsh_enums import DeutschLevel
+from deutsch_tg_bot.event_loop_watchdog import EventLoopWatchdog
+from deutsch_tg_bot.load_shedding import LoadSheddingMiddleware, load_shedder
 from deutsch_tg_bot.situation_training.tg_router import router as situation_training_router
+from deutsch_tg_bot.tg_chat_queue import ChatQueueMiddleware
+from deutsch_tg_bot.tg_session_storage import EvictingMemoryStorage
+from deutsch_tg_bot.tg_session_tasks import SessionTaskMiddleware, session_tasks
+from deutsch_tg_bot.tg_timing import (
+    TimedRequestMiddleware,
+    TimedStorage,
+    UpdateTimingMiddleware,
+    UpdateTimingStats,
+    run_timing_report_loop,
+)
 from deutsch_tg_bot.translation_training.tg_router import router as translation_training_router
 
 training_router = Router()
@@ -88,6 +102,60 @@ async def start_bot() -> None:
             parse_mode=ParseMode.HTML,
         ),
     )
-    dispatcher = Dispatcher()
+    tg_bot.session.middleware(TimedRequestMiddleware())
+    session_storage = EvictingMemoryStorage(
+        ttl_seconds=settings.SESSION_TTL_SECONDS,
+        max_sessions=settings.SESSION_MAX_NUMBER,
+        spill_dir=settings.SESSION_SPILL_DIR,
+    )
+    dispatcher = Dispatcher(storage=TimedStorage(session_storage))
+    # Refused new sessions must not cancel the current one. Session tasks go next:
+    # new session cancels previous work before waiting in chat queue
+    load_shedding_middleware = LoadSheddingMiddleware(load_shedder)
+    session_task_middleware = SessionTaskMiddleware(session_tasks)
+    chat_queue_middleware = ChatQueueMiddleware(debounce_seconds=settings.CHAT_DEBOUNCE_SECONDS)
+    for observer in (dispatcher.message, dispatcher.callback_query):
+        observer.outer_middleware(load_shedding_middleware)
+        observer.outer_middleware(session_task_middleware)
+        observer.outer_middleware(chat_queue_middleware)
+    # Outer middleware times the update, inner one names it by the selected handler
+    update_timing_stats = UpdateTimingStats(
+        samples_limit=settings.UPDATE_TIMING_SAMPLES_LIMIT,
+        trace_path=settings.UPDATE_TRACE_PATH,
+    )
+    update_timing_middleware = UpdateTimingMiddleware(update_timing_stats)
+    for observer in (training_router.message, training_router.callback_query):
+        observer.outer_middleware(update_timing_middleware)
+        observer.middleware(update_timing_middleware)
     dispatcher.include_router(training_router)
-    await dispatcher.start_polling(tg_bot)
+
+    idle_watchdog_task = asyncio.create_task(
+        session_tasks.run_idle_watchdog(
+            idle_seconds=settings.SESSION_IDLE_TIMEOUT_SECONDS,
+            check_interval=settings.SESSION_IDLE_CHECK_INTERVAL_SECONDS,
+            # Otherwise idle sessions are evicted only when new sessions are loaded
+            on_check=session_storage.evict_idle_sessions,
+        )
+    )
+    timing_report_task = asyncio.create_task(
+        run_timing_report_loop(
+            update_timing_stats, interval=settings.UPDATE_TIMING_REPORT_INTERVAL_SECONDS
+        )
+    )
+    load_shedding_task = asyncio.create_task(
+        load_shedder.run(check_interval=settings.LOAD_SHEDDING_CHECK_INTERVAL_SECONDS)
+    )
+    event_loop_watchdog = EventLoopWatchdog(
+        check_interval=settings.EVENT_LOOP_LAG_CHECK_INTERVAL_SECONDS,
+        threshold_seconds=settings.EVENT_LOOP_LAG_THRESHOLD_SECONDS,
+    )
+    event_loop_watchdog.start()
+    try:
+        await dispatcher.start_polling(tg_bot)
+    finally:
+        event_loop_watchdog.stop()
+        idle_watchdog_task.cancel()
+        timing_report_task.cancel()
+        load_shedding_task.cancel()
+        update_timing_stats.print_tables()
+        update_timing_stats.close()
@@ -1,8 +1,10 @@
 import logfire
 from dotenv import load_dotenv
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from deutsch_tg_bot.deutsh_enums import DeutschLevel
+from deutsch_tg_bot.deutsh_enums import AICallType, AIMode, DeutschLevel
+from deutsch_tg_bot.utils.jsonl_span_exporter import JsonlSpanExporter
 
 
 class Settings(BaseSettings):
@@ -17,6 +19,85 @@ class Settings(BaseSettings):
     TELEGRAM_BOT_TOKEN: str = ""
     GOOGLE_API_KEY: str = ""
     LOGFIRE_TOKEN: str | None = None
+    # Spans are also appended to this file as JSON lines, so tracing works without Logfire
+    LOCAL_TRACES_PATH: str | None = None
+
+    # Messages sent while the previous one is processed are joined after this delay
+    CHAT_DEBOUNCE_SECONDS: float = 1.0
+    # Pending AI work of a chat is cancelled after this time without updates
+    SESSION_IDLE_TIMEOUT_SECONDS: float = 30 * 60
+    SESSION_IDLE_CHECK_INTERVAL_SECONDS: float = 60
+    # In-memory sessions. Idle and least recently used sessions are spilled to disk,
+    # or dropped if SESSION_SPILL_DIR is None
+    SESSION_TTL_SECONDS: float = 6 * 60 * 60
+    SESSION_MAX_NUMBER: int = 10_000
+    SESSION_SPILL_DIR: str | None = "session_spill"
+    SENTENCES_HISTORY_LIMIT: int = 50
+    MESSAGES_HISTORY_LIMIT: int = 100
+
+    # Concurrent AI calls of each model. Waiting calls are served by priority,
+    # fairly between chats
+    AI_MODEL_CONCURRENCY: dict[str, int] = {
+        "gemini-2.5-flash": 8,
+        "gemini-2.5-flash-lite": 16,
+    }
+    AI_DEFAULT_MODEL_CONCURRENCY: int = 8
+
+    # Quality or fast mode of each AI call type, quality if not set. Fast mode
+    # responses have no planning field, thinking and output tokens are limited
+    AI_CALL_MODES: dict[AICallType, AIMode] = {}
+    AI_FAST_MODE_THINKING_BUDGETS: dict[AICallType, int] = {
+        AICallType.SENTENCE_GENERATION: 0,
+        AICallType.TRANSLATION_EVALUATION: 256,
+        AICallType.EXAM_EVALUATION: 512,
+        AICallType.QUESTION_ANSWERING: 0,
+        AICallType.GRAMMAR_CHECK: 0,
+        AICallType.NARRATOR: 0,
+        AICallType.NPC: 0,
+    }
+    # Thinking tokens are counted as output tokens too
+    AI_FAST_MODE_MAX_OUTPUT_TOKENS: dict[AICallType, int] = {
+        AICallType.SENTENCE_GENERATION: 512,
+        AICallType.TRANSLATION_EVALUATION: 1024,
+        AICallType.EXAM_EVALUATION: 4096,
+        AICallType.QUESTION_ANSWERING: 1024,
+        AICallType.GRAMMAR_CHECK: 256,
+        AICallType.NARRATOR: 512,
+        AICallType.NPC: 512,
+    }
+
+    # Per-handler time of updates by stage, printed as percentile tables. Traces of
+    # all updates are appended to UPDATE_TRACE_PATH as JSON lines, if it is set
+    UPDATE_TIMING_REPORT_INTERVAL_SECONDS: float = 15 * 60
+    UPDATE_TIMING_SAMPLES_LIMIT: int = 1000
+    UPDATE_TRACE_PATH: str | None = None
+
+    # Event loop lag is measured every interval. The stack of the code blocking the loop
+    # is logged when lag exceeds the threshold
+    EVENT_LOOP_LAG_CHECK_INTERVAL_SECONDS: float = 0.1
+    EVENT_LOOP_LAG_THRESHOLD_SECONDS: float = 0.25
+
+    # Load shedding. Degradation level goes up when p90 latency of interactive AI calls
+    # or AI queue depth exceed the SLO, and goes down when both are well below it for longer
+    LOAD_SHEDDING_ENABLED: bool = True
+    LOAD_SHEDDING_LATENCY_SLO_SECONDS: float = 10.0
+    LOAD_SHEDDING_MAX_QUEUE_DEPTH: int = 32
+    LOAD_SHEDDING_RECOVERY_RATIO: float = 0.6
+    LOAD_SHEDDING_LATENCY_WINDOW_SECONDS: float = 60.0
+    # Fewer interactive calls in the window say nothing about the latency under load
+    LOAD_SHEDDING_MIN_LATENCY_SAMPLES: int = 20
+    LOAD_SHEDDING_CHECK_INTERVAL_SECONDS: float = 5.0
+    LOAD_SHEDDING_ESCALATE_AFTER_CHECKS: int = 3
+    LOAD_SHEDDING_RECOVER_AFTER_CHECKS: int = 12
+    LOAD_SHEDDING_NPCS_PER_TURN: int = 1
+    # Sentence specs tried in the corpus before a sentence is generated
+    LOAD_SHEDDING_CORPUS_ATTEMPTS: int = 5
+
+    # Retrieval memory of situation agents: recent messages and relevant older ones
+    MEMORY_MESSAGES_LIMIT: int = 1000
+    MEMORY_RECENT_MESSAGES_NUMBER: int = 8
+    MEMORY_RELEVANT_MESSAGES_NUMBER: int = 8
+    MEMORY_TOKEN_BUDGET: int = 1500
 
     PREVIOUS_SENTENCES_NUMBER: int = 5
     SHOW_TOCKENS_USAGE: bool = False
@@ -28,13 +109,58 @@ class Settings(BaseSettings):
         DeutschLevel.B2,
     ]
 
+    # Seed of sentence parameters sampling, for reproducible sessions
+    SENTENCE_SELECTOR_SEED: int | None = None
+
+    # Near-duplicate detection of generated sentences
+    SENTENCE_DUPLICATE_THRESHOLD: float = 0.6
+    SENTENCE_DUPLICATE_MAX_RETRIES: int = 2
+    USE_GLOBAL_SENTENCE_INDEX: bool = False
+    GLOBAL_SENTENCE_INDEX_SIZE: int = 50_000
+
+    # SQLite corpus of generated sentences shared between users. Disabled if None
+    SENTENCE_CORPUS_PATH: str | None = "sentence_corpus.sqlite3"
+
+    # Spaced repetition of mistakes. Intervals are counted in served sentences
+    REVIEW_FIRST_INTERVAL: int = 3
+    REVIEW_SECOND_INTERVAL: int = 8
+    REVIEW_INTERLEAVE_EVERY: int = 2
+
+    # Number of sentences in /exam, evaluated together in one AI call
+    EXAM_SENTENCES_NUMBER: int = 5
+
+    # Number of generated situations cached in memory, besides presets
+    SITUATION_LIBRARY_SIZE: int = 200
+
+    # Grammar check of player's messages in roleplay. Players can toggle it with /grammar
+    GRAMMAR_CHECK_ENABLED: bool = True
+    GRAMMAR_CHECK_SAMPLING_RATES: dict[DeutschLevel, float] = {
+        DeutschLevel.A1: 1.0,
+        DeutschLevel.A2: 1.0,
+        DeutschLevel.B1: 0.7,
+        DeutschLevel.B2: 0.5,
+        DeutschLevel.C1: 0.3,
+        DeutschLevel.C2: 0.2,
+    }
+
+    # Narrator event of every narrator turn is generated in background after the previous turn
+    SPECULATIVE_NARRATOR_ENABLED: bool = True
+    # First sentence is generated without constraint while the user is asked for one,
+    # and it is discarded if the user enters a constraint
+    SPECULATIVE_FIRST_SENTENCE_ENABLED: bool = True
+
     DEV_SKIP_SENTENCE_CONSTRAINT: bool = False
 
 
 settings = Settings()
 load_dotenv()
 
+
 logfire.configure(
     token=settings.LOGFIRE_TOKEN,
+    send_to_logfire="if-token-present",
+    additional_span_processors=[BatchSpanProcessor(JsonlSpanExporter(settings.LOCAL_TRACES_PATH))]
+    if settings.LOCAL_TRACES_PATH
+    else None,
 )
 logfire.instrument_pydantic_ai()
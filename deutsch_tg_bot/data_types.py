@@ -1,9 +1,11 @@
+import sys
 from dataclasses import dataclass
+from typing import NamedTuple
 
 from deutsch_tg_bot.deutsh_enums import DeutschLevel, DeutschTense, SentenceType
 
 
-@dataclass
+@dataclass(slots=True)
 class Sentence:
     sentence_type: SentenceType
     ukrainian_sentence: str
@@ -11,3 +13,18 @@ class Sentence:
     level: DeutschLevel
     tense: DeutschTense
     is_translation_correct: bool | None = None
+    theme: str | None = None
+
+    def __post_init__(self) -> None:
+        # Themes come from a small fixed set, all sentences share the same strings
+        if self.theme is not None:
+            self.theme = sys.intern(self.theme)
+
+
+class SentenceSpec(NamedTuple):
+    """Parameters of a sentence to generate. Sampled by `SentenceSpecSelector`."""
+
+    level: DeutschLevel
+    tense: DeutschTense
+    sentence_type: SentenceType
+    theme: str | None = None
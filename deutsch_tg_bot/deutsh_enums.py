@@ -66,3 +66,20 @@ DEUTCH_LEVEL_TENSES = {
         DeutschTense.FUTUR2,
     ],
 }
+
+
+class AIMode(str, Enum):
+    QUALITY = "quality"
+    FAST = "fast"
+
+
+class AICallType(str, Enum):
+    SENTENCE_GENERATION = "sentence_generation"
+    TRANSLATION_EVALUATION = "translation_evaluation"
+    EXAM_EVALUATION = "exam_evaluation"
+    QUESTION_ANSWERING = "question_answering"
+    GRAMMAR_CHECK = "grammar_check"
+    NARRATOR = "narrator"
+    NARRATOR_EVENT_VALIDATION = "narrator_event_validation"
+    NPC = "npc"
+    SITUATION_GENERATION = "situation_generation"
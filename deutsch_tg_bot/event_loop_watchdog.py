@@ -0,0 +1,103 @@
+"""
+Watchdog of event loop lag. Any synchronous work on the loop, like printing of a large
+panel or a cold prompt file read, delays updates of all users, so stalls are reported
+with the stack of the code which blocks the loop.
+"""
+
+import asyncio
+import inspect
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from types import FrameType
+
+import logfire
+
+
+@dataclass
+class EventLoopLagStats:
+    stalls: int = 0
+    max_lag_seconds: float = 0.0
+
+
+class EventLoopWatchdog:
+    """
+    A heartbeat task on the loop measures how late its sleeps wake up and publishes the lag
+    as a histogram. A thread checks the heartbeat, and if it is older than `threshold_seconds`,
+    the loop is blocked right now, so the stack of the loop thread shows the blocking code.
+    """
+
+    def __init__(self, check_interval: float = 0.1, threshold_seconds: float = 0.25) -> None:
+        self._check_interval = check_interval
+        self._threshold_seconds = threshold_seconds
+        self._last_heartbeat = time.monotonic()
+        self._reported_heartbeat = 0.0
+        self._loop_thread_id = 0
+        self._heartbeat_task: asyncio.Task[None] | None = None
+        self._thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+        self._lag_histogram = logfire.metric_histogram(
+            "event_loop_lag", unit="s", description="Delay of event loop callbacks"
+        )
+        self.stats = EventLoopLagStats()
+
+    def start(self) -> None:
+        """Start watching the running loop. Must be called from the loop thread."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_heartbeat = time.monotonic()
+        self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run_watchdog, name="event-loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            self._last_heartbeat = time.monotonic()
+            await asyncio.sleep(self._check_interval)
+            lag = max(0.0, time.monotonic() - self._last_heartbeat - self._check_interval)
+            self._lag_histogram.record(lag)
+            if lag > self.stats.max_lag_seconds:
+                self.stats.max_lag_seconds = lag
+
+    def _run_watchdog(self) -> None:
+        while not self._stop_event.wait(self._check_interval):
+            last_heartbeat = self._last_heartbeat
+            lag = time.monotonic() - last_heartbeat
+            # Each stall is reported once, when it exceeds the threshold
+            if lag < self._threshold_seconds or last_heartbeat == self._reported_heartbeat:
+                continue
+            self._reported_heartbeat = last_heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self.stats.stalls += 1
+            logfire.warn(
+                "Event loop blocked for {lag_seconds:.2f}s in {coroutine}",
+                lag_seconds=lag,
+                coroutine=_get_innermost_coroutine_name(frame),
+                stack="".join(traceback.format_stack(frame)),
+                stalls=self.stats.stalls,
+            )
+
+
+def _get_innermost_coroutine_name(frame: FrameType) -> str:
+    """Name of the coroutine which runs the blocking code. The loop itself if there is none."""
+    current_frame: FrameType | None = frame
+    while current_frame is not None:
+        if current_frame.f_code.co_flags & inspect.CO_COROUTINE:
+            return current_frame.f_code.co_qualname
+        current_frame = current_frame.f_back
+    return "event loop callback"
@@ -0,0 +1 @@
+"""Offline evaluation of AI quality and latency on a golden set."""
@@ -0,0 +1,246 @@
+"""
+Offline backends of the golden set evaluation, used in place of `genai_client` of AI modules.
+
+`StubBackend` answers locally with modelled latency and token usage, to check the harness
+and compare prompt sizes. `RecordingBackend` calls Gemini once and saves the responses,
+`ReplayBackend` replays them, so variants are compared on real answers without new calls.
+"""
+
+import hashlib
+import json
+import time
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from google import genai
+
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.golden_eval.golden_set import GoldenSet
+from deutsch_tg_bot.utils.near_duplicates import normalize_text
+
+# Time to the first token and output tokens per second of each model, for the stub
+STUB_MODEL_SPEEDS: dict[str, tuple[float, float]] = {
+    "gemini-2.5-flash": (0.6, 180.0),
+    "gemini-2.5-flash-lite": (0.35, 350.0),
+}
+STUB_DYNAMIC_THINKING_TOKENS = 600
+STREAM_CHUNK_SIZE = 64
+
+
+@dataclass
+class BackendCall:
+    model: str
+    latency_seconds: float
+    input_tokens: int
+    output_tokens: int
+    thinking_tokens: int
+
+
+@dataclass
+class _Recording:
+    response_text: str
+    call: BackendCall
+
+
+class EvalBackend(ABC):
+    """
+    Async client interface used by AI modules: `models.generate_content` and
+    `models.generate_content_stream`. Calls are only simulated, so latency is the one
+    reported in `calls` and not the wall time.
+    """
+
+    def __init__(self) -> None:
+        self.calls: list[BackendCall] = []
+
+    @property
+    def models(self) -> "EvalBackend":
+        return self
+
+    async def generate_content(
+        self, *, model: str, contents: str, config: genai.types.GenerateContentConfig
+    ) -> genai.types.GenerateContentResponse:
+        recording = await self._generate(model, contents, config)
+        self.calls.append(recording.call)
+        return _build_response(recording.response_text, recording.call)
+
+    async def generate_content_stream(
+        self, *, model: str, contents: str, config: genai.types.GenerateContentConfig
+    ) -> AsyncIterator[genai.types.GenerateContentResponse]:
+        response = await self.generate_content(model=model, contents=contents, config=config)
+        return _iter_response_chunks(response)
+
+    @abstractmethod
+    async def _generate(
+        self, model: str, contents: str, config: genai.types.GenerateContentConfig
+    ) -> _Recording: ...
+
+
+class StubBackend(EvalBackend):
+    """
+    Verdicts are exact matches with the reference translation, generated sentences are canned.
+    Token usage is estimated from the text length, so only relative numbers are meaningful.
+    """
+
+    def __init__(self, golden_set: GoldenSet) -> None:
+        super().__init__()
+        self._golden_set = golden_set
+
+    async def _generate(
+        self, model: str, contents: str, config: genai.types.GenerateContentConfig
+    ) -> _Recording:
+        schema_properties: dict[str, Any] = (config.response_json_schema or {}).get(
+            "properties", {}
+        )
+        response: dict[str, Any] = {}
+        if "planning" in schema_properties:
+            response["planning"] = "Stub analysis of the task, step by step. " * 30
+        if "is_translation_correct" in schema_properties:
+            response |= self._evaluate_translation(contents)
+        else:
+            response |= {
+                "ukrainian_sentence": "Ми не їздили потягом до Берліна.",
+                "german_reference": "Wir sind nicht mit dem Zug nach Berlin gefahren.",
+                "grammar_explanation": "Stub sentence.",
+            }
+        response_text = json.dumps(response, ensure_ascii=False)
+
+        thinking_config = config.thinking_config
+        thinking_tokens = STUB_DYNAMIC_THINKING_TOKENS
+        if thinking_config is not None and thinking_config.thinking_budget is not None:
+            thinking_tokens = min(thinking_config.thinking_budget, STUB_DYNAMIC_THINKING_TOKENS)
+        output_tokens = _estimate_tokens(response_text)
+        first_token_seconds, tokens_per_second = STUB_MODEL_SPEEDS.get(model, (0.6, 180.0))
+        call = BackendCall(
+            model=model,
+            latency_seconds=first_token_seconds
+            + (output_tokens + thinking_tokens) / tokens_per_second,
+            input_tokens=_estimate_tokens(contents),
+            output_tokens=output_tokens,
+            thinking_tokens=thinking_tokens,
+        )
+        return _Recording(response_text=response_text, call=call)
+
+    def _evaluate_translation(self, contents: str) -> dict[str, Any]:
+        matching_cases = [
+            case
+            for case in self._golden_set.translation_cases
+            if case.ukrainian_sentence in contents and case.user_translation in contents
+        ]
+        if not matching_cases:
+            raise KeyError("Stub backend evaluates only translations of the golden set")
+        # The longest user translation, in case one translation contains another
+        case = max(matching_cases, key=lambda case: len(case.user_translation))
+        is_correct = normalize_text(case.user_translation) == normalize_text(case.german_sentence)
+        return {
+            "is_translation_correct": is_correct,
+            "correct_translation": case.german_sentence,
+            "explanation": "Stub explanation.",
+        }
+
+
+class ReplayBackend(EvalBackend):
+    def __init__(self, recordings_path: str) -> None:
+        super().__init__()
+        self._recordings: dict[str, _Recording] = {}
+        with open(recordings_path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self._recordings[record["key"]] = _Recording(
+                    response_text=record["response_text"], call=BackendCall(**record["call"])
+                )
+
+    async def _generate(
+        self, model: str, contents: str, config: genai.types.GenerateContentConfig
+    ) -> _Recording:
+        recording = self._recordings.get(get_request_key(model, contents, config))
+        if recording is None:
+            raise KeyError(
+                f"No recorded response of {model} for this request. "
+                "Record it with the record backend first."
+            )
+        return recording
+
+
+class RecordingBackend(EvalBackend):
+    """Calls Gemini and appends responses to the recordings file of `ReplayBackend`."""
+
+    def __init__(self, recordings_path: str) -> None:
+        super().__init__()
+        self._recordings_path = recordings_path
+        self._genai_client = genai.Client(api_key=settings.GOOGLE_API_KEY).aio
+
+    async def _generate(
+        self, model: str, contents: str, config: genai.types.GenerateContentConfig
+    ) -> _Recording:
+        start_time = time.perf_counter()
+        response = await self._genai_client.models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        usage = response.usage_metadata
+        call = BackendCall(
+            model=model,
+            latency_seconds=time.perf_counter() - start_time,
+            input_tokens=(usage and usage.prompt_token_count) or 0,
+            output_tokens=(usage and usage.candidates_token_count) or 0,
+            thinking_tokens=(usage and usage.thoughts_token_count) or 0,
+        )
+        recording = _Recording(response_text=response.text or "", call=call)
+
+        record = {
+            "key": get_request_key(model, contents, config),
+            "response_text": recording.response_text,
+            "call": asdict(call),
+        }
+        with open(self._recordings_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return recording
+
+
+def get_request_key(model: str, contents: str, config: genai.types.GenerateContentConfig) -> str:
+    request = [model, contents, config.model_dump(mode="json", exclude_none=True)]
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def _build_response(response_text: str, call: BackendCall) -> genai.types.GenerateContentResponse:
+    return genai.types.GenerateContentResponse(
+        candidates=[
+            genai.types.Candidate(
+                content=genai.types.Content(
+                    role="model", parts=[genai.types.Part(text=response_text)]
+                )
+            )
+        ],
+        usage_metadata=genai.types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=call.input_tokens,
+            candidates_token_count=call.output_tokens,
+            thoughts_token_count=call.thinking_tokens,
+            total_token_count=call.input_tokens + call.output_tokens + call.thinking_tokens,
+        ),
+    )
+
+
+async def _iter_response_chunks(
+    response: genai.types.GenerateContentResponse,
+) -> AsyncIterator[genai.types.GenerateContentResponse]:
+    """Split the response into chunks, usage is reported with the last one, like Gemini does."""
+    text = response.text or ""
+    chunk_starts = range(0, len(text), STREAM_CHUNK_SIZE)
+    for chunk_start in chunk_starts:
+        chunk_text = text[chunk_start : chunk_start + STREAM_CHUNK_SIZE]
+        is_last_chunk = chunk_start == chunk_starts[-1]
+        yield genai.types.GenerateContentResponse(
+            candidates=[
+                genai.types.Candidate(
+                    content=genai.types.Content(
+                        role="model", parts=[genai.types.Part(text=chunk_text)]
+                    )
+                )
+            ],
+            usage_metadata=response.usage_metadata if is_last_chunk else None,
+        )
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
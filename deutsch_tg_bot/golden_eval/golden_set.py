@@ -0,0 +1,55 @@
+"""Versioned golden set of translation evaluation and sentence generation cases."""
+
+import os
+
+from pydantic import BaseModel
+
+from deutsch_tg_bot.data_types import Sentence, SentenceSpec
+from deutsch_tg_bot.deutsh_enums import DeutschLevel, DeutschTense, SentenceType
+
+GOLDEN_SETS_DIR = os.path.join(os.path.dirname(__file__), "golden_sets")
+
+
+class TranslationCase(BaseModel):
+    case_id: str
+    level: DeutschLevel
+    tense: DeutschTense
+    sentence_type: SentenceType
+    ukrainian_sentence: str
+    german_sentence: str
+    user_translation: str
+    expected_correct: bool
+
+    def get_sentence(self) -> Sentence:
+        return Sentence(
+            sentence_type=self.sentence_type,
+            ukrainian_sentence=self.ukrainian_sentence,
+            german_sentence=self.german_sentence,
+            level=self.level,
+            tense=self.tense,
+        )
+
+
+class GenerationCase(BaseModel):
+    case_id: str
+    level: DeutschLevel
+    tense: DeutschTense
+    sentence_type: SentenceType
+    # A fixed theme or a constraint, so prompts are the same in every run
+    theme: str | None = None
+    optional_constraint: str | None = None
+
+    def get_sentence_spec(self) -> SentenceSpec:
+        return SentenceSpec(self.level, self.tense, self.sentence_type, self.theme)
+
+
+class GoldenSet(BaseModel):
+    version: str
+    translation_cases: list[TranslationCase]
+    generation_cases: list[GenerationCase]
+
+
+def load_golden_set(version: str, golden_sets_dir: str = GOLDEN_SETS_DIR) -> GoldenSet:
+    """Golden sets are never changed once used for a report, a new version is added instead."""
+    with open(os.path.join(golden_sets_dir, f"{version}.json"), encoding="utf-8") as f:
+        return GoldenSet.model_validate_json(f.read())
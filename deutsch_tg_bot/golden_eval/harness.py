@@ -0,0 +1,297 @@
+"""
+Quality and latency of AI variants on the golden set, to see the cost of cheaper models,
+shorter prompts and fast mode before switching to them.
+
+Variants are applied by replacing the client, model and prompts directory of AI modules
+for the duration of the run, so the same production code is evaluated.
+"""
+
+import json
+import re
+import time
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Literal
+
+from rich import get_console
+from rich import print as rprint
+from rich.table import Table
+
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.data_types import Sentence
+from deutsch_tg_bot.deutsh_enums import AICallType, AIMode, SentenceType
+from deutsch_tg_bot.golden_eval.backends import (
+    EvalBackend,
+    RecordingBackend,
+    ReplayBackend,
+    StubBackend,
+)
+from deutsch_tg_bot.golden_eval.golden_set import GenerationCase, GoldenSet, load_golden_set
+from deutsch_tg_bot.translation_training.ai import sentence_generator, translation_evaluation
+from deutsch_tg_bot.utils.stats import percentile
+
+DEFAULT_RECORDINGS_PATH = "golden_eval_recordings.jsonl"
+
+_NEGATION_RE = re.compile(r"\b(nicht|kein\w*|nie|niemals|nichts|niemand)\b", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class EvalVariant:
+    name: str
+    model: str = "gemini-2.5-flash"
+    mode: AIMode = AIMode.QUALITY
+    # Copy of the prompts directory with changed prompts. Default prompts if None
+    prompts_dir: str | None = None
+
+
+EVAL_VARIANTS: dict[str, EvalVariant] = {
+    variant.name: variant
+    for variant in [
+        EvalVariant("flash-quality"),
+        EvalVariant("flash-fast", mode=AIMode.FAST),
+        EvalVariant("lite-quality", model="gemini-2.5-flash-lite"),
+        EvalVariant("lite-fast", model="gemini-2.5-flash-lite", mode=AIMode.FAST),
+    ]
+}
+
+
+@dataclass
+class CaseResult:
+    case_id: str
+    latency_seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0  # Including thinking tokens
+    passed: bool = False
+    error: str | None = None
+
+
+@dataclass
+class VariantReport:
+    variant: EvalVariant
+    evaluation_results: list[CaseResult] = field(default_factory=list)
+    generation_results: list[CaseResult] = field(default_factory=list)
+    false_accepts: int = 0
+    false_rejects: int = 0
+
+
+async def run_golden_eval(
+    variants: list[str] | None = None,
+    backend: Literal["stub", "replay", "record"] = "stub",
+    golden_set_version: str = "v1",
+    recordings_path: str = DEFAULT_RECORDINGS_PATH,
+    prompts_dir: str | None = None,
+    report_path: str | None = None,
+) -> None:
+    """
+    Run the golden set through translation evaluation and sentence generation
+    with each variant and print the reports side by side.
+
+    Args:
+        variants: Names of variants from `EVAL_VARIANTS`. All variants if not set.
+        backend: "stub" answers locally, "record" calls Gemini and saves responses
+            to `recordings_path`, "replay" uses the saved responses.
+        golden_set_version: Version of the golden set in `golden_sets` directory.
+        recordings_path: JSONL file with recorded responses.
+        prompts_dir: Changed copy of the prompts directory, used by all variants.
+        report_path: JSON file to save the reports to.
+    """
+    golden_set = load_golden_set(golden_set_version)
+    reports: list[VariantReport] = []
+    for variant_name in variants or list(EVAL_VARIANTS):
+        variant = EVAL_VARIANTS[variant_name]
+        if prompts_dir is not None:
+            variant = EvalVariant(
+                name=f"{variant.name}+prompts",
+                model=variant.model,
+                mode=variant.mode,
+                prompts_dir=prompts_dir,
+            )
+        eval_backend: EvalBackend
+        if backend == "stub":
+            eval_backend = StubBackend(golden_set)
+        elif backend == "replay":
+            eval_backend = ReplayBackend(recordings_path)
+        else:
+            eval_backend = RecordingBackend(recordings_path)
+        reports.append(await evaluate_variant(variant, golden_set, eval_backend))
+
+    rprint(render_reports_table(golden_set, reports))
+    if report_path is not None:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump([asdict(report) for report in reports], f, ensure_ascii=False, indent=2)
+
+
+async def evaluate_variant(
+    variant: EvalVariant, golden_set: GoldenSet, backend: EvalBackend
+) -> VariantReport:
+    report = VariantReport(variant=variant)
+    with use_variant(variant, backend):
+        for translation_case in golden_set.translation_cases:
+            case_result = CaseResult(case_id=translation_case.case_id)
+            with _measure_case(case_result, backend):
+                evaluation = await translation_evaluation.evaluate_translation_with_ai(
+                    translation_case.get_sentence(), translation_case.user_translation
+                )
+                case_result.passed = (
+                    evaluation.is_translation_correct == translation_case.expected_correct
+                )
+                if not case_result.passed:
+                    if evaluation.is_translation_correct:
+                        report.false_accepts += 1
+                    else:
+                        report.false_rejects += 1
+            report.evaluation_results.append(case_result)
+
+        for generation_case in golden_set.generation_cases:
+            case_result = CaseResult(case_id=generation_case.case_id)
+            with _measure_case(case_result, backend):
+                prompt_params = sentence_generator.get_sentence_generator_params(
+                    generation_case.get_sentence_spec(),
+                    sentences_history=[],
+                    optional_constraint=generation_case.optional_constraint,
+                )
+                sentence = await sentence_generator.generate_sentence_with_ai(prompt_params)
+                case_result.passed = check_generated_sentence(sentence, generation_case)
+            report.generation_results.append(case_result)
+    return report
+
+
+@contextmanager
+def use_variant(variant: EvalVariant, backend: EvalBackend) -> Iterator[None]:
+    with ExitStack() as stack:
+        for module in (translation_evaluation, sentence_generator):
+            stack.enter_context(_patch_attribute(module, "genai_client", backend))
+            stack.enter_context(_patch_attribute(module, "GOOGLE_MODEL", variant.model))
+            if variant.prompts_dir is not None:
+                stack.enter_context(_patch_attribute(module, "PROMPTS_DIR", variant.prompts_dir))
+        ai_call_modes = settings.AI_CALL_MODES | {
+            AICallType.TRANSLATION_EVALUATION: variant.mode,
+            AICallType.SENTENCE_GENERATION: variant.mode,
+        }
+        stack.enter_context(_patch_attribute(settings, "AI_CALL_MODES", ai_call_modes))
+        # AI modules print a panel of each call
+        stack.enter_context(_patch_attribute(get_console(), "quiet", True))
+
+        _clear_prompt_caches()
+        stack.callback(_clear_prompt_caches)
+        yield
+
+
+def check_generated_sentence(sentence: Sentence, generation_case: GenerationCase) -> bool:
+    """Cheap check of the sentence type of the German reference."""
+    german_sentence = sentence.german_sentence.strip()
+    is_question = german_sentence.endswith("?")
+    has_negation = _NEGATION_RE.search(german_sentence) is not None
+    match generation_case.sentence_type:
+        case SentenceType.INTERROGATIVE:
+            return is_question
+        case SentenceType.NEGATIVE:
+            return has_negation
+        case SentenceType.AFFIRMATIVE:
+            return not is_question and not has_negation
+
+
+def render_reports_table(golden_set: GoldenSet, reports: list[VariantReport]) -> Table:
+    table = Table(title=f"Golden set {golden_set.version}")
+    table.add_column("Metric")
+    for report in reports:
+        table.add_column(report.variant.name, justify="right")
+
+    table.add_row(
+        "Verdict agreement", *[_format_share(report.evaluation_results) for report in reports]
+    )
+    table.add_row("False accepts", *[str(report.false_accepts) for report in reports])
+    table.add_row("False rejects", *[str(report.false_rejects) for report in reports])
+    _add_results_rows(table, "Evaluation", [report.evaluation_results for report in reports])
+    table.add_section()
+    table.add_row(
+        "Generation spec checks", *[_format_share(report.generation_results) for report in reports]
+    )
+    _add_results_rows(table, "Generation", [report.generation_results for report in reports])
+    return table
+
+
+def _add_results_rows(table: Table, title: str, results_of_reports: list[list[CaseResult]]) -> None:
+    table.add_row(
+        f"{title} errors",
+        *[
+            str(sum(result.error is not None for result in results))
+            for results in results_of_reports
+        ],
+    )
+    # Failed calls have no latency and usage
+    results_of_reports = [
+        [result for result in results if result.error is None] for results in results_of_reports
+    ]
+    for q in (50, 90, 99):
+        table.add_row(
+            f"{title} latency p{q}",
+            *[
+                f"{percentile([result.latency_seconds for result in results], q):.2f}s"
+                for results in results_of_reports
+            ],
+        )
+    table.add_row(
+        f"{title} input tokens/case",
+        *[
+            _format_mean([result.input_tokens for result in results])
+            for results in results_of_reports
+        ],
+    )
+    table.add_row(
+        f"{title} output tokens/case",
+        *[
+            _format_mean([result.output_tokens for result in results])
+            for results in results_of_reports
+        ],
+    )
+
+
+@contextmanager
+def _measure_case(case_result: CaseResult, backend: EvalBackend) -> Iterator[None]:
+    """Latency is the local processing time plus the latency reported by the backend."""
+    calls_number = len(backend.calls)
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        case_result.error = f"{type(e).__name__}: {e}"
+    case_result.latency_seconds = time.perf_counter() - start_time
+    for call in backend.calls[calls_number:]:
+        case_result.latency_seconds += call.latency_seconds
+        case_result.input_tokens += call.input_tokens
+        case_result.output_tokens += call.output_tokens + call.thinking_tokens
+
+
+@contextmanager
+def _patch_attribute(obj: object, name: str, value: object) -> Iterator[None]:
+    original_value = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, original_value)
+
+
+def _clear_prompt_caches() -> None:
+    translation_evaluation.get_translation_evaluation_prompt_template.cache_clear()
+    translation_evaluation.get_batch_translation_evaluation_prompt_template.cache_clear()
+    sentence_generator.get_sentence_generator_prompt.cache_clear()
+    sentence_generator.get_sentence_generator_prompt_version.cache_clear()
+    sentence_generator.get_sentence_themes_prompt.cache_clear()
+    sentence_generator.get_sentence_themes.cache_clear()
+    sentence_generator.get_sentence_theme_keys.cache_clear()
+
+
+def _format_share(results: list[CaseResult]) -> str:
+    if not results:
+        return "-"
+    passed = sum(result.passed for result in results)
+    return f"{passed}/{len(results)} ({passed / len(results):.0%})"
+
+
+def _format_mean(values: list[int]) -> str:
+    if not values:
+        return "-"
+    return f"{sum(values) / len(values):.0f}"
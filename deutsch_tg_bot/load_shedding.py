@@ -0,0 +1,180 @@
+"""
+Load shedding: under peak load cheaper paths are used step by step, so response
+times stay acceptable for everyone instead of degrading for all users at once.
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from enum import IntEnum
+from typing import Any
+
+import logfire
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from deutsch_tg_bot.ai_scheduler import ai_scheduler
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.tg_session_tasks import get_session_reset_reason
+from deutsch_tg_bot.utils.stats import percentile
+
+
+class LoadLevel(IntEnum):
+    """Each level keeps the degradations of the previous ones."""
+
+    NORMAL = 0
+    NO_PREFETCH = 1  # Sentence prefetch and speculative narrator are paused
+    LIGHT_MODELS = 2  # Lighter models in fast mode
+    CAPPED_NPCS = 3  # Limited number of NPC reactions per turn
+    LOCAL_SENTENCES = 4  # Sentences are taken from the corpus when possible
+    NO_NEW_SESSIONS = 5  # New sessions are refused, current ones continue
+
+
+LIGHTER_MODELS: dict[str, str] = {
+    "gemini-2.5-flash": "gemini-2.5-flash-lite",
+}
+
+NEW_SESSIONS_REFUSED_MESSAGE = (
+    "Зараз у мене дуже багато учнів 🙏 Будь ласка, спробуй почати нове тренування за кілька хвилин."
+)
+
+
+class LoadSheddingController:
+    """
+    Steps one level up when p90 latency of interactive AI calls or AI queue depth exceed
+    the SLO for `escalate_after_checks` checks in a row. Steps one level down only when
+    both are below `recovery_ratio` of the SLO for `recover_after_checks` checks in a row,
+    so the level doesn't flap around the SLO.
+
+    Latency counts only with at least `min_latency_samples` calls, and only calls finished
+    after the last level change, so the next step is decided by the effect of the previous one.
+    """
+
+    def __init__(
+        self,
+        latency_slo_seconds: float,
+        max_queue_depth: int,
+        recovery_ratio: float = 0.6,
+        escalate_after_checks: int = 3,
+        recover_after_checks: int = 12,
+        latency_window_seconds: float = 60.0,
+        min_latency_samples: int = 20,
+        enabled: bool = True,
+    ) -> None:
+        self._latency_slo_seconds = latency_slo_seconds
+        self._max_queue_depth = max_queue_depth
+        self._recovery_ratio = recovery_ratio
+        self._escalate_after_checks = escalate_after_checks
+        self._recover_after_checks = recover_after_checks
+        self._latency_window_seconds = latency_window_seconds
+        self._min_latency_samples = min_latency_samples
+        self._enabled = enabled
+        self._overloaded_checks = 0
+        self._healthy_checks = 0
+        self._level_change_time = time.perf_counter()
+        self.level = LoadLevel.NORMAL
+
+    def is_active(self, level: LoadLevel) -> bool:
+        return self.level >= level
+
+    def get_model(self, model: str) -> str:
+        if self.is_active(LoadLevel.LIGHT_MODELS):
+            return LIGHTER_MODELS.get(model, model)
+        return model
+
+    def cap_npcs(self, npc_ids: list[str]) -> list[str]:
+        if self.is_active(LoadLevel.CAPPED_NPCS):
+            return npc_ids[: settings.LOAD_SHEDDING_NPCS_PER_TURN]
+        return npc_ids
+
+    def check(self) -> None:
+        window_seconds = min(
+            self._latency_window_seconds, time.perf_counter() - self._level_change_time
+        )
+        latencies = ai_scheduler.get_recent_interactive_latencies(window_seconds)
+        p90_latency_seconds = (
+            percentile(latencies, 90) if len(latencies) >= self._min_latency_samples else None
+        )
+        self.update(p90_latency_seconds, ai_scheduler.get_queue_depth())
+
+    def update(self, p90_latency_seconds: float | None, queue_depth: int) -> None:
+        """`p90_latency_seconds` is None if there are too few calls to judge the latency."""
+        if not self._enabled:
+            return
+        is_latency_high = (
+            p90_latency_seconds is not None and p90_latency_seconds > self._latency_slo_seconds
+        )
+        is_latency_low = (
+            p90_latency_seconds is None
+            or p90_latency_seconds <= self._latency_slo_seconds * self._recovery_ratio
+        )
+        is_overloaded = is_latency_high or queue_depth > self._max_queue_depth
+        is_healthy = is_latency_low and queue_depth <= self._max_queue_depth * self._recovery_ratio
+        self._overloaded_checks = self._overloaded_checks + 1 if is_overloaded else 0
+        self._healthy_checks = self._healthy_checks + 1 if is_healthy else 0
+
+        new_level = self.level
+        if self._overloaded_checks >= self._escalate_after_checks:
+            new_level = LoadLevel(min(self.level + 1, max(LoadLevel)))
+            self._overloaded_checks = 0
+        elif self._healthy_checks >= self._recover_after_checks:
+            new_level = LoadLevel(max(self.level - 1, LoadLevel.NORMAL))
+            self._healthy_checks = 0
+        if new_level == self.level:
+            return
+
+        log = logfire.warn if new_level > self.level else logfire.info
+        log(
+            "Load level changed from {previous_level} to {level}",
+            previous_level=self.level.name,
+            level=new_level.name,
+            p90_latency_seconds=p90_latency_seconds,
+            queue_depth=queue_depth,
+        )
+        self.level = new_level
+        self._level_change_time = time.perf_counter()
+
+    async def run(self, check_interval: float) -> None:
+        while True:
+            await asyncio.sleep(check_interval)
+            self.check()
+
+
+class LoadSheddingMiddleware(BaseMiddleware):
+    """
+    Refuse updates which start a new session at `LoadLevel.NO_NEW_SESSIONS`.
+    Must be registered before `SessionTaskMiddleware`, so the current session is kept.
+    """
+
+    def __init__(self, controller: LoadSheddingController) -> None:
+        self._controller = controller
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if (
+            not self._controller.is_active(LoadLevel.NO_NEW_SESSIONS)
+            or get_session_reset_reason(event) is None
+        ):
+            return await handler(event, data)
+
+        if isinstance(event, Message):
+            await event.answer(NEW_SESSIONS_REFUSED_MESSAGE)
+        elif isinstance(event, CallbackQuery):
+            await event.answer(NEW_SESSIONS_REFUSED_MESSAGE, show_alert=True)
+        return None
+
+
+load_shedder = LoadSheddingController(
+    latency_slo_seconds=settings.LOAD_SHEDDING_LATENCY_SLO_SECONDS,
+    max_queue_depth=settings.LOAD_SHEDDING_MAX_QUEUE_DEPTH,
+    recovery_ratio=settings.LOAD_SHEDDING_RECOVERY_RATIO,
+    escalate_after_checks=settings.LOAD_SHEDDING_ESCALATE_AFTER_CHECKS,
+    recover_after_checks=settings.LOAD_SHEDDING_RECOVER_AFTER_CHECKS,
+    latency_window_seconds=settings.LOAD_SHEDDING_LATENCY_WINDOW_SECONDS,
+    min_latency_samples=settings.LOAD_SHEDDING_MIN_LATENCY_SAMPLES,
+    enabled=settings.LOAD_SHEDDING_ENABLED,
+)
@@ -48,6 +48,17 @@ class NarratorResponse(BaseModel):
     )
 
 
+class NarratorEventValidation(BaseModel):
+    is_consistent: bool = Field(
+        description="True if the event still makes sense after the player's latest action"
+    )
+    refreshed_narrator_action: str | None = Field(
+        None,
+        description="If the event is not consistent, the event minimally rewritten to follow"
+        " the player's latest action. None if the event is consistent or can't be adapted.",
+    )
+
+
 #     npcs_to_react: list[str] = Field(
 #         default_factory=list,
 #         description="""
@@ -83,3 +94,19 @@ class NPCResponse(BaseModel):
         description="List of new things the NPC learns about the player based on the player's last message"
         " (e.g., ['player_is_a_teacher', 'player_likes_coffee'])",
     )
+
+
+class GrammarCheckResult(BaseModel):
+    """Result of grammar checking."""
+
+    has_errors: bool = Field(
+        description="True if the message contains grammar or vocabulary errors."
+    )
+    brief_feedback: str | None = Field(
+        description="Brief, friendly feedback about errors. None if no errors.",
+        default=None,
+    )
+    corrected_text: str | None = Field(
+        description="The corrected version of the text. None if no errors.",
+        default=None,
+    )
@@ -4,13 +4,21 @@ import os
 from functools import cache
 
 from google import genai
-from pydantic import BaseModel, Field
 from rich import print as rprint
 from rich.panel import Panel
 from rich.pretty import Pretty
 
+from deutsch_tg_bot.ai_modes import get_ai_call_config
+from deutsch_tg_bot.ai_scheduler import ai_scheduler
+from deutsch_tg_bot.ai_tracing import get_prompt_version
 from deutsch_tg_bot.config import settings
-from deutsch_tg_bot.deutsh_enums import DeutschLevel
+from deutsch_tg_bot.deutsh_enums import AICallType, DeutschLevel
+from deutsch_tg_bot.load_shedding import load_shedder
+from deutsch_tg_bot.situation_training.ai.data_types import GrammarCheckResult
+from deutsch_tg_bot.situation_training.grammar_precheck import (
+    find_spelling_corrections,
+    precheck_grammar,
+)
 from deutsch_tg_bot.utils.prompt_utils import (
     load_prompt_template_from_file,
     replace_promt_placeholder,
@@ -23,19 +31,17 @@ GOOGLE_MODEL = "gemini-2.5-flash"
 PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "prompts")
 
 
-class GrammarCheckResult(BaseModel):
-    """Result of grammar checking."""
-
-    has_errors: bool = Field(
-        description="True if the message contains grammar or vocabulary errors."
-    )
-    brief_feedback: str | None = Field(
-        description="Brief, friendly feedback about errors. None if no errors.",
-        default=None,
-    )
-    corrected_text: str | None = Field(
-        description="The corrected version of the text. None if no errors.",
-        default=None,
+async def check_grammar(
+    user_text: str,
+    level: DeutschLevel,
+    situation_context: str,
+) -> GrammarCheckResult:
+    """Check grammar locally first. AI is called only if the local check is not sure."""
+    grammar_check_result = precheck_grammar(user_text)
+    if grammar_check_result is not None:
+        return grammar_check_result
+    return await check_grammar_with_ai(
+        user_text, level, situation_context, find_spelling_corrections(user_text)
     )
 
 
@@ -43,24 +49,41 @@ async def check_grammar_with_ai(
     user_text: str,
     level: DeutschLevel,
     situation_context: str,
+    spelling_corrections: dict[str, str] | None = None,
 ) -> GrammarCheckResult:
     prompt_template = get_grammar_check_prompt_template()
     prompt_params = {
         "level": level.value,
         "user_text": user_text,
         "situation_context": situation_context,
+        "spelling_hints": "\n".join(
+            f"- {word} → {correction}" for word, correction in (spelling_corrections or {}).items()
+        )
+        or "keine",
     }
     prompt = prompt_template % prompt_params
-
-    response = await genai_client.models.generate_content(
-        model=GOOGLE_MODEL,
-        config=genai.types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_json_schema=GrammarCheckResult.model_json_schema(),
-            temperature=0.3,  # Lower temperature for more consistent feedback
-        ),
-        contents=prompt,
-    )
+    ai_call_config = get_ai_call_config(AICallType.GRAMMAR_CHECK)
+
+    model = load_shedder.get_model(GOOGLE_MODEL)
+
+    async with ai_scheduler.slot(
+        model,
+        AICallType.GRAMMAR_CHECK,
+        mode=ai_call_config.mode,
+        prompt_version=get_prompt_version(prompt_template),
+    ) as ai_call_slot:
+        response = await genai_client.models.generate_content(
+            model=model,
+            config=genai.types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_json_schema=GrammarCheckResult.model_json_schema(),
+                temperature=0.3,  # Lower temperature for more consistent feedback
+                thinking_config=ai_call_config.get_thinking_config(),
+                max_output_tokens=ai_call_config.max_output_tokens,
+            ),
+            contents=prompt,
+        )
+        ai_call_slot.trace.record_genai_usage(response.usage_metadata)
 
     response_text = (response.text or "").strip()
     result = GrammarCheckResult.model_validate_json(response_text)
@@ -1,19 +1,21 @@
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.google import GoogleModel
 
+from deutsch_tg_bot.ai_modes import get_ai_call_config
+from deutsch_tg_bot.ai_scheduler import ai_scheduler
+from deutsch_tg_bot.ai_tracing import get_prompt_version
+from deutsch_tg_bot.deutsh_enums import AICallType
+from deutsch_tg_bot.load_shedding import LoadLevel, load_shedder
 from deutsch_tg_bot.user_session import SituationTrainingState
 
-from .data_types import NarratorResponse
+from .data_types import NarratorEventValidation, NarratorResponse
 from .model_settings import google_model_settings
+from .scene_context import get_scene_context, render_scene_state
 
 GOOGLE_MODEL = GoogleModel("gemini-2.5-flash")
+VALIDATION_GOOGLE_MODEL = GoogleModel("gemini-2.5-flash-lite")
 
-narrator_agent = Agent(
-    model=GOOGLE_MODEL,
-    model_settings=google_model_settings,
-    output_type=NarratorResponse,
-    deps_type=SituationTrainingState,
-    instructions="""
+NARRATOR_INSTRUCTIONS = """
 You are an AI agent acting as a narrator for a text-based roleplay game.
 Your task is to describe scenes and generate events based on the current game state and player actions.
 
@@ -37,60 +39,38 @@ Don't generate reactions of NPCs or message of NPCs in your response.
 Just describe the scene and events. NPCs reaction is triggered after each player action,
 and after you describe the scene and events, NPCs will react to them based on their personality, mood and goals.
 If you include NPCs reactions in your response, player will see duplicated reaction of NPC.
-""",
-)
-
-
-@narrator_agent.instructions
-def add_game_state(ctx: RunContext[SituationTrainingState]) -> str:
-    game_state = ctx.deps.game_state
-    return f"""
-Current game state:
-Game language: {game_state.game_language_code}. All descriptions and reactions must be in this language.
-Situation: {game_state.situation_name}
-Situation description: {game_state.situation_description}
-Location: {game_state.location_name} - {game_state.location_description}
-Time of day: {game_state.time_of_day}
-Active NPCs: {", ".join(game_state.active_npcs) if game_state.active_npcs else "none"}
-World facts: {", ".join(game_state.world_facts) if game_state.world_facts else "none"}
 """
 
+narrator_agent = Agent(
+    model=GOOGLE_MODEL,
+    model_settings=google_model_settings,
+    output_type=NarratorResponse,
+    deps_type=SituationTrainingState,
+    instructions=NARRATOR_INSTRUCTIONS,
+)
 
-@narrator_agent.instructions
-def add_npc_states(ctx: RunContext[SituationTrainingState]) -> str:
-    npc_states = ctx.deps.npc_states
-    if not npc_states:
-        return "No active NPCs."
-
-    npc_descriptions = []
-    for npc in npc_states:
-        description = f"NPC: {npc.name}, Personality: {npc.personality}, Mood: {npc.mood}"
-        if npc.knows_about_player:
-            description += f", Knows about player: {', '.join(npc.knows_about_player)}"
-        if npc.goals:
-            description += f", Goals: {', '.join(npc.goals)}"
-        npc_descriptions.append(description)
 
-    return "\n".join(npc_descriptions)
+# Immutable scene context goes first, so requests of a scene share the prompt prefix
+@narrator_agent.instructions
+def add_scene_context(ctx: RunContext[SituationTrainingState]) -> str:
+    return get_scene_context(ctx.deps)
 
 
 @narrator_agent.instructions
-def add_player_state(ctx: RunContext[SituationTrainingState]) -> str:
-    player_state = ctx.deps.player_state
-    return f"""
-Player: {player_state.name}
-Description: {player_state.description}
-Inventory: {", ".join(player_state.inventory) if player_state.inventory else "empty"}
-"""
+def add_scene_state(ctx: RunContext[SituationTrainingState]) -> str:
+    return render_scene_state(ctx.deps)
 
 
 @narrator_agent.instructions
 def add_message_history(ctx: RunContext[SituationTrainingState]) -> str:
-    messages_history = ctx.deps.messages_history[:20]
-    if not messages_history:
-        return "No messages history yet."
+    query = ctx.prompt if isinstance(ctx.prompt, str) else ""
+    return ctx.deps.message_memory.get_history_context(query)
+
 
-    return "Messages history:\n{messages_history!r}"
+def get_narrator_model() -> GoogleModel:
+    if load_shedder.is_active(LoadLevel.LIGHT_MODELS):
+        return VALIDATION_GOOGLE_MODEL
+    return GOOGLE_MODEL
 
 
 async def get_narrator_response(
@@ -98,5 +78,80 @@ async def get_narrator_response(
 ) -> NarratorResponse:
     message = f"""Latest player action: {latest_player_action}
 Based on the current game state, describe the scene and events, and determine which NPCs should react to this action."""
-    response = await narrator_agent.run(message, deps=situation_training_state)
+    model = get_narrator_model()
+    ai_call_config = get_ai_call_config(AICallType.NARRATOR)
+    async with ai_scheduler.slot(
+        model.model_name,
+        AICallType.NARRATOR,
+        mode=ai_call_config.mode,
+        prompt_version=get_prompt_version(NARRATOR_INSTRUCTIONS),
+    ) as ai_call_slot:
+        response = await narrator_agent.run(
+            message,
+            deps=situation_training_state,
+            model=model,
+            model_settings=ai_call_config.get_google_model_settings(),
+        )
+        ai_call_slot.trace.record_agent_usage(response.usage())
+    return response.output
+
+
+async def get_speculative_narrator_response(
+    situation_training_state: SituationTrainingState,
+) -> NarratorResponse:
+    """Narrator event generated before the player's next action, to be validated later."""
+    message = """The player is about to make the next action, it is not known yet.
+Based on the current game state and messages history, describe the next scene event.
+The event must make sense whatever the player does next: don't assume the player's next action."""
+    model = get_narrator_model()
+    ai_call_config = get_ai_call_config(AICallType.NARRATOR)
+    async with ai_scheduler.slot(
+        model.model_name,
+        AICallType.NARRATOR,
+        mode=ai_call_config.mode,
+        prompt_version=get_prompt_version(NARRATOR_INSTRUCTIONS),
+    ) as ai_call_slot:
+        response = await narrator_agent.run(
+            message,
+            deps=situation_training_state,
+            model=model,
+            model_settings=ai_call_config.get_google_model_settings(),
+        )
+        ai_call_slot.trace.record_agent_usage(response.usage())
     return response.output
+
+
+NARRATOR_EVENT_VALIDATOR_INSTRUCTIONS = """
+You validate a narrator event of a text-based roleplay game, prepared before the player's latest action.
+Check if the event is still consistent with the player's latest action.
+If it contradicts the action, rewrite the event minimally, so it follows the action.
+Keep the language and the style of the event.
+"""
+
+narrator_event_validator = Agent(
+    model=VALIDATION_GOOGLE_MODEL,
+    output_type=NarratorEventValidation,
+    instructions=NARRATOR_EVENT_VALIDATOR_INSTRUCTIONS,
+)
+
+
+async def validate_speculative_narrator_response(
+    narrator_response: NarratorResponse, latest_player_action: str
+) -> NarratorResponse | None:
+    """Return the event, refreshed if needed, or None if it must be generated again."""
+    message = f"""Narrator event: {narrator_response.narrator_action}
+Player's latest action: {latest_player_action}"""
+    async with ai_scheduler.slot(
+        VALIDATION_GOOGLE_MODEL.model_name,
+        AICallType.NARRATOR_EVENT_VALIDATION,
+        prompt_version=get_prompt_version(NARRATOR_EVENT_VALIDATOR_INSTRUCTIONS),
+    ) as ai_call_slot:
+        response = await narrator_event_validator.run(message)
+        ai_call_slot.trace.record_agent_usage(response.usage())
+
+    validation = response.output
+    if validation.is_consistent:
+        return narrator_response
+    if validation.refreshed_narrator_action:
+        return NarratorResponse(narrator_action=validation.refreshed_narrator_action)
+    return None
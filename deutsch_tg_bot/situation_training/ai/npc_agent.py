@@ -3,27 +3,28 @@ from dataclasses import dataclass
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.google import GoogleModel
 
+from deutsch_tg_bot.ai_modes import get_ai_call_config
+from deutsch_tg_bot.ai_scheduler import ai_scheduler
+from deutsch_tg_bot.ai_tracing import get_prompt_version
+from deutsch_tg_bot.deutsh_enums import AICallType
+from deutsch_tg_bot.load_shedding import LoadLevel, load_shedder
 from deutsch_tg_bot.user_session import SituationTrainingState
 
 from .data_types import NPCResponse, NPCState
 from .model_settings import google_model_settings
+from .scene_context import get_scene_context, render_scene_state
 
 GOOGLE_MODEL = GoogleModel("gemini-2.5-flash")
+LIGHT_GOOGLE_MODEL = GoogleModel("gemini-2.5-flash-lite")
 
 
 @dataclass
 class NPCContext:
     situation_training_state: SituationTrainingState
     current_npc_state: NPCState
-    other_npc_states: list[NPCState]
 
 
-npc_agent = Agent(
-    model=GOOGLE_MODEL,
-    model_settings=google_model_settings,
-    output_type=NPCResponse,
-    deps_type=NPCContext,
-    instructions="""
+NPC_INSTRUCTIONS = """
 You are an AI agent acting as a NPC in a text-based roleplay game.
 Your task is to react to player's actions in a way that is consistent with your personality,
 mood and goals, as well as the current game state.
@@ -34,70 +35,52 @@ Your reaction should be in character and can include dialogue, actions, or chang
 If player action provoces you to some reaction or action, you should react to it.
 Don't be passive or stick to the same reaction. Be creative and try to make the game more dynamic and interesting.
 Analye messages history to understand your and player's interaction.
-""",
+"""
+
+npc_agent = Agent(
+    model=GOOGLE_MODEL,
+    model_settings=google_model_settings,
+    output_type=NPCResponse,
+    deps_type=NPCContext,
+    instructions=NPC_INSTRUCTIONS,
 )
 
 
+# Immutable scene context goes first, so requests of a scene share the prompt prefix
 @npc_agent.instructions
-def add_game_state(ctx: RunContext[NPCContext]) -> str:
-    game_state = ctx.deps.situation_training_state.game_state
-    return f"""
-Current game state:
-Game language: {game_state.game_language_code}. All descriptions and reactions must be in this language.
-Situation: {game_state.situation_name}
-Situation description: {game_state.situation_description}
-Location: {game_state.location_name} - {game_state.location_description}
-Time of day: {game_state.time_of_day}
-Active NPCs: {", ".join(game_state.active_npcs) if game_state.active_npcs else "none"}
-World facts: {", ".join(game_state.world_facts) if game_state.world_facts else "none"}
-"""
+def add_scene_context(ctx: RunContext[NPCContext]) -> str:
+    return get_scene_context(ctx.deps.situation_training_state)
 
 
 @npc_agent.instructions
-def add_current_npc_state(ctx: RunContext[NPCContext]) -> str:
-    npc_state = ctx.deps.current_npc_state
-    description = f"npc_id: {npc_state.npc_id}. Use this as npc_id in your response!!!\n"
-    description += (
-        f"NPC: {npc_state.name}, Personality: {npc_state.personality}, Mood: {npc_state.mood}"
+def add_scene_state(ctx: RunContext[NPCContext]) -> str:
+    return render_scene_state(
+        ctx.deps.situation_training_state, npc_id=ctx.deps.current_npc_state.npc_id
     )
 
-    if npc_state.knows_about_player:
-        description += f", Knows about player: {', '.join(npc_state.knows_about_player)}"
-    if npc_state.goals:
-        description += f", Goals: {', '.join(npc_state.goals)}"
-    return description
-
-
-@npc_agent.instructions
-def add_other_npcs_state(ctx: RunContext[NPCContext]) -> str:
-    other_npc_states = ctx.deps.other_npc_states
-    if not other_npc_states:
-        return "No other active NPCs."
-
-    npc_descriptions = []
-    for npc in other_npc_states:
-        description = f"NPC: {npc.name}, Personality: {npc.personality}, Mood: {npc.mood}"
-        npc_descriptions.append(description)
-
-    return "\n".join(npc_descriptions)
-
 
 @npc_agent.instructions
-def add_player_state(ctx: RunContext[NPCContext]) -> str:
-    player_state = ctx.deps.situation_training_state.player_state
-    return f"""
-Player: {player_state.name}
-Description: {player_state.description}
-"""
+def add_current_npc_state(ctx: RunContext[NPCContext]) -> str:
+    npc_state = ctx.deps.current_npc_state
+    return (
+        f"You play NPC {npc_state.npc_id} ({npc_state.name}). "
+        f"npc_id: {npc_state.npc_id}. Use this as npc_id in your response!!!"
+    )
 
 
 @npc_agent.instructions
 def add_message_history(ctx: RunContext[NPCContext]) -> str:
-    messages_history = ctx.deps.situation_training_state.messages_history[:20]
-    if not messages_history:
-        return "No messages history yet."
-
-    return "Messages history:\n{messages_history!r}"
+    # Messages about what the NPC knows and wants are relevant to its reaction
+    npc_state = ctx.deps.current_npc_state
+    query = " ".join(
+        [
+            ctx.prompt if isinstance(ctx.prompt, str) else "",
+            npc_state.name,
+            *npc_state.goals,
+            *npc_state.knows_about_player,
+        ]
+    )
+    return ctx.deps.situation_training_state.message_memory.get_history_context(query)
 
 
 async def get_npc_reaction(
@@ -105,18 +88,11 @@ async def get_npc_reaction(
     situation_training_state: SituationTrainingState,
     latest_player_action: str,
 ) -> NPCResponse:
-    current_npc_state = next(
-        npc for npc in situation_training_state.npc_states if npc.npc_id == npc_id
-    )
-    assert current_npc_state is not None, (
-        f"NPC with id {npc_id} not found in the current game state"
-    )
-    other_npc_states = [npc for npc in situation_training_state.npc_states if npc.npc_id != npc_id]
+    current_npc_state = situation_training_state.npc_registry[npc_id]
 
     npc_context = NPCContext(
         situation_training_state=situation_training_state,
         current_npc_state=current_npc_state,
-        other_npc_states=other_npc_states,
     )
     message = f"""Latest player action: {latest_player_action}
 Based on the current game state, your NPC's personality, mood and goals, react to this action in character.
@@ -127,5 +103,19 @@ Be creative and make sure your reaction is consistent with the current game stat
 Remember that the game language is {situation_training_state.game_state.game_language_code},
 so your reaction must be in this language.
 """
-    npc_response = await npc_agent.run(message, deps=npc_context)
+    model = LIGHT_GOOGLE_MODEL if load_shedder.is_active(LoadLevel.LIGHT_MODELS) else GOOGLE_MODEL
+    ai_call_config = get_ai_call_config(AICallType.NPC)
+    async with ai_scheduler.slot(
+        model.model_name,
+        AICallType.NPC,
+        mode=ai_call_config.mode,
+        prompt_version=get_prompt_version(NPC_INSTRUCTIONS),
+    ) as ai_call_slot:
+        npc_response = await npc_agent.run(
+            message,
+            deps=npc_context,
+            model=model,
+            model_settings=ai_call_config.get_google_model_settings(),
+        )
+        ai_call_slot.trace.record_agent_usage(npc_response.usage())
     return npc_response.output
@@ -0,0 +1,100 @@
+"""
+Scene context of situation agents, split into the immutable part and per-turn state.
+
+The immutable part is rendered once per scene and goes first in agent instructions,
+so all requests of a scene share a byte-identical prefix, which Gemini caches implicitly.
+Per-turn state, like NPC moods and facts they learned, goes after it.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from deutsch_tg_bot.user_session import SituationTrainingState
+
+
+@dataclass
+class SceneContext:
+    fingerprint: tuple[object, ...]
+    text: str
+
+
+def get_scene_context(situation_training_state: SituationTrainingState) -> str:
+    """Rendered immutable part of the scene, re-rendered only when the scene facts change."""
+    fingerprint = get_scene_fingerprint(situation_training_state)
+    scene_context = situation_training_state.scene_context
+    if scene_context is None or scene_context.fingerprint != fingerprint:
+        scene_context = SceneContext(
+            fingerprint=fingerprint,
+            text=render_scene_context(situation_training_state),
+        )
+        situation_training_state.scene_context = scene_context
+    return scene_context.text
+
+
+def get_scene_fingerprint(situation_training_state: SituationTrainingState) -> tuple[object, ...]:
+    # Tuples of the same string objects are compared by identity, so the check is cheap
+    game_state = situation_training_state.game_state
+    player_state = situation_training_state.player_state
+    return (
+        game_state.game_language_code,
+        game_state.situation_name,
+        game_state.situation_description,
+        game_state.location_name,
+        game_state.location_description,
+        game_state.time_of_day,
+        tuple(game_state.world_facts),
+        tuple(game_state.active_npcs),
+        player_state.name,
+        player_state.description,
+        tuple(
+            (npc.npc_id, npc.name, npc.personality) for npc in situation_training_state.npc_states
+        ),
+    )
+
+
+def render_scene_context(situation_training_state: SituationTrainingState) -> str:
+    game_state = situation_training_state.game_state
+    player_state = situation_training_state.player_state
+    npc_descriptions = "\n".join(
+        f"NPC {npc.npc_id}: {npc.name}, Personality: {npc.personality}"
+        for npc in situation_training_state.npc_states
+    )
+    return f"""
+Current game state:
+Game language: {game_state.game_language_code}. All descriptions and reactions must be in this language.
+Situation: {game_state.situation_name}
+Situation description: {game_state.situation_description}
+Location: {game_state.location_name} - {game_state.location_description}
+Time of day: {game_state.time_of_day}
+Active NPCs: {", ".join(game_state.active_npcs) if game_state.active_npcs else "none"}
+World facts: {", ".join(game_state.world_facts) if game_state.world_facts else "none"}
+
+NPCs:
+{npc_descriptions or "No NPCs."}
+
+Player: {player_state.name}
+Description: {player_state.description}
+"""
+
+
+def render_scene_state(
+    situation_training_state: SituationTrainingState, npc_id: str | None = None
+) -> str:
+    """
+    Parts of the scene which change during the game. For the prompt of NPC `npc_id`,
+    goals and knowledge of other NPCs are private, only their moods are rendered.
+    """
+    npc_registry = situation_training_state.npc_registry
+    npc_states = [
+        npc_registry.get_state_fragment(npc.npc_id)
+        if npc_id is None or npc.npc_id == npc_id
+        else f"NPC {npc.npc_id}: Mood: {npc.mood}"
+        for npc in npc_registry
+    ]
+
+    inventory = situation_training_state.player_state.inventory
+    npc_states.append(f"Player inventory: {', '.join(inventory) if inventory else 'empty'}")
+    return "Current state:\n" + "\n".join(npc_states)
@@ -6,6 +6,10 @@ from uuid import uuid4
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent
 
+from deutsch_tg_bot.ai_scheduler import ai_scheduler
+from deutsch_tg_bot.ai_tracing import get_prompt_version
+from deutsch_tg_bot.deutsh_enums import AICallType
+
 from .data_types import GameState, NPCState, PlayerState
 
 GOOGLE_MODEL = "gemini-2.5-flash"
@@ -25,14 +29,16 @@ class GameStateGenerationResponse(BaseModel):
     )
 
 
-agent = Agent(
-    model=GOOGLE_MODEL,
-    output_type=GameStateGenerationResponse,
-    instructions="""
+SITUATION_GENERATOR_INSTRUCTIONS = """
 Це підготовка до текстової рольової гри для практики німецької мови.
 Твоя задача - створити початкову ситуацію на основі опису користувача.
 Для `session_id` використовуй передане значення.
-""",
+"""
+
+agent = Agent(
+    model=GOOGLE_MODEL,
+    output_type=GameStateGenerationResponse,
+    instructions=SITUATION_GENERATOR_INSTRUCTIONS,
 )
 
 
@@ -47,6 +53,12 @@ session_id: {str(uuid4())}
 
 Згенеруй початковий стан гри на основі цього опису.
 """
-    response = await agent.run(message)
+    async with ai_scheduler.slot(
+        GOOGLE_MODEL,
+        AICallType.SITUATION_GENERATION,
+        prompt_version=get_prompt_version(SITUATION_GENERATOR_INSTRUCTIONS),
+    ) as ai_call_slot:
+        response = await agent.run(message)
+        ai_call_slot.trace.record_agent_usage(response.usage())
     output = response.output
     return (output.game_state, output.npc_states, output.player_state)
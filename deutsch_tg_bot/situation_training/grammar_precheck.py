@@ -0,0 +1,132 @@
+"""
+Local pre-check of German grammar and spelling in player's messages.
+
+Only short replies like "Ja, danke!" get a result locally, without AI call. Anything else
+is checked by `check_grammar_with_ai`: known words don't make a message correct, agreement,
+case and word order errors need the full check. Typos found in the lexicon are passed
+to the AI check as hints.
+
+The bundled lexicon is built from the German word frequency list of pyspellchecker
+(MIT License, based on OpenSubtitles word frequencies) with `build_german_lexicon`.
+"""
+
+import gzip
+import os
+import re
+from dataclasses import dataclass
+from functools import cache
+
+from deutsch_tg_bot.situation_training.ai.data_types import GrammarCheckResult
+from deutsch_tg_bot.utils.dawg import DAWG
+
+LEXICON_DIR = os.path.join(os.path.dirname(__file__), "lexicon")
+WORDS_FILE_NAME = "de_words.dawg.gz"
+FREQUENT_WORDS_FILE_NAME = "de_frequent_words.txt.gz"
+
+MAX_CORRECTIONS = 3
+MIN_CORRECTABLE_WORD_LENGTH = 4
+
+_WORD_RE = re.compile(r"[A-Za-zÄÖÜäöüß]+")
+_NON_GERMAN_LETTER_RE = re.compile(r"[^\W\dA-Za-zÄÖÜäöüß_]")
+
+INFLECTION_SUFFIXES = ("en", "em", "er", "es", "st", "et", "e", "n", "s", "t")
+
+# Replies which are correct in any case and in any combination
+INTERJECTIONS = frozenset(
+    [
+        "ja", "nein", "doch", "danke", "bitte", "hallo", "tschüss", "okay", "ok", "genau",
+        "klar", "gern", "gerne", "super", "prima", "stimmt", "natürlich", "ach", "oh", "na",
+        "hm", "aha", "servus", "moin",
+    ]
+)  # fmt: skip
+
+
+@dataclass
+class GermanLexicon:
+    words: DAWG
+    frequent_words: frozenset[str]
+
+    def is_known(self, word: str) -> bool:
+        """Check word and its simple morphological variants: inflection endings and ge- participles."""
+        if word in self.words:
+            return True
+        for suffix in INFLECTION_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                stem = word[: -len(suffix)]
+                if stem in self.words or f"{stem}en" in self.words:
+                    return True
+        if word.startswith("ge") and len(word) > 5:
+            # gemacht -> machen, gekauft -> kaufen
+            stem = word[2:].removesuffix("t").removesuffix("en")
+            return f"{stem}en" in self.words
+        return False
+
+    def get_correction(self, word: str) -> str | None:
+        """Return a correction if there is the only plausible one at one edit distance."""
+        if len(word) < MIN_CORRECTABLE_WORD_LENGTH:
+            return None
+        candidates = self.words.find_within_one_edit(word)
+        if len(candidates) > 1:
+            candidates = {candidate for candidate in candidates if candidate in self.frequent_words}
+        if len(candidates) == 1:
+            return candidates.pop()
+        return None
+
+
+@cache
+def get_german_lexicon() -> GermanLexicon:
+    words = DAWG.load(os.path.join(LEXICON_DIR, WORDS_FILE_NAME))
+    with gzip.open(os.path.join(LEXICON_DIR, FREQUENT_WORDS_FILE_NAME), "rt") as f:
+        frequent_words = frozenset(line.strip() for line in f if line.strip())
+    return GermanLexicon(words=words, frequent_words=frequent_words)
+
+
+def precheck_grammar(user_text: str) -> GrammarCheckResult | None:
+    """Return grammar check result for interjections. Return None if the message must be checked by AI."""
+    words = [word.lower() for word in _WORD_RE.findall(user_text)]
+    if (
+        words
+        and all(word in INTERJECTIONS for word in words)
+        and not _NON_GERMAN_LETTER_RE.search(user_text)
+    ):
+        return GrammarCheckResult(has_errors=False)
+    return None
+
+
+def find_spelling_corrections(user_text: str) -> dict[str, str]:
+    """
+    Unknown words of the message with their only plausible corrections, as hints for the AI
+    check. No hints if there are too many unknown words: the message is likely not German.
+    """
+    if _NON_GERMAN_LETTER_RE.search(user_text):
+        return {}
+
+    lexicon = get_german_lexicon()
+    corrections: dict[str, str] = {}
+    for word in _WORD_RE.findall(user_text):
+        if word in corrections or lexicon.is_known(word.lower()):
+            continue
+        correction = lexicon.get_correction(word.lower())
+        if correction is None:
+            continue
+        if word[0].isupper():
+            correction = correction[0].upper() + correction[1:]
+        corrections[word] = correction
+        if len(corrections) > MAX_CORRECTIONS:
+            return {}
+    return corrections
+
+
+def build_german_lexicon(words_path: str, frequent_words_number: int = 20000) -> None:
+    """
+    Build the bundled lexicon from a word list with one word per line,
+    sorted by frequency, most frequent first.
+    """
+    with open(words_path, encoding="utf-8") as f:
+        words = [line.strip().lower() for line in f]
+    words = [word for word in words if _WORD_RE.fullmatch(word)]
+
+    os.makedirs(LEXICON_DIR, exist_ok=True)
+    DAWG.from_words(sorted(set(words))).save(os.path.join(LEXICON_DIR, WORDS_FILE_NAME))
+    with gzip.open(os.path.join(LEXICON_DIR, FREQUENT_WORDS_FILE_NAME), "wt") as f:
+        f.write("\n".join(words[:frequent_words_number]) + "\n")
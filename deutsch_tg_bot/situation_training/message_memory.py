@@ -0,0 +1,188 @@
+"""
+Retrieval memory of a roleplay session. Instead of the raw history, situation agents get
+the most recent messages and the past messages most relevant to the current turn, ranked
+by BM25, within a token budget. So long scenes stay coherent at a fixed prompt cost.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import re
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from deutsch_tg_bot.config import settings
+
+if TYPE_CHECKING:
+    from deutsch_tg_bot.user_session import HistoryMessage
+
+# Words of German and Ukrainian messages. Shorter words are mostly articles and pronouns
+_WORD_RE = re.compile(r"\w{3,}")
+# Rough estimate for German and Ukrainian texts, exact counts need an API call
+_CHARS_PER_TOKEN = 4
+# Only the rarest words of the query are scored. They weigh the most in the ranking,
+# while frequent words cost the most to score
+_MAX_QUERY_WORDS = 32
+# Words in more messages than this share are like stop words for the session
+_MAX_MESSAGES_SHARE = 0.1
+# Words in this number of messages or less are never stop words, even in short sessions
+_MIN_STOP_WORD_MESSAGES = 3
+
+
+def tokenize(text: str) -> list[str]:
+    return _WORD_RE.findall(text.casefold())
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+class MessageMemory:
+    """
+    BM25 index of session messages, updated incrementally: adding a message updates
+    postings of its words only. The oldest messages are evicted beyond `messages_limit`.
+    Message ids are consecutive, so recent messages are a range of ids.
+    """
+
+    def __init__(self, messages_limit: int, k1: float = 1.2, b: float = 0.75) -> None:
+        self._messages_limit = messages_limit
+        self._k1 = k1
+        self._b = b
+        self._messages: dict[int, HistoryMessage] = {}
+        self._lengths: dict[int, int] = {}
+        self._total_length = 0
+        # Word -> message id -> number of the word in the message
+        self._postings: dict[str, dict[int, int]] = {}
+        self._next_id = 0
+        # `k1 * length_norm` of each message, valid until the next change of the index
+        self._length_norms: dict[int, float] | None = None
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def add(self, message: HistoryMessage) -> None:
+        message_id = self._next_id
+        self._next_id += 1
+        words = tokenize(message.text)
+        for word, count in Counter(words).items():
+            self._postings.setdefault(word, {})[message_id] = count
+        self._messages[message_id] = message
+        self._lengths[message_id] = len(words)
+        self._total_length += len(words)
+        self._length_norms = None
+        if len(self._messages) > self._messages_limit:
+            self._evict(next(iter(self._messages)))
+
+    def search(
+        self, query: str, top_k: int, before_id: int | None = None, context: str = ""
+    ) -> list[int]:
+        """
+        Ids of messages most relevant to the query, best first. Only ids below `before_id`.
+        Words of `context` are scored only if there are less than `_MAX_QUERY_WORDS` query words.
+        """
+        if not self._messages or top_k <= 0:
+            return []
+        before_id = self._next_id if before_id is None else before_id
+        query_words = set(tokenize(query))
+        context_words = set(tokenize(context)) - query_words
+        query_postings = [
+            *self._get_rarest_postings(query_words, before_id),
+            *self._get_rarest_postings(context_words, before_id),
+        ][:_MAX_QUERY_WORDS]
+
+        messages_number = len(self._messages)
+        length_norms = self._get_length_norms()
+        k1_plus_one = self._k1 + 1
+        scores: dict[int, float] = {}
+        for postings in query_postings:
+            idf = math.log(1 + (messages_number - len(postings) + 0.5) / (len(postings) + 0.5))
+            for message_id, count in postings.items():
+                # Ids are added in order, the rest are recent messages
+                if message_id >= before_id:
+                    break
+                score = idf * count * k1_plus_one / (count + length_norms[message_id])
+                scores[message_id] = scores.get(message_id, 0.0) + score
+        return heapq.nlargest(top_k, scores, key=scores.__getitem__)
+
+    def select(
+        self, query: str, recent_number: int, relevant_number: int, token_budget: int
+    ) -> list[int]:
+        """
+        Ids of the recent messages, newest first while the budget allows, and then of the most
+        relevant older ones. Recent messages are the context of the query, they define the topic.
+        """
+        first_recent_id = max(self._next_id - recent_number, self._next_id - len(self._messages))
+        recent_ids = list(range(self._next_id - 1, first_recent_id - 1, -1))
+        context = " ".join(self._messages[message_id].text for message_id in recent_ids)
+        relevant_ids = self.search(
+            query, relevant_number, before_id=first_recent_id, context=context
+        )
+
+        selected_ids = []
+        tokens_left = token_budget
+        for message_id in [*recent_ids, *relevant_ids]:
+            tokens = estimate_tokens(self._messages[message_id].text)
+            if tokens > tokens_left:
+                continue
+            tokens_left -= tokens
+            selected_ids.append(message_id)
+        return sorted(selected_ids)
+
+    def render(self, message_ids: list[int]) -> str:
+        """Messages in chronological order, skipped parts of the history are marked."""
+        lines = []
+        previous_id: int | None = None
+        for message_id in message_ids:
+            if previous_id is not None and message_id != previous_id + 1:
+                lines.append("...")
+            message = self._messages[message_id]
+            lines.append(f"{message.sender}: {message.text}")
+            previous_id = message_id
+        return "\n".join(lines)
+
+    def get_history_context(self, query: str) -> str:
+        """History part of agent instructions for the current turn."""
+        if not self._messages:
+            return "No messages history yet."
+        message_ids = self.select(
+            query,
+            recent_number=settings.MEMORY_RECENT_MESSAGES_NUMBER,
+            relevant_number=settings.MEMORY_RELEVANT_MESSAGES_NUMBER,
+            token_budget=settings.MEMORY_TOKEN_BUDGET,
+        )
+        return "Messages history:\n" + self.render(message_ids)
+
+    def _get_rarest_postings(self, words: set[str], before_id: int) -> list[dict[int, int]]:
+        """Postings of the words by frequency, without words only in messages from `before_id`."""
+        max_messages_number = max(
+            len(self._messages) * _MAX_MESSAGES_SHARE, _MIN_STOP_WORD_MESSAGES
+        )
+        word_postings = [
+            postings
+            for word in words
+            if (postings := self._postings.get(word)) is not None
+            and len(postings) <= max_messages_number
+            and next(iter(postings)) < before_id
+        ]
+        word_postings.sort(key=len)
+        return word_postings[:_MAX_QUERY_WORDS]
+
+    def _get_length_norms(self) -> dict[int, float]:
+        if self._length_norms is None:
+            average_length = self._total_length / len(self._messages) or 1.0
+            k1, b = self._k1, self._b
+            self._length_norms = {
+                message_id: k1 * (1 - b + b * length / average_length)
+                for message_id, length in self._lengths.items()
+            }
+        return self._length_norms
+
+    def _evict(self, message_id: int) -> None:
+        message = self._messages.pop(message_id)
+        self._total_length -= self._lengths.pop(message_id)
+        for word in set(tokenize(message.text)):
+            postings = self._postings[word]
+            del postings[message_id]
+            if not postings:
+                del self._postings[word]
@@ -0,0 +1,83 @@
+"""NPC states of a roleplay session indexed by id, with memoized prompt fragments."""
+
+from collections.abc import Iterator
+
+from deutsch_tg_bot.situation_training.ai.data_types import NPCResponse, NPCState
+
+
+class NPCRegistry:
+    """
+    Holds the same `NPCState` objects as the session, so NPC state must be changed
+    only through the registry: it keeps known facts deduplicated and marks rendered
+    fragments of changed NPCs as dirty. Only dirty fragments are rendered again.
+    """
+
+    def __init__(self, npc_states: list[NPCState]) -> None:
+        self._npcs: dict[str, NPCState] = {npc.npc_id: npc for npc in npc_states}
+        # Ordered sets of normalized facts, insertion order is kept by dict
+        self._known_facts: dict[str, dict[str, None]] = {}
+        for npc in self._npcs.values():
+            facts = dict.fromkeys(_normalize_fact(fact) for fact in npc.knows_about_player)
+            if len(facts) != len(npc.knows_about_player):
+                npc.knows_about_player = _deduplicate_facts(npc.knows_about_player)
+            self._known_facts[npc.npc_id] = facts
+        self._state_fragments: dict[str, str] = {}
+        self._dirty: set[str] = set(self._npcs)
+
+    def __len__(self) -> int:
+        return len(self._npcs)
+
+    def __iter__(self) -> Iterator[NPCState]:
+        return iter(self._npcs.values())
+
+    def __contains__(self, npc_id: object) -> bool:
+        return npc_id in self._npcs
+
+    def __getitem__(self, npc_id: str) -> NPCState:
+        return self._npcs[npc_id]
+
+    def apply_npc_response(self, npc_response: NPCResponse) -> None:
+        npc = self._npcs.get(npc_response.npc_id)
+        assert npc is not None, (
+            f"NPC with id {npc_response.npc_id} not found in the current game state"
+        )
+
+        if npc_response.mood_update and npc_response.mood_update != npc.mood:
+            npc.mood = npc_response.mood_update
+            self._dirty.add(npc.npc_id)
+
+        known_facts = self._known_facts[npc.npc_id]
+        for fact in npc_response.learns_about_player:
+            normalized_fact = _normalize_fact(fact)
+            if normalized_fact in known_facts:
+                continue
+            known_facts[normalized_fact] = None
+            npc.knows_about_player.append(fact)
+            self._dirty.add(npc.npc_id)
+
+    def get_state_fragment(self, npc_id: str) -> str:
+        """Rendered state of the NPC which changes during the game."""
+        if npc_id in self._dirty or npc_id not in self._state_fragments:
+            self._state_fragments[npc_id] = _render_npc_state(self._npcs[npc_id])
+            self._dirty.discard(npc_id)
+        return self._state_fragments[npc_id]
+
+
+def _render_npc_state(npc: NPCState) -> str:
+    description = f"NPC {npc.npc_id}: Mood: {npc.mood}"
+    if npc.knows_about_player:
+        description += f", Knows about player: {', '.join(npc.knows_about_player)}"
+    if npc.goals:
+        description += f", Goals: {', '.join(npc.goals)}"
+    return description
+
+
+def _normalize_fact(fact: str) -> str:
+    return " ".join(fact.casefold().split())
+
+
+def _deduplicate_facts(facts: list[str]) -> list[str]:
+    unique_facts: dict[str, str] = {}
+    for fact in facts:
+        unique_facts.setdefault(_normalize_fact(fact), fact)
+    return list(unique_facts.values())
@@ -0,0 +1,149 @@
+"""Library of generated situations, so common and preset situations are generated once."""
+
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from uuid import uuid4
+
+from deutsch_tg_bot.ai_scheduler import AIPriority, current_ai_priority
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.situation_training.ai.data_types import GameState, NPCState, PlayerState
+from deutsch_tg_bot.situation_training.ai.situation_generator import (
+    GameStateGenerationResponse,
+    generate_situation_from_description,
+)
+from deutsch_tg_bot.utils.near_duplicates import normalize_text
+
+PRESETS_DIR = os.path.join(os.path.dirname(__file__), "presets")
+
+
+@dataclass(frozen=True)
+class SituationPreset:
+    name: str
+    description: str
+    game_language_code: str = "uk"
+
+
+# Presets are selected by the user with a short key instead of a description.
+# Run `python -m main generate_situation_presets` to pre-generate them into PRESETS_DIR.
+SITUATION_PRESETS: dict[str, SituationPreset] = {
+    "1": SituationPreset(
+        name="matrix",
+        description="""
+Я Нео на самому початку фільму Матриця.
+Я ще нічого не знаю про Матрицю, живу звичайним життям в місті, працюю програмістом.
+Я відчуваю, що щось не так з світом, але не можу зрозуміти що саме.
+Я відчуваю себе в пастці, як ніби я не на своєму місці.
+Я часто відчуваю тривогу і розгубленість через це.
+Я не знаю, що таке Матриця і що вона означає для мене.
+Пізній вечір, я в своїй квартирі, сиджу за комп'ютером і працюю над кодом.
+Тут в двері дзвонять. За дверима стоїть Морфеус.
+""",
+    ),
+}
+
+
+class SituationLibrary:
+    """
+    Generated situations keyed by normalized description and game language.
+    Each session gets a deep copy with a fresh session_id, so sessions never share state.
+    Presets loaded from disk are kept forever, other situations are evicted LRU.
+    """
+
+    def __init__(self, presets_dir: str = PRESETS_DIR, max_items: int = 200) -> None:
+        self._presets_dir = presets_dir
+        self._max_items = max_items
+        self._presets: dict[tuple[str, str], GameStateGenerationResponse] = {}
+        self._situations: OrderedDict[tuple[str, str], GameStateGenerationResponse] = OrderedDict()
+        self._load_presets()
+
+    def get(
+        self, description: str, game_language_code: str
+    ) -> tuple[GameState, list[NPCState], PlayerState] | None:
+        key = _get_situation_key(description, game_language_code)
+        situation = self._presets.get(key)
+        if situation is None:
+            situation = self._situations.get(key)
+            if situation is None:
+                return None
+            self._situations.move_to_end(key)
+        return _copy_situation(situation)
+
+    def add(
+        self,
+        description: str,
+        game_language_code: str,
+        situation: GameStateGenerationResponse,
+    ) -> None:
+        key = _get_situation_key(description, game_language_code)
+        self._situations[key] = situation.model_copy(deep=True)
+        self._situations.move_to_end(key)
+        while len(self._situations) > self._max_items:
+            self._situations.popitem(last=False)
+
+    async def get_or_generate(
+        self, description: str, game_language_code: str
+    ) -> tuple[GameState, list[NPCState], PlayerState]:
+        cached_situation = self.get(description, game_language_code)
+        if cached_situation is not None:
+            return cached_situation
+
+        game_state, npc_states, player_state = await generate_situation_from_description(
+            user_description=description,
+            game_language_code=game_language_code,
+        )
+        situation = GameStateGenerationResponse(
+            game_state=game_state, npc_states=npc_states, player_state=player_state
+        )
+        self.add(description, game_language_code, situation)
+        return _copy_situation(situation)
+
+    def _load_presets(self) -> None:
+        if not os.path.isdir(self._presets_dir):
+            return
+        for file_name in sorted(os.listdir(self._presets_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            with open(os.path.join(self._presets_dir, file_name), encoding="utf-8") as f:
+                preset_data = json.load(f)
+            key = _get_situation_key(preset_data["description"], preset_data["game_language_code"])
+            self._presets[key] = GameStateGenerationResponse.model_validate(
+                preset_data["situation"]
+            )
+
+
+async def generate_situation_presets(presets_dir: str = PRESETS_DIR) -> None:
+    """Generate all `SITUATION_PRESETS` and save them as JSON files."""
+    current_ai_priority.set(AIPriority.MAINTENANCE)
+    os.makedirs(presets_dir, exist_ok=True)
+    for preset in SITUATION_PRESETS.values():
+        game_state, npc_states, player_state = await generate_situation_from_description(
+            user_description=preset.description,
+            game_language_code=preset.game_language_code,
+        )
+        situation = GameStateGenerationResponse(
+            game_state=game_state, npc_states=npc_states, player_state=player_state
+        )
+        preset_data = {
+            "description": preset.description,
+            "game_language_code": preset.game_language_code,
+            "situation": situation.model_dump(mode="json"),
+        }
+        with open(os.path.join(presets_dir, f"{preset.name}.json"), "w", encoding="utf-8") as f:
+            json.dump(preset_data, f, ensure_ascii=False, indent=2)
+
+
+def _get_situation_key(description: str, game_language_code: str) -> tuple[str, str]:
+    return normalize_text(description), game_language_code
+
+
+def _copy_situation(
+    situation: GameStateGenerationResponse,
+) -> tuple[GameState, list[NPCState], PlayerState]:
+    situation = situation.model_copy(deep=True)
+    situation.game_state.session_id = str(uuid4())
+    return situation.game_state, situation.npc_states, situation.player_state
+
+
+situation_library = SituationLibrary(max_items=settings.SITUATION_LIBRARY_SIZE)
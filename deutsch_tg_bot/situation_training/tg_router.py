@@ -1,4 +1,8 @@
-from aiogram import F, Router
+import random
+
+import logfire
+from aiogram import F, Router, html
+from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (
@@ -6,14 +10,24 @@ from aiogram.types import (
     Message,
 )
 
+from deutsch_tg_bot.ai_scheduler import AIPriority, run_with_ai_priority
+from deutsch_tg_bot.config import settings
 from deutsch_tg_bot.deutsh_enums import DeutschLevel
-from deutsch_tg_bot.situation_training.ai.data_types import NPCResponse
-from deutsch_tg_bot.situation_training.ai.narrator_agent import get_narrator_response
+from deutsch_tg_bot.load_shedding import LoadLevel, load_shedder
+from deutsch_tg_bot.situation_training.ai.data_types import NarratorResponse
+from deutsch_tg_bot.situation_training.ai.grammar_checker import check_grammar
+from deutsch_tg_bot.situation_training.ai.narrator_agent import (
+    get_narrator_response,
+    get_speculative_narrator_response,
+    validate_speculative_narrator_response,
+)
 from deutsch_tg_bot.situation_training.ai.npc_agent import get_npc_reaction
-from deutsch_tg_bot.situation_training.ai.situation_generator import (
-    generate_situation_from_description,
+from deutsch_tg_bot.situation_training.situation_library import (
+    SITUATION_PRESETS,
+    situation_library,
 )
 from deutsch_tg_bot.tg_progress import progress
+from deutsch_tg_bot.tg_session_tasks import session_tasks
 from deutsch_tg_bot.user_session import SituationTrainingState
 
 
@@ -24,6 +38,8 @@ class SituationTraining(StatesGroup):
 
 router = Router()
 
+NARRATOR_TRIGGER_AFTER_PLAYER_MESSAGES = 3
+
 
 @router.callback_query(F.data == "select_training_type:situation")
 async def select_training_type(callback_query: CallbackQuery, state: FSMContext) -> None:
@@ -39,22 +55,14 @@ async def select_training_type(callback_query: CallbackQuery, state: FSMContext)
 async def describe_situation(message: Message, state: FSMContext) -> None:
     async with progress(message, "Створюю ситуацію"):
         assert message.text is not None
-        if message.text.strip() == "1":
-            description = """
-Я Нео на самому початку фільму Матриця.
-Я ще нічого не знаю про Матрицю, живу звичайним життям в місті, працюю програмістом.
-Я відчуваю, що щось не так з світом, але не можу зрозуміти що саме.
-Я відчуваю себе в пастці, як ніби я не на своєму місці.
-Я часто відчуваю тривогу і розгубленість через це.
-Я не знаю, що таке Матриця і що вона означає для мене.
-Пізній вечір, я в своїй квартирі, сиджу за комп'ютером і працюю над кодом.
-Тут в двері дзвонять. За дверима стоїть Морфеус.
-"""
+        situation_preset = SITUATION_PRESETS.get(message.text.strip())
+        if situation_preset is not None:
+            description = situation_preset.description
         else:
             description = message.text
 
-        game_state, npc_states, player_state = await generate_situation_from_description(
-            user_description=description,
+        game_state, npc_states, player_state = await situation_library.get_or_generate(
+            description=description,
             game_language_code="uk",
         )
 
@@ -76,23 +84,19 @@ async def describe_situation(message: Message, state: FSMContext) -> None:
             latest_player_action=latest_player_action,
         )
 
-    situation_training_state.messages_history.append(
-        {"sender": "narrator", "text": narrator_response.narrator_action}
-    )
+    situation_training_state.add_message("narrator", narrator_response.narrator_action)
     narrator_msg = f"📖 <i>{narrator_response.narrator_action}</i>"
     await message.answer(narrator_msg)
 
-    for npc_id in game_state.active_npcs:
+    for npc_id in load_shedder.cap_npcs(game_state.active_npcs):
         async with progress(message, f"{npc_id} думає..."):
             npc_response = await get_npc_reaction(
                 npc_id=npc_id,
                 situation_training_state=situation_training_state,
                 latest_player_action=latest_player_action,
             )
-        apply_npc_response_to_state(situation_training_state, npc_response)
-        situation_training_state.messages_history.append(
-            {"sender": npc_id, "text": npc_response.action_or_speech}
-        )
+        situation_training_state.npc_registry.apply_npc_response(npc_response)
+        situation_training_state.add_message(npc_id, npc_response.action_or_speech)
         npc_msg = f"<b>{npc_response.npc_id}:</b>\n{npc_response.action_or_speech}"
         await message.answer(npc_msg)
 
@@ -100,6 +104,21 @@ async def describe_situation(message: Message, state: FSMContext) -> None:
     await state.update_data(situation_training_state=situation_training_state)
 
 
+@router.message(SituationTraining.process_user_message, Command("grammar"))
+async def toggle_grammar_check(message: Message, state: FSMContext) -> None:
+    situation_training_state = await state.get_value("situation_training_state")
+    assert isinstance(situation_training_state, SituationTrainingState)
+
+    situation_training_state.grammar_check_enabled = (
+        not situation_training_state.grammar_check_enabled
+    )
+    if situation_training_state.grammar_check_enabled:
+        await message.answer("Перевірку граматики увімкнено. Вимкнути: /grammar")
+    else:
+        await message.answer("Перевірку граматики вимкнено. Увімкнути: /grammar")
+    await state.update_data(situation_training_state=situation_training_state)
+
+
 @router.message(SituationTraining.process_user_message)
 async def process_user_message(message: Message, state: FSMContext) -> None:
     """Handle user's message in roleplay and respond + check grammar."""
@@ -113,45 +132,139 @@ async def process_user_message(message: Message, state: FSMContext) -> None:
     assert message.text is not None
     latest_player_action = message.text
 
+    # Grammar is checked concurrently with narrator and NPCs, feedback is sent when ready
+    if should_check_grammar(situation_training_state, deutsch_level):
+        session_tasks.create_task(
+            message.chat.id,
+            send_grammar_feedback(
+                message,
+                user_text=latest_player_action,
+                level=deutsch_level,
+                situation_context=situation_training_state.game_state.situation_description,
+            ),
+            kind="grammar_check",
+        )
+
     # FIXME: Sometime user message should trigger narrator response.
     #        For example, if user makes some action and is exepcting some reaction from the world.
     if should_trigger_narrator(situation_training_state):
         async with progress(message, "Наратор думає..."):
-            narrator_response = await get_narrator_response(
-                situation_training_state=situation_training_state,
-                latest_player_action=latest_player_action,
+            narrator_response = await get_narrator_turn_response(
+                situation_training_state, latest_player_action
             )
 
-        situation_training_state.messages_history.append(
-            {"sender": "narrator", "text": narrator_response.narrator_action}
-        )
+        situation_training_state.add_message("narrator", narrator_response.narrator_action)
         narrator_msg = f"📖 <i>{narrator_response.narrator_action}</i>"
         await message.answer(narrator_msg)
 
-    for npc_id in situation_training_state.game_state.active_npcs:
+    for npc_id in load_shedder.cap_npcs(situation_training_state.game_state.active_npcs):
         async with progress(message, f"{npc_id} думає..."):
             npc_response = await get_npc_reaction(
                 npc_id=npc_id,
                 situation_training_state=situation_training_state,
                 latest_player_action=latest_player_action,
             )
-        apply_npc_response_to_state(situation_training_state, npc_response)
-        situation_training_state.messages_history.append(
-            {"sender": npc_id, "text": npc_response.action_or_speech}
-        )
+        situation_training_state.npc_registry.apply_npc_response(npc_response)
+        situation_training_state.add_message(npc_id, npc_response.action_or_speech)
         npc_msg = f"<b>{npc_response.npc_id}:</b>\n{npc_response.action_or_speech}"
         await message.answer(npc_msg)
 
-    situation_training_state.messages_history.append(
-        {"sender": "player", "text": latest_player_action}
-    )
+    situation_training_state.add_message("player", latest_player_action)
+
+    if (
+        settings.SPECULATIVE_NARRATOR_ENABLED
+        and not load_shedder.is_active(LoadLevel.NO_PREFETCH)
+        and is_narrator_triggered_next_turn(situation_training_state)
+    ):
+        situation_training_state.speculative_narrator_task = session_tasks.create_task(
+            message.chat.id,
+            run_with_ai_priority(
+                AIPriority.PREFETCH, get_speculative_narrator_response(situation_training_state)
+            ),
+            kind="speculative_narrator",
+        )
 
     await state.update_data(situation_training_state=situation_training_state)
 
 
+def should_check_grammar(
+    situation_training_state: SituationTrainingState, deutsch_level: DeutschLevel
+) -> bool:
+    """Grammar is checked for a level-dependent share of messages, to bound the cost."""
+    if not situation_training_state.grammar_check_enabled:
+        return False
+    sampling_rate = settings.GRAMMAR_CHECK_SAMPLING_RATES.get(deutsch_level, 1.0)
+    return random.random() < sampling_rate
+
+
+async def send_grammar_feedback(
+    message: Message, user_text: str, level: DeutschLevel, situation_context: str
+) -> None:
+    try:
+        grammar_check_result = await check_grammar(
+            user_text=user_text,
+            level=level,
+            situation_context=situation_context,
+        )
+    except Exception:
+        # Grammar feedback is optional, the roleplay turn must not fail because of it
+        logfire.exception("Grammar check failed")
+        return
+
+    if not grammar_check_result.has_errors:
+        return
+
+    feedback_message = "✍️ <b>Граматика</b>"
+    if grammar_check_result.brief_feedback:
+        feedback_message += f"\n{html.quote(grammar_check_result.brief_feedback)}"
+    if grammar_check_result.corrected_text:
+        feedback_message += (
+            f"\n\n<b>Правильно:</b> {html.code(html.quote(grammar_check_result.corrected_text))}"
+        )
+    await message.reply(feedback_message)
+
+
+async def get_narrator_turn_response(
+    situation_training_state: SituationTrainingState, latest_player_action: str
+) -> NarratorResponse:
+    """
+    Use the speculative narrator event if it's still consistent with the player's action,
+    after a cheap validation. Otherwise generate the event now.
+    """
+    speculative_task = situation_training_state.speculative_narrator_task
+    situation_training_state.speculative_narrator_task = None
+    # Cancelled e.g. by idle timeout of the session
+    if speculative_task is not None and not speculative_task.cancelled():
+        try:
+            narrator_response = await validate_speculative_narrator_response(
+                await speculative_task, latest_player_action
+            )
+        except Exception:
+            logfire.exception("Speculative narrator event failed")
+            narrator_response = None
+        if narrator_response is not None:
+            return narrator_response
+
+    return await get_narrator_response(
+        situation_training_state=situation_training_state,
+        latest_player_action=latest_player_action,
+    )
+
+
+def is_narrator_triggered_next_turn(
+    situation_training_state: SituationTrainingState,
+    trigger_after_player_messages: int = NARRATOR_TRIGGER_AFTER_PLAYER_MESSAGES,
+) -> bool:
+    return (
+        situation_training_state.player_message_count
+        + 1
+        - situation_training_state.last_narrator_event_index
+    ) >= trigger_after_player_messages
+
+
 def should_trigger_narrator(
     situation_training_state: SituationTrainingState,
-    trigger_after_player_messages: int = 3,
+    trigger_after_player_messages: int = NARRATOR_TRIGGER_AFTER_PLAYER_MESSAGES,
 ) -> bool:
     trigger_narrator = (
         situation_training_state.player_message_count
@@ -162,18 +275,3 @@ def should_trigger_narrator(
             situation_training_state.player_message_count
         )
     return trigger_narrator
-
-
-def apply_npc_response_to_state(
-    situation_training_state: SituationTrainingState, npc_response: NPCResponse
-) -> None:
-    npc = next(
-        (npc for npc in situation_training_state.npc_states if npc.npc_id == npc_response.npc_id),
-        None,
-    )
-    assert npc is not None, f"NPC with id {npc_response.npc_id} not found in the current game state"
-
-    if npc_response.mood_update:
-        npc.mood = npc_response.mood_update
-    if npc_response.learns_about_player:
-        npc.knows_about_player.extend(npc_response.learns_about_player)
@@ -0,0 +1,104 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+
+class ChatQueueMiddleware(BaseMiddleware):
+    """
+    Process updates of each chat one by one, so handlers of the same chat never run
+    concurrently and don't race on FSM state.
+
+    Text messages which arrive while a turn of the chat is in flight are coalesced:
+    they wait for the current turn, then for `debounce_seconds` more, and are handled
+    as a single message with joined text. Commands and other updates are never coalesced,
+    and they close the pending batch: later messages are handled after them, in order.
+
+    FSM state is resolved for the update before it gets here, so it's read again when
+    the turn of the update comes: the previous turn of the chat may have changed it.
+    """
+
+    def __init__(self, debounce_seconds: float = 1.0) -> None:
+        self._debounce_seconds = debounce_seconds
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._lock_users: dict[int, int] = {}
+        self._pending_messages: dict[int, list[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        chat_id = get_event_chat_id(event)
+        if chat_id is None:
+            return await handler(event, data)
+
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._lock_users[chat_id] = self._lock_users.get(chat_id, 0) + 1
+        try:
+            if not (isinstance(event, Message) and _is_coalescable(event)):
+                # Messages after this update must not join a batch handled before it
+                self._pending_messages.pop(chat_id, None)
+            elif lock.locked():
+                pending_messages = self._pending_messages.get(chat_id)
+                if pending_messages is not None:
+                    # Will be handled by the update which created the pending list
+                    pending_messages.append(event)
+                    return None
+
+                pending_messages = self._pending_messages[chat_id] = [event]
+                try:
+                    async with lock:
+                        await asyncio.sleep(self._debounce_seconds)
+                        self._close_pending_messages(chat_id, pending_messages)
+                        return await _handle(handler, _merge_messages(pending_messages), data)
+                finally:
+                    # Handling may be cancelled before the pending messages are taken
+                    self._close_pending_messages(chat_id, pending_messages)
+
+            async with lock:
+                return await _handle(handler, event, data)
+        finally:
+            self._lock_users[chat_id] -= 1
+            if self._lock_users[chat_id] == 0:
+                del self._lock_users[chat_id]
+                del self._locks[chat_id]
+
+    def _close_pending_messages(self, chat_id: int, pending_messages: list[Message]) -> None:
+        """Stop adding messages to the list, unless it was already closed by another update."""
+        if self._pending_messages.get(chat_id) is pending_messages:
+            del self._pending_messages[chat_id]
+
+
+async def _handle(
+    handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+    event: TelegramObject,
+    data: dict[str, Any],
+) -> Any:
+    state: FSMContext | None = data.get("state")
+    if state is not None:
+        data["raw_state"] = await state.get_state()
+    return await handler(event, data)
+
+
+def get_event_chat_id(event: TelegramObject) -> int | None:
+    if isinstance(event, Message):
+        return event.chat.id
+    if isinstance(event, CallbackQuery) and event.message is not None:
+        return event.message.chat.id
+    return None
+
+
+def _is_coalescable(message: Message) -> bool:
+    return message.text is not None and not message.text.startswith("/")
+
+
+def _merge_messages(messages: list[Message]) -> Message:
+    if len(messages) == 1:
+        return messages[0]
+    text = "\n".join(message.text for message in messages if message.text is not None)
+    return messages[0].model_copy(update={"text": text})
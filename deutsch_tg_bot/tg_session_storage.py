@@ -0,0 +1,182 @@
+"""FSM storage which keeps memory bounded: idle and least recently used sessions are evicted."""
+
+import asyncio
+import hashlib
+import os
+import pickle
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Any
+
+import logfire
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+
+@dataclass(slots=True)
+class SessionRecord:
+    data: dict[str, Any] = field(default_factory=dict)
+    state: str | None = None
+    last_access: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class SessionStorageStats:
+    evicted_idle: int = 0
+    evicted_lru: int = 0
+    spilled: int = 0
+    restored: int = 0
+
+
+class EvictingMemoryStorage(BaseStorage):
+    """
+    In-memory FSM storage with TTL and LRU eviction.
+
+    Sessions are kept in access order, so idle sessions are at the front and eviction
+    is amortized O(1). Sessions idle longer than `ttl_seconds` and least recently used
+    sessions above `max_sessions` are evicted. If `spill_dir` is set, evicted sessions
+    are pickled to disk and restored on the next access, otherwise they are dropped.
+    Transient fields of sessions, like running tasks and AI chats, are not pickled.
+    Sessions are pickled on the event loop, so the snapshot is consistent while handlers
+    and background tasks still change them. Files are written and read in worker threads.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 24 * 60 * 60,
+        max_sessions: int = 10_000,
+        spill_dir: str | None = None,
+    ) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._max_sessions = max_sessions
+        self._spill_dir = spill_dir
+        self._sessions: OrderedDict[StorageKey, SessionRecord] = OrderedDict()
+        self._spill_tasks: dict[StorageKey, asyncio.Task[None]] = {}
+        self._load_tasks: dict[StorageKey, asyncio.Task[None]] = {}
+        self.stats = SessionStorageStats()
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def close(self) -> None:
+        # Keep sessions between restarts if they can be spilled
+        if self._spill_dir is not None:
+            while self._sessions:
+                self._spill(*self._sessions.popitem(last=False))
+        await asyncio.gather(*self._spill_tasks.values())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        (await self._get_record(key)).state = state.state if isinstance(state, State) else state
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        (await self._get_record(key)).data = data.copy()
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._get_record(key)).data.copy()
+
+    async def get_value(
+        self,
+        storage_key: StorageKey,
+        dict_key: str,
+        default: Any | None = None,
+    ) -> Any | None:
+        # Not copied, unlike MemoryStorage: copy of a session drops its transient fields
+        return (await self._get_record(storage_key)).data.get(dict_key, default)
+
+    def evict_idle_sessions(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            key, record = next(iter(self._sessions.items()))
+            if now - record.last_access < self._ttl_seconds:
+                break
+            del self._sessions[key]
+            self.stats.evicted_idle += 1
+            self._spill(key, record)
+
+    async def _get_record(self, key: StorageKey) -> SessionRecord:
+        while (record := self._sessions.get(key)) is None:
+            load = self._load_tasks.get(key)
+            if load is None:
+                load = self._load_tasks[key] = asyncio.create_task(self._load(key))
+            # Concurrent updates of the session wait for the same load
+            await asyncio.shield(load)
+        self._sessions.move_to_end(key)
+        record.last_access = time.monotonic()
+        return record
+
+    async def _load(self, key: StorageKey) -> None:
+        try:
+            record = None
+            if self._spill_dir is not None:
+                # The session may still be written to disk after its eviction
+                if (spill := self._spill_tasks.get(key)) is not None:
+                    await spill
+                record = await asyncio.to_thread(self._read_spilled, key)
+            self.evict_idle_sessions()
+            self._sessions[key] = record or SessionRecord()
+            while len(self._sessions) > self._max_sessions:
+                self.stats.evicted_lru += 1
+                self._spill(*self._sessions.popitem(last=False))
+        finally:
+            del self._load_tasks[key]
+
+    def _spill(self, key: StorageKey, record: SessionRecord) -> None:
+        if self._spill_dir is None or (record.state is None and not record.data):
+            return
+        try:
+            pickled_record = pickle.dumps(
+                (record.state, record.data), protocol=pickle.HIGHEST_PROTOCOL
+            )
+        except Exception:
+            logfire.exception("Failed to spill session {key}", key=str(key))
+            return
+        spill = self._spill_tasks[key] = asyncio.create_task(
+            asyncio.to_thread(self._write_spilled, key, pickled_record)
+        )
+
+        def forget_spill(_: asyncio.Task[None]) -> None:
+            if self._spill_tasks.get(key) is spill:
+                del self._spill_tasks[key]
+
+        spill.add_done_callback(forget_spill)
+
+    def _write_spilled(self, key: StorageKey, pickled_record: bytes) -> None:
+        try:
+            with open(self._get_spill_path(key), "wb") as f:
+                f.write(pickled_record)
+        except Exception:
+            logfire.exception("Failed to spill session {key}", key=str(key))
+            return
+        self.stats.spilled += 1
+
+    def _read_spilled(self, key: StorageKey) -> SessionRecord | None:
+        path = self._get_spill_path(key)
+        try:
+            with open(path, "rb") as f:
+                state, data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logfire.exception("Failed to restore session {key}", key=str(key))
+            return None
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        self.stats.restored += 1
+        return SessionRecord(data=data, state=state)
+
+    def _get_spill_path(self, key: StorageKey) -> str:
+        assert self._spill_dir is not None
+        key_hash = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self._spill_dir, f"{key_hash}.pickle")
@@ -0,0 +1,155 @@
+"""Registry of in-flight and background work of each chat, so superseded AI calls are cancelled."""
+
+import asyncio
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable, Coroutine
+from dataclasses import dataclass, field
+from typing import Any
+
+import logfire
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from deutsch_tg_bot.ai_scheduler import current_chat_id
+from deutsch_tg_bot.tg_chat_queue import get_event_chat_id
+
+# Rough token usage of a cancelled task. Cancelled calls never report their usage,
+# so saved tokens are estimated from these numbers.
+ESTIMATED_TASK_TOKENS: dict[str, int] = {
+    "update": 3000,
+    "sentence_generation": 1500,
+    "grammar_check": 1000,
+    "speculative_narrator": 2500,
+}
+
+
+@dataclass
+class SessionTaskStats:
+    cancelled_tasks: Counter[str] = field(default_factory=Counter)  # by task kind
+    cancellations: Counter[str] = field(default_factory=Counter)  # by reason
+    estimated_saved_tokens: int = 0
+
+
+class SessionTaskRegistry:
+    """
+    Tasks of each chat: handlers of its updates and background AI calls, like sentence
+    prefetch and grammar check. Tasks are forgotten when done, so the registry only
+    keeps references to pending work.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: dict[int, dict[asyncio.Task[Any], str]] = {}
+        self._last_activity: dict[int, float] = {}
+        self.stats = SessionTaskStats()
+
+    def create_task[T](
+        self, chat_id: int, coro: Coroutine[Any, Any, T], kind: str
+    ) -> asyncio.Task[T]:
+        task = asyncio.create_task(coro)
+        self.track(chat_id, task, kind)
+        return task
+
+    def track(self, chat_id: int, task: asyncio.Task[Any], kind: str) -> None:
+        self._tasks.setdefault(chat_id, {})[task] = kind
+        task.add_done_callback(lambda task: self._discard(chat_id, task))
+
+    def touch(self, chat_id: int) -> None:
+        self._last_activity[chat_id] = time.monotonic()
+
+    def cancel_chat_tasks(self, chat_id: int, reason: str) -> int:
+        """Cancel all pending tasks of the chat, except the current one."""
+        current_task = asyncio.current_task()
+        cancelled_kinds: list[str] = []
+        for task, kind in list(self._tasks.get(chat_id, {}).items()):
+            if task is current_task or task.done() or task.cancelling():
+                continue
+            task.cancel()
+            cancelled_kinds.append(kind)
+
+        if cancelled_kinds:
+            self.stats.cancellations[reason] += 1
+            self.stats.cancelled_tasks.update(cancelled_kinds)
+            self.stats.estimated_saved_tokens += sum(
+                ESTIMATED_TASK_TOKENS.get(kind, 0) for kind in cancelled_kinds
+            )
+            logfire.info(
+                "Cancelled {tasks_number} tasks of chat {chat_id} on {reason}",
+                tasks_number=len(cancelled_kinds),
+                chat_id=chat_id,
+                reason=reason,
+                cancelled_kinds=cancelled_kinds,
+                total_cancelled_tasks=self.stats.cancelled_tasks.total(),
+                estimated_saved_tokens=self.stats.estimated_saved_tokens,
+            )
+        return len(cancelled_kinds)
+
+    def cancel_idle_chats(self, idle_seconds: float) -> None:
+        now = time.monotonic()
+        for chat_id, last_activity in list(self._last_activity.items()):
+            if now - last_activity >= idle_seconds:
+                del self._last_activity[chat_id]
+                self.cancel_chat_tasks(chat_id, "idle")
+
+    async def run_idle_watchdog(
+        self,
+        idle_seconds: float,
+        check_interval: float,
+        on_check: Callable[[], None] | None = None,
+    ) -> None:
+        """Cancel tasks of idle chats periodically, `on_check` runs on each check as well."""
+        while True:
+            await asyncio.sleep(check_interval)
+            self.cancel_idle_chats(idle_seconds)
+            if on_check is not None:
+                on_check()
+
+    def _discard(self, chat_id: int, task: asyncio.Task[Any]) -> None:
+        chat_tasks = self._tasks.get(chat_id)
+        if chat_tasks is None:
+            return
+        chat_tasks.pop(task, None)
+        if not chat_tasks:
+            del self._tasks[chat_id]
+
+
+class SessionTaskMiddleware(BaseMiddleware):
+    """
+    Track handling of each update as in-flight work of its chat.
+    Updates which start a new session cancel the work of the previous one. Must be
+    registered before `ChatQueueMiddleware`, so cancellation doesn't wait in the queue.
+    """
+
+    def __init__(self, registry: SessionTaskRegistry) -> None:
+        self._registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        chat_id = get_event_chat_id(event)
+        current_task = asyncio.current_task()
+        if chat_id is None or current_task is None:
+            return await handler(event, data)
+
+        # AI calls of the update and of tasks it starts are queued as calls of the chat
+        current_chat_id.set(chat_id)
+        self._registry.touch(chat_id)
+        session_reset_reason = get_session_reset_reason(event)
+        if session_reset_reason is not None:
+            self._registry.cancel_chat_tasks(chat_id, session_reset_reason)
+        self._registry.track(chat_id, current_task, "update")
+        return await handler(event, data)
+
+
+def get_session_reset_reason(event: TelegramObject) -> str | None:
+    if isinstance(event, Message) and event.text is not None and event.text.startswith("/start"):
+        return "restart"
+    if isinstance(event, CallbackQuery) and (event.data or "").startswith("select_training_type:"):
+        return "training_type_switch"
+    return None
+
+
+session_tasks = SessionTaskRegistry()
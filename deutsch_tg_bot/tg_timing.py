@@ -0,0 +1,274 @@
+"""
+Time breakdown of update handling by stage: FSM storage, AI calls, Bot API calls and
+local CPU of the handler, which is the time not attributed to any other stage.
+"""
+
+import asyncio
+import json
+import time
+from collections import defaultdict, deque
+from collections.abc import Awaitable, Callable, Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, TextIO
+
+import logfire
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+from rich import print as rprint
+from rich.table import Table
+
+from deutsch_tg_bot.tg_chat_queue import get_event_chat_id
+from deutsch_tg_bot.utils.stats import percentile
+
+HANDLER_CPU_STAGE = "handler_cpu"
+TOTAL_STAGE = "total"
+
+
+@dataclass
+class _StageFrame:
+    """Active stage. Time of nested stages is attributed to them, not to the parent."""
+
+    name: str
+    nested_seconds: float = 0.0
+
+
+@dataclass
+class UpdateTimer:
+    """Stage times of one update. Tasks started by the handler share the timer."""
+
+    start_time: float = field(default_factory=time.perf_counter)
+    handler_name: str = "unhandled"
+    update_id: int | None = None
+    stage_seconds: defaultdict[str, float] = field(default_factory=lambda: defaultdict(float))
+    stage_calls: defaultdict[str, int] = field(default_factory=lambda: defaultdict(int))
+    is_finished: bool = False
+
+    def add(self, stage: str, seconds: float) -> None:
+        # Background tasks of the handler may outlive the update
+        if self.is_finished:
+            return
+        self.stage_seconds[stage] += seconds
+        self.stage_calls[stage] += 1
+
+    def finish(self) -> float:
+        total_seconds = time.perf_counter() - self.start_time
+        # Concurrent stages may overlap, so their sum can exceed the total time
+        self.stage_seconds[HANDLER_CPU_STAGE] = max(
+            0.0, total_seconds - sum(self.stage_seconds.values())
+        )
+        self.is_finished = True
+        return total_seconds
+
+
+_current_update_timer: ContextVar[UpdateTimer | None] = ContextVar(
+    "current_update_timer", default=None
+)
+_current_stage: ContextVar[_StageFrame | None] = ContextVar("current_stage", default=None)
+
+
+def get_current_update_id() -> int | None:
+    """Id of the Telegram update handled in the current context, if any."""
+    update_timer = _current_update_timer.get()
+    return None if update_timer is None else update_timer.update_id
+
+
+@contextmanager
+def timed_stage(name: str) -> Iterator[None]:
+    """Attribute the time of the block to the stage of the current update, if any."""
+    update_timer = _current_update_timer.get()
+    if update_timer is None:
+        yield
+        return
+
+    parent_frame = _current_stage.get()
+    frame = _StageFrame(name)
+    token = _current_stage.set(frame)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start_time
+        _current_stage.reset(token)
+        if parent_frame is not None:
+            parent_frame.nested_seconds += seconds
+        update_timer.add(name, max(0.0, seconds - frame.nested_seconds))
+
+
+class UpdateTimingStats:
+    """Recent stage times of each handler and optional JSON lines traces of updates."""
+
+    def __init__(self, samples_limit: int = 1000, trace_path: str | None = None) -> None:
+        self._samples_limit = samples_limit
+        self._samples: dict[str, dict[str, deque[float]]] = {}
+        self._updates_number: defaultdict[str, int] = defaultdict(int)
+        self._trace_path = trace_path
+        self._trace_file: TextIO | None = None
+
+    def record(self, update_timer: UpdateTimer, total_seconds: float, chat_id: int | None) -> None:
+        handler_name = update_timer.handler_name
+        self._updates_number[handler_name] += 1
+        handler_samples = self._samples.setdefault(handler_name, {})
+        for stage, seconds in [(TOTAL_STAGE, total_seconds), *update_timer.stage_seconds.items()]:
+            stage_samples = handler_samples.get(stage)
+            if stage_samples is None:
+                stage_samples = handler_samples[stage] = deque(maxlen=self._samples_limit)
+            stage_samples.append(seconds)
+
+        if self._trace_path is not None:
+            if self._trace_file is None:
+                self._trace_file = open(self._trace_path, "a", encoding="utf-8")
+            trace = {
+                "timestamp": time.time(),
+                "handler": handler_name,
+                "chat_id": chat_id,
+                "total_seconds": total_seconds,
+                "stage_seconds": update_timer.stage_seconds,
+                "stage_calls": update_timer.stage_calls,
+            }
+            self._trace_file.write(json.dumps(trace) + "\n")
+            self._trace_file.flush()
+
+    def render_tables(self) -> list[Table]:
+        """Table of stage time percentiles for each handler, stages ordered by total time."""
+        tables = []
+        for handler_name, handler_samples in sorted(self._samples.items()):
+            table = Table(title=f"{handler_name} ({self._updates_number[handler_name]} updates)")
+            for column in ("Stage", "Samples", "p50", "p90", "p99", "Share"):
+                table.add_column(column, justify="left" if column == "Stage" else "right")
+            total_seconds = sum(handler_samples[TOTAL_STAGE]) or 1.0
+            stages = sorted(handler_samples.items(), key=lambda item: -sum(item[1]))
+            for stage, samples in stages:
+                table.add_row(
+                    stage,
+                    str(len(samples)),
+                    *[f"{percentile(samples, q) * 1000:.1f}ms" for q in (50, 90, 99)],
+                    "" if stage == TOTAL_STAGE else f"{sum(samples) / total_seconds:.0%}",
+                )
+            tables.append(table)
+        return tables
+
+    def print_tables(self) -> None:
+        for table in self.render_tables():
+            rprint(table)
+
+    def close(self) -> None:
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    """
+    Open a span and a stage timer for each update. Register it as an outer middleware
+    to time the whole handling, and as an inner one to know the name of the handler.
+    """
+
+    def __init__(self, stats: UpdateTimingStats) -> None:
+        self._stats = stats
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        update_timer = _current_update_timer.get()
+        if update_timer is not None:
+            # Inner call, the handler is selected
+            handler_object = data.get("handler")
+            if isinstance(handler_object, HandlerObject):
+                update_timer.handler_name = handler_object.callback.__name__
+            return await handler(event, data)
+
+        event_update = data.get("event_update")
+        update_id = event_update.update_id if isinstance(event_update, Update) else None
+        update_timer = UpdateTimer(update_id=update_id)
+        token = _current_update_timer.set(update_timer)
+        chat_id = get_event_chat_id(event)
+        with logfire.span(
+            "Update {event_type}",
+            event_type=type(event).__name__,
+            chat_id=chat_id,
+            update_id=update_id,
+        ) as span:
+            try:
+                return await handler(event, data)
+            finally:
+                _current_update_timer.reset(token)
+                total_seconds = update_timer.finish()
+                span.set_attributes(
+                    {
+                        "handler": update_timer.handler_name,
+                        "stage_seconds": dict(update_timer.stage_seconds),
+                        "stage_calls": dict(update_timer.stage_calls),
+                    }
+                )
+                self._stats.record(update_timer, total_seconds, chat_id)
+
+
+class TimedRequestMiddleware(BaseRequestMiddleware):
+    """Attribute Bot API calls to a stage of each method."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        with timed_stage(f"bot:{type(method).__name__}"):
+            return await make_request(bot, method)
+
+
+class TimedStorage(BaseStorage):
+    """FSM storage wrapper which attributes reads and writes to storage stages."""
+
+    def __init__(self, storage: BaseStorage) -> None:
+        self.storage = storage
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        with timed_stage("storage_update"):
+            await self.storage.set_state(key, state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        with timed_stage("storage_get"):
+            return await self.storage.get_state(key)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        with timed_stage("storage_update"):
+            await self.storage.set_data(key, data)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        with timed_stage("storage_get"):
+            return await self.storage.get_data(key)
+
+    async def get_value(
+        self,
+        storage_key: StorageKey,
+        dict_key: str,
+        default: Any | None = None,
+    ) -> Any | None:
+        with timed_stage("storage_get"):
+            return await self.storage.get_value(storage_key, dict_key, default)
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        with timed_stage("storage_update"):
+            return await self.storage.update_data(key, data)
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+async def run_timing_report_loop(stats: UpdateTimingStats, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        stats.print_tables()
@@ -12,8 +12,12 @@ from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.pretty import Pretty
 
+from deutsch_tg_bot.ai_modes import get_ai_call_config
+from deutsch_tg_bot.ai_scheduler import ai_scheduler
+from deutsch_tg_bot.ai_tracing import get_prompt_version
 from deutsch_tg_bot.config import settings
 from deutsch_tg_bot.data_types import Sentence
+from deutsch_tg_bot.deutsh_enums import AICallType
 from deutsch_tg_bot.translation_training.ai.translation_evaluation import (
     TranslationEvaluationResult,
 )
@@ -48,8 +52,22 @@ async def answer_question_with_ai(
     if genai_chat is None:
         genai_chat = genai_client.chats.create(model=GOOGLE_MODEL)
 
-    start_time = time.time()
-    response = await genai_chat.send_message(answer_question_pompt)
+    ai_call_config = get_ai_call_config(AICallType.QUESTION_ANSWERING)
+    async with ai_scheduler.slot(
+        GOOGLE_MODEL,
+        AICallType.QUESTION_ANSWERING,
+        mode=ai_call_config.mode,
+        prompt_version=get_prompt_version(get_answer_question_prompt_template()),
+    ) as ai_call_slot:
+        start_time = time.time()
+        response = await genai_chat.send_message(
+            answer_question_pompt,
+            config=genai.types.GenerateContentConfig(
+                thinking_config=ai_call_config.get_thinking_config(),
+                max_output_tokens=ai_call_config.max_output_tokens,
+            ),
+        )
+        ai_call_slot.trace.record_genai_usage(response.usage_metadata)
 
     usage = response.usage_metadata
     ai_response = (response.text or "").strip()
@@ -58,7 +76,9 @@ async def answer_question_with_ai(
         Panel(
             Markdown(
                 f"- Model: {genai_chat._model}\n"
-                f"- Time taken: {time.time() - start_time:.2f} seconds\n",
+                f"- Time taken: {time.time() - start_time:.2f} seconds\n"
+                f"- Queue wait: {ai_call_slot.queue_wait_seconds:.2f} seconds\n"
+                f"- Mode: {ai_call_config.mode.value}\n",
             )
         )
     ]
@@ -4,25 +4,35 @@ import os
 import random
 import re
 import time
+from collections.abc import Iterable
 from functools import cache
 from itertools import cycle
 from typing import TypedDict
 
 from google import genai
 from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
 from rich import print as rprint
 from rich.console import Group
 from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.pretty import Pretty
 
+from deutsch_tg_bot.ai_modes import FAST_MODE_PROMPT_NOTE, get_ai_call_config
+from deutsch_tg_bot.ai_scheduler import ai_scheduler
+from deutsch_tg_bot.ai_tracing import get_prompt_version
 from deutsch_tg_bot.config import settings
-from deutsch_tg_bot.data_types import Sentence
+from deutsch_tg_bot.data_types import Sentence, SentenceSpec
 from deutsch_tg_bot.deutsh_enums import (
+    DEUTCH_LEVEL_TENSES,
+    AICallType,
     DeutschLevel,
     DeutschTense,
     SentenceType,
+    SentenceTypeProbabilities,
 )
+from deutsch_tg_bot.load_shedding import load_shedder
+from deutsch_tg_bot.translation_training.sentence_spec_selection import SentenceSpecSelector
 from deutsch_tg_bot.utils.prompt_utils import (
     load_prompt_template_from_file,
     replace_promt_placeholder,
@@ -54,6 +64,11 @@ class GenerateSentenceResponse(BaseModel):
     )
 
 
+class FastGenerateSentenceResponse(GenerateSentenceResponse):
+    # Fast mode schema: planning is not written by the model
+    planning: SkipJsonSchema[str] = ""
+
+
 class SentenceGeneratorParams(TypedDict):
     level: DeutschLevel
     tense: DeutschTense
@@ -66,29 +81,47 @@ class SentenceGeneratorParams(TypedDict):
 
 async def generate_sentence_with_ai(user_prompt_params: SentenceGeneratorParams) -> Sentence:
     sentence_generator_prompt = get_sentence_generator_prompt() % user_prompt_params
-
-    start_time = time.time()
-    response = await genai_client.models.generate_content(
-        model=GOOGLE_MODEL,
-        config=genai.types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_json_schema=GenerateSentenceResponse.model_json_schema(),
-            temperature=0.7,
-        ),
-        contents=sentence_generator_prompt,
-    )
+    ai_call_config = get_ai_call_config(AICallType.SENTENCE_GENERATION)
+    response_type = GenerateSentenceResponse
+    if ai_call_config.is_fast:
+        response_type = FastGenerateSentenceResponse
+        sentence_generator_prompt += FAST_MODE_PROMPT_NOTE
+
+    model = load_shedder.get_model(GOOGLE_MODEL)
+
+    async with ai_scheduler.slot(
+        model,
+        AICallType.SENTENCE_GENERATION,
+        mode=ai_call_config.mode,
+        prompt_version=get_sentence_generator_prompt_version(),
+    ) as ai_call_slot:
+        start_time = time.time()
+        response = await genai_client.models.generate_content(
+            model=model,
+            config=genai.types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_json_schema=response_type.model_json_schema(),
+                temperature=0.7,
+                thinking_config=ai_call_config.get_thinking_config(),
+                max_output_tokens=ai_call_config.max_output_tokens,
+            ),
+            contents=sentence_generator_prompt,
+        )
+        ai_call_slot.trace.record_genai_usage(response.usage_metadata)
 
     usage = response.usage_metadata
-    generate_sentence_response = GenerateSentenceResponse.model_validate_json(response.text or "")
+    generate_sentence_response = response_type.model_validate_json(response.text or "")
 
     _times.append(time.time() - start_time)
     average_time = sum(_times) / len(_times)
     group_panels = [
         Panel(
             Markdown(
-                f"- Model: {GOOGLE_MODEL}\n"
+                f"- Model: {model}\n"
                 f"- Time taken: {_times[0]:.2f} seconds\n"
-                f"- Average time: {average_time:.2f} seconds\n",
+                f"- Average time: {average_time:.2f} seconds\n"
+                f"- Queue wait: {ai_call_slot.queue_wait_seconds:.2f} seconds\n"
+                f"- Mode: {ai_call_config.mode.value}\n",
             )
         ),
         Panel(Pretty(user_prompt_params, expand_all=True), title="Prompt Parameters"),
@@ -112,13 +145,12 @@ async def generate_sentence_with_ai(user_prompt_params: SentenceGeneratorParams)
         german_sentence=generate_sentence_response.german_reference,
         tense=user_prompt_params["tense"],
         level=user_prompt_params["level"],
+        theme=user_prompt_params["sentence_theme_topic"],
     )
 
 
 def get_sentence_generator_params(
-    level: DeutschLevel,
-    tense: DeutschTense,
-    sentence_type: SentenceType,
+    sentence_spec: SentenceSpec,
     sentences_history: list[Sentence],
     optional_constraint: str | None = None,
     recent_sentences_count: int = 3,
@@ -128,9 +160,9 @@ def get_sentence_generator_params(
     ]
 
     user_prompt_params: SentenceGeneratorParams = {
-        "level": level,
-        "tense": tense,
-        "sentence_type": sentence_type,
+        "level": sentence_spec.level,
+        "tense": sentence_spec.tense,
+        "sentence_type": sentence_spec.sentence_type,
         "optional_constraint": optional_constraint,
         "recent_sentences": "\n".join(recent_sentences),
         "sentence_theme": None,
@@ -138,16 +170,34 @@ def get_sentence_generator_params(
     }
 
     if optional_constraint is None:
-        user_prompt_params["sentence_theme_topic"], user_prompt_params["sentence_theme"] = (
-            get_random_sentence_theme()
-        )
+        if sentence_spec.theme is None:
+            theme_key, theme = get_random_sentence_theme()
+        else:
+            theme_key, theme = sentence_spec.theme, get_sentence_themes()[sentence_spec.theme]
+        user_prompt_params["sentence_theme_topic"] = theme_key
+        user_prompt_params["sentence_theme"] = theme
     return user_prompt_params
 
 
+def create_sentence_spec_selector(
+    levels: Iterable[DeutschLevel],
+    seed: int | None = None,
+) -> SentenceSpecSelector:
+    """
+    Tenses are limited to the ones of each level, sentence types are weighted
+    by `SentenceTypeProbabilities`.
+    """
+    return SentenceSpecSelector(
+        level_tenses={level: DEUTCH_LEVEL_TENSES[level] for level in levels},
+        sentence_type_weights=SentenceTypeProbabilities,
+        themes=get_sentence_theme_keys(),
+        seed=seed,
+    )
+
+
 def get_random_sentence_theme() -> tuple[str, str]:
-    sentence_themes = get_sentence_themes()
-    key = random.choice(list(sentence_themes.keys()))
-    return key, sentence_themes[key]
+    key = random.choice(get_sentence_theme_keys())
+    return key, get_sentence_themes()[key]
 
 
 @cache
@@ -157,9 +207,21 @@ def get_sentence_generator_prompt() -> str:
     )
 
 
+@cache
+def get_sentence_generator_prompt_version() -> str:
+    """Version of sentence generation prompt, to distinguish sentences in the corpus"""
+    prompt = get_sentence_generator_prompt() + get_sentence_themes_prompt()
+    return get_prompt_version(prompt)
+
+
+@cache
+def get_sentence_themes_prompt() -> str:
+    return load_prompt_template_from_file(PROMPTS_DIR, "sentence_themes.txt")
+
+
 @cache
 def get_sentence_themes() -> dict[str, str]:
-    sentence_themes_str = load_prompt_template_from_file(PROMPTS_DIR, "sentence_themes.txt")
+    sentence_themes_str = get_sentence_themes_prompt()
     sentence_themes_list = sentence_themes_str.split("\n\n")
     sentence_themes_list = [s.strip() for s in sentence_themes_list if s.strip()]
     key_parser_re = re.compile(r"^\*\*(.+?)\*\*")
@@ -172,6 +234,11 @@ def get_sentence_themes() -> dict[str, str]:
     return sentence_themes_dict
 
 
+@cache
+def get_sentence_theme_keys() -> tuple[str, ...]:
+    return tuple(get_sentence_themes())
+
+
 def get_mocked_sentence(user_prompt_params: SentenceGeneratorParams) -> Sentence:
     ukrainian_sentence = next(mocked_ukrainian_sentences)
     german_sentence = next(mocked_german_sentences)
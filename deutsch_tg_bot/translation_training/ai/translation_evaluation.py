@@ -2,22 +2,30 @@
 
 import os
 import time
+from collections.abc import AsyncIterator
 from functools import cache
 
 from google import genai
 from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
 from rich import print as rprint
 from rich.console import Group
 from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.pretty import Pretty
 
+from deutsch_tg_bot.ai_modes import FAST_MODE_PROMPT_NOTE, get_ai_call_config
+from deutsch_tg_bot.ai_scheduler import ai_scheduler
+from deutsch_tg_bot.ai_tracing import get_prompt_version
 from deutsch_tg_bot.config import settings
 from deutsch_tg_bot.data_types import Sentence
+from deutsch_tg_bot.deutsh_enums import AICallType, DeutschLevel
+from deutsch_tg_bot.load_shedding import load_shedder
 from deutsch_tg_bot.utils.prompt_utils import (
     load_prompt_template_from_file,
     replace_promt_placeholder,
 )
+from deutsch_tg_bot.utils.streaming_json import FieldCallback, stream_json_fields
 
 genai_client = genai.Client(api_key=settings.GOOGLE_API_KEY).aio
 
@@ -39,10 +47,32 @@ class TranslationEvaluationResult(BaseModel):
     )
 
 
+class FastTranslationEvaluationResult(TranslationEvaluationResult):
+    # Fast mode schema: planning is not written by the model
+    planning: SkipJsonSchema[str] = ""
+
+
+class BatchTranslationEvaluationResult(BaseModel):
+    results: list[TranslationEvaluationResult] = Field(
+        description="Evaluation of each exam item, in the order of the exam items."
+    )
+
+
+class FastBatchTranslationEvaluationResult(BaseModel):
+    results: list[FastTranslationEvaluationResult] = Field(
+        description="Evaluation of each exam item, in the order of the exam items."
+    )
+
+
 async def evaluate_translation_with_ai(
     sentence: Sentence,
     user_translation: str,
+    on_field: FieldCallback | None = None,
 ) -> TranslationEvaluationResult:
+    """
+    Response is streamed. `on_field` is called with each field of the result
+    as soon as it is generated, e.g. to show the verdict before the explanation.
+    """
     prompt_params = {
         "ukrainian_sentence": sentence.ukrainian_sentence,
         "level": sentence.level.value,
@@ -50,26 +80,47 @@ async def evaluate_translation_with_ai(
         "user_translation": user_translation,
     }
     evaluate_prompt = get_translation_evaluation_prompt_template() % prompt_params
+    ai_call_config = get_ai_call_config(AICallType.TRANSLATION_EVALUATION)
+    response_type = TranslationEvaluationResult
+    if ai_call_config.is_fast:
+        response_type = FastTranslationEvaluationResult
+        evaluate_prompt += FAST_MODE_PROMPT_NOTE
+
+    model = load_shedder.get_model(GOOGLE_MODEL)
+
+    async with ai_scheduler.slot(
+        model,
+        AICallType.TRANSLATION_EVALUATION,
+        mode=ai_call_config.mode,
+        prompt_version=get_prompt_version(get_translation_evaluation_prompt_template()),
+    ) as ai_call_slot:
+        start_time = time.time()
+        response_stream = await genai_client.models.generate_content_stream(
+            model=model,
+            config=genai.types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_json_schema=response_type.model_json_schema(),
+                thinking_config=ai_call_config.get_thinking_config(),
+                max_output_tokens=ai_call_config.max_output_tokens,
+            ),
+            contents=evaluate_prompt,
+        )
+        response_chunks: list[genai.types.GenerateContentResponse] = []
+        response_text = await stream_json_fields(
+            _iter_response_text(response_stream, response_chunks), on_field or _ignore_field
+        )
+        # Usage is reported in the last chunk of the stream
+        usage = response_chunks[-1].usage_metadata if response_chunks else None
+        ai_call_slot.trace.record_genai_usage(usage)
 
-    start_time = time.time()
-    response = await genai_client.models.generate_content(
-        model=GOOGLE_MODEL,
-        config=genai.types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_json_schema=TranslationEvaluationResult.model_json_schema(),
-        ),
-        contents=evaluate_prompt,
-    )
-
-    usage = response.usage_metadata
-    evaluate_translate_response = TranslationEvaluationResult.model_validate_json(
-        response.text or ""
-    )
+    evaluate_translate_response = response_type.model_validate_json(response_text)
 
     group_panels = [
         Panel(
             Markdown(
-                f"- Model: {GOOGLE_MODEL}\n- Time taken: {time.time() - start_time:.2f} seconds\n"
+                f"- Model: {model}\n- Time taken: {time.time() - start_time:.2f} seconds\n"
+                f"- Queue wait: {ai_call_slot.queue_wait_seconds:.2f} seconds\n"
+                f"- Mode: {ai_call_config.mode.value}\n"
             )
         ),
         Panel(Pretty(prompt_params, expand_all=True), title="Prompt Parameters"),
@@ -89,6 +140,109 @@ async def evaluate_translation_with_ai(
     return evaluate_translate_response
 
 
+async def evaluate_translations_batch_with_ai(
+    level: DeutschLevel,
+    sentences_with_translations: list[tuple[Sentence, str]],
+) -> list[TranslationEvaluationResult]:
+    """Evaluate translations of an exam in one call, so the long prompt is sent once."""
+    exam_items = "\n".join(
+        f'<exam_item index="{index}">\n'
+        f"<ukrainian_sentence>{sentence.ukrainian_sentence}</ukrainian_sentence>\n"
+        f"<user_translation>{user_translation}</user_translation>\n"
+        f"<target_tense>{sentence.tense.value}</target_tense>\n"
+        "</exam_item>"
+        for index, (sentence, user_translation) in enumerate(sentences_with_translations, 1)
+    )
+    evaluate_prompt = get_batch_translation_evaluation_prompt_template() % {
+        "level": level.value,
+        "exam_items": exam_items,
+    }
+    ai_call_config = get_ai_call_config(AICallType.EXAM_EVALUATION)
+    response_type: type[BatchTranslationEvaluationResult | FastBatchTranslationEvaluationResult]
+    response_type = BatchTranslationEvaluationResult
+    if ai_call_config.is_fast:
+        response_type = FastBatchTranslationEvaluationResult
+        evaluate_prompt += FAST_MODE_PROMPT_NOTE
+
+    model = load_shedder.get_model(GOOGLE_MODEL)
+
+    async with ai_scheduler.slot(
+        model,
+        AICallType.EXAM_EVALUATION,
+        mode=ai_call_config.mode,
+        prompt_version=get_prompt_version(get_batch_translation_evaluation_prompt_template()),
+    ) as ai_call_slot:
+        start_time = time.time()
+        response = await genai_client.models.generate_content(
+            model=model,
+            config=genai.types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_json_schema=response_type.model_json_schema(),
+                thinking_config=ai_call_config.get_thinking_config(),
+                max_output_tokens=ai_call_config.max_output_tokens,
+            ),
+            contents=evaluate_prompt,
+        )
+        ai_call_slot.trace.record_genai_usage(response.usage_metadata)
+
+    usage = response.usage_metadata
+    batch_result = response_type.model_validate_json(response.text or "")
+    if len(batch_result.results) != len(sentences_with_translations):
+        raise ValueError(
+            f"Expected {len(sentences_with_translations)} evaluation results,"
+            f" got {len(batch_result.results)}"
+        )
+
+    group_panels = [
+        Panel(
+            Markdown(
+                f"- Model: {model}\n- Time taken: {time.time() - start_time:.2f} seconds\n"
+                f"- Queue wait: {ai_call_slot.queue_wait_seconds:.2f} seconds\n"
+                f"- Exam items: {len(sentences_with_translations)}\n"
+                f"- Mode: {ai_call_config.mode.value}\n"
+            )
+        ),
+    ]
+    if settings.SHOW_TOCKENS_USAGE:
+        group_panels.append(Panel(Pretty(usage, expand_all=True), title="AI Usage"))
+
+    if settings.SHOW_FULL_AI_RESPONSE:
+        group_panels.append(Panel(Pretty(batch_result, expand_all=True), title="Full AI Response"))
+
+    rprint(Panel(Group(*group_panels), title="Batch Translation Evaluation", border_style="blue"))
+    return list(batch_result.results)
+
+
+async def _iter_response_text(
+    response_stream: AsyncIterator[genai.types.GenerateContentResponse],
+    response_chunks: list[genai.types.GenerateContentResponse],
+) -> AsyncIterator[str]:
+    async for chunk in response_stream:
+        response_chunks.append(chunk)
+        if chunk.text:
+            yield chunk.text
+
+
+async def _ignore_field(name: str, value: object) -> None:
+    pass
+
+
+@cache
+def get_batch_translation_evaluation_prompt_template() -> str:
+    """Single translation prompt, with per-sentence inputs moved to the list of exam items."""
+    prompt = load_prompt_template_from_file(PROMPTS_DIR, "translation_evaluation.txt")
+    for placeholder, exam_item_tag in (
+        ("ukrainian_sentence", "ukrainian_sentence"),
+        ("user_translation", "user_translation"),
+        ("tense", "target_tense"),
+    ):
+        prompt = prompt.replace(
+            f"{{{{{placeholder}}}}}", f"See <{exam_item_tag}> of each exam item below."
+        )
+    prompt += load_prompt_template_from_file(PROMPTS_DIR, "translation_evaluation_batch.txt")
+    return replace_promt_placeholder(prompt)
+
+
 @cache
 def get_translation_evaluation_prompt_template() -> str:
     return replace_promt_placeholder(
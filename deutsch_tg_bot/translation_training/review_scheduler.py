@@ -0,0 +1,93 @@
+"""Spaced repetition of sentences which the user translated incorrectly."""
+
+import heapq
+from dataclasses import dataclass, replace
+
+from deutsch_tg_bot.data_types import Sentence
+
+CORRECT_ANSWER_QUALITY = 4
+INCORRECT_ANSWER_QUALITY = 2
+MIN_EASINESS = 1.3
+
+
+@dataclass
+class ReviewItem:
+    sentence: Sentence
+    due_step: int = 0
+    interval: int = 0
+    repetitions: int = 0
+    easiness: float = 2.5
+
+    def get_sentence_to_review(self) -> Sentence:
+        return replace(self.sentence, is_translation_correct=None)
+
+
+class ReviewScheduler:
+    """
+    SM-2 scheduler over sentences with mistakes.
+
+    Intervals are counted in served sentences (steps) instead of days,
+    so mistakes come back within a training session. Due items are kept in a heap
+    ordered by due step, and at most one review is served every `interleave_every` steps,
+    so reviews are interleaved with new sentences.
+    """
+
+    def __init__(
+        self,
+        first_interval: int = 3,
+        second_interval: int = 8,
+        interleave_every: int = 2,
+    ) -> None:
+        self._first_interval = first_interval
+        self._second_interval = second_interval
+        self._interleave_every = interleave_every
+        self._queue: list[tuple[int, int, ReviewItem]] = []
+        self._pushed_items_number = 0
+        self._step = 0
+        self._last_review_step: int | None = None
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def advance(self) -> None:
+        """Call each time a sentence is served to the user."""
+        self._step += 1
+
+    def pop_due_review(self) -> ReviewItem | None:
+        if not self._queue or self._queue[0][0] > self._step:
+            return None
+        if (
+            self._last_review_step is not None
+            and self._step - self._last_review_step < self._interleave_every
+        ):
+            return None
+
+        self._last_review_step = self._step
+        return heapq.heappop(self._queue)[2]
+
+    def add_mistake(self, sentence: Sentence) -> None:
+        self.reschedule(ReviewItem(sentence=replace(sentence)), is_translation_correct=False)
+
+    def reschedule(self, review_item: ReviewItem, is_translation_correct: bool) -> None:
+        quality = CORRECT_ANSWER_QUALITY if is_translation_correct else INCORRECT_ANSWER_QUALITY
+
+        if quality < 3:
+            review_item.repetitions = 0
+            review_item.interval = self._first_interval
+        else:
+            review_item.repetitions += 1
+            if review_item.repetitions == 1:
+                review_item.interval = self._first_interval
+            elif review_item.repetitions == 2:
+                review_item.interval = self._second_interval
+            else:
+                review_item.interval = round(review_item.interval * review_item.easiness)
+
+        review_item.easiness = max(
+            MIN_EASINESS,
+            review_item.easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02),
+        )
+        review_item.due_step = self._step + review_item.interval
+        # Number of pushed items breaks ties of due steps, items are never compared
+        self._pushed_items_number += 1
+        heapq.heappush(self._queue, (review_item.due_step, self._pushed_items_number, review_item))
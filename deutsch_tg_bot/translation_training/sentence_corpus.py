@@ -0,0 +1,180 @@
+"""On-disk corpus of generated sentences, shared between users."""
+
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from functools import cache
+
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.data_types import Sentence, SentenceSpec
+from deutsch_tg_bot.deutsh_enums import DeutschLevel, DeutschTense, SentenceType
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sentences (
+    id INTEGER PRIMARY KEY,
+    level TEXT NOT NULL,
+    tense TEXT NOT NULL,
+    sentence_type TEXT NOT NULL,
+    theme TEXT,
+    ukrainian_sentence TEXT NOT NULL,
+    german_sentence TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (ukrainian_sentence, level, tense, sentence_type)
+);
+DROP INDEX IF EXISTS sentences_spec_idx;
+-- Ids are in the index, so sentences of a spec are ordered by id without a sort
+CREATE INDEX IF NOT EXISTS sentences_spec_theme_idx
+    ON sentences (level, tense, sentence_type, theme, prompt_version);
+CREATE TABLE IF NOT EXISTS seen_sentences (
+    user_id INTEGER NOT NULL,
+    sentence_id INTEGER NOT NULL REFERENCES sentences (id),
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (user_id, sentence_id)
+) WITHOUT ROWID;
+"""
+
+
+class SentenceCorpus:
+    """
+    SQLite storage of generated sentences. Queries are blocking, so async methods
+    run them in a worker thread. Connection is shared between threads under a lock.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def add_sentence(self, sentence: Sentence, prompt_version: str) -> int | None:
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                """
+                INSERT OR IGNORE INTO sentences (
+                    level, tense, sentence_type, theme, ukrainian_sentence, german_sentence,
+                    prompt_version, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    sentence.level.value,
+                    sentence.tense.value,
+                    sentence.sentence_type.value,
+                    sentence.theme,
+                    sentence.ukrainian_sentence,
+                    sentence.german_sentence,
+                    prompt_version,
+                    time.time(),
+                ),
+            )
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def sample_unseen_sentences(
+        self,
+        user_id: int,
+        sentence_spec: SentenceSpec,
+        prompt_version: str,
+        limit: int = 5,
+    ) -> list[tuple[int, Sentence]]:
+        """
+        Random sentences matching the spec, not seen by the user. Sentences are read in the
+        order of ids from a random id of the spec, wrapping around to the first one, so a
+        sample costs an index range scan instead of a sort of all sentences of the spec.
+        """
+        spec_filter = """
+            level = ? AND tense = ? AND sentence_type = ? AND theme IS ? AND prompt_version = ?
+        """
+        spec_params = (
+            sentence_spec.level.value,
+            sentence_spec.tense.value,
+            sentence_spec.sentence_type.value,
+            sentence_spec.theme,
+            prompt_version,
+        )
+        with self._lock:
+            min_id, max_id = self._connection.execute(
+                f"SELECT min(id), max(id) FROM sentences WHERE {spec_filter}", spec_params
+            ).fetchone()
+            if min_id is None:
+                return []
+            start_id = random.randint(min_id, max_id)
+            rows: list[tuple[int, str, str, str, str | None, str, str]] = []
+            for id_filter in ("id >= ?", "id < ?"):
+                rows += self._connection.execute(
+                    f"""
+                    SELECT id, level, tense, sentence_type, theme, ukrainian_sentence,
+                        german_sentence
+                    FROM sentences
+                    WHERE {spec_filter} AND {id_filter}
+                        AND NOT EXISTS (
+                            SELECT 1 FROM seen_sentences
+                            WHERE user_id = ? AND sentence_id = sentences.id
+                        )
+                    ORDER BY id
+                    LIMIT ?
+                    """,
+                    (*spec_params, start_id, user_id, limit - len(rows)),
+                ).fetchall()
+                if len(rows) >= limit:
+                    break
+
+        return [
+            (
+                sentence_id,
+                Sentence(
+                    level=DeutschLevel(level),
+                    tense=DeutschTense(tense),
+                    sentence_type=SentenceType(sentence_type),
+                    theme=theme,
+                    ukrainian_sentence=ukrainian_sentence,
+                    german_sentence=german_sentence,
+                ),
+            )
+            for (
+                sentence_id,
+                level,
+                tense,
+                sentence_type,
+                theme,
+                ukrainian_sentence,
+                german_sentence,
+            ) in rows
+        ]
+
+    def mark_seen(self, user_id: int, sentence_id: int) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO seen_sentences (user_id, sentence_id, seen_at)"
+                " VALUES (?, ?, ?)",
+                (user_id, sentence_id, time.time()),
+            )
+
+    async def add_sentence_async(self, sentence: Sentence, prompt_version: str) -> int | None:
+        return await asyncio.to_thread(self.add_sentence, sentence, prompt_version)
+
+    async def sample_unseen_sentences_async(
+        self,
+        user_id: int,
+        sentence_spec: SentenceSpec,
+        prompt_version: str,
+        limit: int = 5,
+    ) -> list[tuple[int, Sentence]]:
+        return await asyncio.to_thread(
+            self.sample_unseen_sentences, user_id, sentence_spec, prompt_version, limit
+        )
+
+    async def mark_seen_async(self, user_id: int, sentence_id: int) -> None:
+        await asyncio.to_thread(self.mark_seen, user_id, sentence_id)
+
+
+@cache
+def get_sentence_corpus() -> SentenceCorpus | None:
+    if settings.SENTENCE_CORPUS_PATH is None:
+        return None
+    return SentenceCorpus(settings.SENTENCE_CORPUS_PATH)
@@ -0,0 +1,51 @@
+"""Near-duplicate detection of generated sentences."""
+
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.data_types import Sentence
+from deutsch_tg_bot.utils.near_duplicates import NearDuplicateIndex
+
+
+class SentenceDeduplicator:
+    """
+    Indexes Ukrainian and German texts of sentences separately.
+    A sentence is a near-duplicate if any of its texts is close to an already indexed one.
+    """
+
+    def __init__(self, threshold: float = 0.6, max_items: int | None = None) -> None:
+        self._ukrainian_index = NearDuplicateIndex(threshold=threshold, max_items=max_items)
+        self._german_index = NearDuplicateIndex(threshold=threshold, max_items=max_items)
+
+    def __len__(self) -> int:
+        return len(self._german_index)
+
+    def add(self, sentence: Sentence) -> None:
+        key = sentence.german_sentence
+        self._ukrainian_index.add(key, sentence.ukrainian_sentence)
+        self._german_index.add(key, sentence.german_sentence)
+
+    def find_duplicate(self, sentence: Sentence) -> str | None:
+        """Return German text of the indexed sentence that the given one duplicates."""
+        return self._german_index.find_duplicate(
+            sentence.german_sentence
+        ) or self._ukrainian_index.find_duplicate(sentence.ukrainian_sentence)
+
+
+global_sentence_deduplicator = SentenceDeduplicator(
+    threshold=settings.SENTENCE_DUPLICATE_THRESHOLD,
+    max_items=settings.GLOBAL_SENTENCE_INDEX_SIZE,
+)
+
+
+def find_sentence_duplicate(
+    sentence: Sentence, user_deduplicator: SentenceDeduplicator
+) -> str | None:
+    duplicate = user_deduplicator.find_duplicate(sentence)
+    if duplicate is None and settings.USE_GLOBAL_SENTENCE_INDEX:
+        duplicate = global_sentence_deduplicator.find_duplicate(sentence)
+    return duplicate
+
+
+def add_sentence_to_indexes(sentence: Sentence, user_deduplicator: SentenceDeduplicator) -> None:
+    user_deduplicator.add(sentence)
+    if settings.USE_GLOBAL_SENTENCE_INDEX:
+        global_sentence_deduplicator.add(sentence)
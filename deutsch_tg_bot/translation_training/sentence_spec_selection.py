@@ -0,0 +1,47 @@
+"""Balanced selection of parameters of sentences to generate."""
+
+import random
+from collections.abc import Iterable, Mapping
+
+from deutsch_tg_bot.data_types import SentenceSpec
+from deutsch_tg_bot.deutsh_enums import DeutschLevel, DeutschTense, SentenceType
+from deutsch_tg_bot.utils.random_selector import BalancedRandomSelector
+
+
+class SentenceSpecSelector:
+    """
+    Selects each parameter with its own balanced selector: level, tense of the level,
+    sentence type and theme. So each tense and each type is balanced over recent sentences,
+    which a selector over all combinations doesn't do: it decays only the selected combination.
+    """
+
+    def __init__(
+        self,
+        level_tenses: Mapping[DeutschLevel, Iterable[DeutschTense]],
+        sentence_type_weights: Mapping[SentenceType, float],
+        themes: Iterable[str],
+        seed: int | None = None,
+    ) -> None:
+        seeds = random.Random(seed)
+
+        def get_seed() -> int | None:
+            return None if seed is None else seeds.getrandbits(32)
+
+        self._level_selector = BalancedRandomSelector(list(level_tenses), seed=get_seed())
+        self._tense_selectors = {
+            level: BalancedRandomSelector(tenses, seed=get_seed())
+            for level, tenses in level_tenses.items()
+        }
+        self._sentence_type_selector = BalancedRandomSelector(
+            sentence_type_weights.keys(), sentence_type_weights.values(), seed=get_seed()
+        )
+        self._theme_selector = BalancedRandomSelector(themes, seed=get_seed())
+
+    def select(self) -> SentenceSpec:
+        level = self._level_selector.select()
+        return SentenceSpec(
+            level=level,
+            tense=self._tense_selectors[level].select(),
+            sentence_type=self._sentence_type_selector.select(),
+            theme=self._theme_selector.select(),
+        )
@@ -8,31 +8,48 @@ from aiogram.types import (
     CallbackQuery,
     Message,
 )
-
-from deutsch_tg_bot.data_types import Sentence
-from deutsch_tg_bot.deutsh_enums import DEUTCH_LEVEL_TENSES, DeutschLevel, SentenceTypeProbabilities
+from rich import print as rprint
+from rich.panel import Panel
+
+from deutsch_tg_bot.ai_scheduler import AIPriority, ai_scheduler, run_with_ai_priority
+from deutsch_tg_bot.ai_tracing import ai_call_retries
+from deutsch_tg_bot.config import settings
+from deutsch_tg_bot.data_types import Sentence, SentenceSpec
+from deutsch_tg_bot.deutsh_enums import DeutschLevel
+from deutsch_tg_bot.load_shedding import LoadLevel, load_shedder
 from deutsch_tg_bot.tg_progress import progress
+from deutsch_tg_bot.tg_session_tasks import session_tasks
 from deutsch_tg_bot.translation_training.ai.question_answering import answer_question_with_ai
 from deutsch_tg_bot.translation_training.ai.sentence_generator import (
+    create_sentence_spec_selector,
     generate_sentence_with_ai,
     get_sentence_generator_params,
+    get_sentence_generator_prompt_version,
 )
 from deutsch_tg_bot.translation_training.ai.translation_evaluation import (
     TranslationEvaluationResult,
     evaluate_translation_with_ai,
+    evaluate_translations_batch_with_ai,
+)
+from deutsch_tg_bot.translation_training.sentence_corpus import get_sentence_corpus
+from deutsch_tg_bot.translation_training.sentence_deduplication import (
+    add_sentence_to_indexes,
+    find_sentence_duplicate,
 )
-from deutsch_tg_bot.user_session import SentenceTranslationState
-from deutsch_tg_bot.utils.random_selector import BalancedRandomSelector
+from deutsch_tg_bot.user_session import ExamState, SentenceTranslationState
 
 
 class TranslationTraining(StatesGroup):
     add_sentence_constraint = State()
     check_translation = State()
     answer_question = State()
+    answer_exam = State()
 
 
 router = Router()
 
+VERDICT_FIELDS = frozenset(["is_translation_correct", "correct_translation"])
+
 
 # @translation_training_router.message(Setup.select_training_type)
 @router.callback_query(F.data == "select_training_type:translation")
@@ -43,14 +60,16 @@ async def select_training_type(callback_query: CallbackQuery, state: FSMContext)
     deutsch_level = await state.get_value("deutsch_level")
     assert isinstance(deutsch_level, DeutschLevel)
     sentence_translation = SentenceTranslationState(
-        random_tense_selector=BalancedRandomSelector(
-            items=DEUTCH_LEVEL_TENSES[deutsch_level],
-        ),
-        random_sentence_type_selector=BalancedRandomSelector(
-            items=list(SentenceTypeProbabilities.keys()),
-            weights=list(SentenceTypeProbabilities.values()),
+        sentence_spec_selector=create_sentence_spec_selector(
+            levels=[deutsch_level],
+            seed=settings.SENTENCE_SELECTOR_SEED,
         ),
     )
+    if settings.SPECULATIVE_FIRST_SENTENCE_ENABLED and not load_shedder.is_active(
+        LoadLevel.NO_PREFETCH
+    ):
+        # Most users skip the constraint, so the first sentence is ready when they answer
+        _ensure_sentence_prefetch(sentence_translation, callback_query.message.chat.id)
     await state.update_data(sentence_translation=sentence_translation)
 
     await state.set_state(TranslationTraining.add_sentence_constraint)
@@ -72,30 +91,38 @@ async def generate_new_sentence_to_translate(message: Message, state: FSMContext
     if current_state == TranslationTraining.add_sentence_constraint:
         if message.text and message.text != "/skip":
             sentence_translation.sentence_constraint = message.text
+            _cancel_sentence_prefetch(sentence_translation)
 
-    deutsch_level = await state.get_value("deutsch_level")
-    assert isinstance(deutsch_level, DeutschLevel)
-    if sentence_translation.new_sentence_generation_task is None:
-        sentence_translation.new_sentence_generation_task = asyncio.create_task(
-            _generate_new_sentence(deutsch_level, sentence_translation)
-        )
-
-    if not sentence_translation.new_sentence_generation_task.done():
-        async with progress(message, "Генерую нове речення"):
-            await asyncio.wait([sentence_translation.new_sentence_generation_task])
-
-    new_sentence = sentence_translation.new_sentence_generation_task.result()
-    sentence_translation.sentences_history.append(new_sentence)
-    sentence_number = len(sentence_translation.sentences_history)
+    # Due reviews of previous mistakes are served from the history, without AI call.
+    # Prefetched sentence stays for the next /next.
+    review_item = sentence_translation.review_scheduler.pop_due_review()
+    if review_item is not None:
+        new_sentence = review_item.get_sentence_to_review()
+    else:
+        _ensure_sentence_prefetch(sentence_translation, message.chat.id)
+        assert sentence_translation.new_sentence_generation_task is not None
+        if not sentence_translation.new_sentence_generation_task.done():
+            # The user waits for the prefetch now
+            ai_scheduler.promote_chat(message.chat.id, AIPriority.INTERACTIVE)
+            async with progress(message, "Генерую нове речення"):
+                await asyncio.wait([sentence_translation.new_sentence_generation_task])
+
+        new_sentence = sentence_translation.new_sentence_generation_task.result()
+        sentence_translation.new_sentence_generation_task = None
+
+    sentence_translation.current_review_item = review_item
+    sentence_translation.review_scheduler.advance()
+    sentence_translation.add_sentence(new_sentence)
+    sentence_number = sentence_translation.sentences_number
+    title = "Повтори переклад речення" if review_item is not None else "Переклади речення"
     answer_message = (
-        f"<b>{sentence_number}. Переклади речення:</b>\n{new_sentence.ukrainian_sentence}\n\n"
+        f"<b>{sentence_number}. {title}:</b>\n{new_sentence.ukrainian_sentence}\n\n"
         f"<b>Час</b>: {new_sentence.tense.value}"
     )
     await message.answer(answer_message, parse_mode="HTML")
 
-    sentence_translation.new_sentence_generation_task = asyncio.create_task(
-        _generate_new_sentence(deutsch_level, sentence_translation)
-    )
+    if not load_shedder.is_active(LoadLevel.NO_PREFETCH):
+        _ensure_sentence_prefetch(sentence_translation, message.chat.id)
     await state.set_state(TranslationTraining.check_translation)
     await state.update_data(sentence_translation=sentence_translation)
 
@@ -107,9 +134,28 @@ async def check_translation(message: Message, state: FSMContext) -> None:
 
     current_sentence = sentence_translation.sentences_history[-1]
 
+    # Verdict is sent as soon as it's generated, explanation is added to it later
+    verdict_message: Message | None = None
+    evaluated_fields: dict[str, object] = {}
+
+    async def send_verdict(name: str, value: object) -> None:
+        nonlocal verdict_message
+        evaluated_fields[name] = value
+        if verdict_message is not None or not VERDICT_FIELDS <= evaluated_fields.keys():
+            return
+        if evaluated_fields["is_translation_correct"]:
+            verdict_message = await message.answer("Переклад правильний!")
+        else:
+            correct_translation = str(evaluated_fields["correct_translation"])
+            verdict_message = await message.answer(
+                f"<b>Правильний переклад:</b>\n{html.code(html.quote(correct_translation))}"
+            )
+
     async with progress(message, "Перевіряю переклад"):
         assert message.text is not None
-        check_result = await evaluate_translation_with_ai(current_sentence, message.text)
+        check_result = await evaluate_translation_with_ai(
+            current_sentence, message.text, on_field=send_verdict
+        )
 
     sentence_translation.last_translation_check_result = check_result
     sentence_translation.sentences_history[
@@ -117,30 +163,122 @@ async def check_translation(message: Message, state: FSMContext) -> None:
     ].is_translation_correct = check_result.is_translation_correct
     sentence_translation.sentences_history[-1].german_sentence = check_result.correct_translation
 
-    correct_answers_number = sum(
-        1
-        for sentence in sentence_translation.sentences_history
-        if sentence.is_translation_correct is True
-    )
+    review_scheduler = sentence_translation.review_scheduler
+    if sentence_translation.current_review_item is not None:
+        review_scheduler.reschedule(
+            sentence_translation.current_review_item, check_result.is_translation_correct
+        )
+        sentence_translation.current_review_item = None
+    elif not check_result.is_translation_correct:
+        review_scheduler.add_mistake(sentence_translation.sentences_history[-1])
+
+    if check_result.is_translation_correct:
+        sentence_translation.correct_answers_number += 1
     total_result_message = (
-        f"<b>Загальний результат:</b> {correct_answers_number}"
-        f" з {len(sentence_translation.sentences_history)}"
+        f"<b>Загальний результат:</b> {sentence_translation.correct_answers_number}"
+        f" з {sentence_translation.sentences_number}"
     )
 
     if check_result.is_translation_correct:
         answer_message = (
             "Переклад правильний!\n\n"
             f"{total_result_message}\n\n"
-            "Якщо у тебе є ще питання, задай їх. Або введи /next для наступного речення."
+            "Якщо у тебе є ще питання, задай їх. "
+            "Або введи /next для наступного речення чи /exam для екзамену."
         )
     else:
         answer_message = (
             f"{_translation_check_result_to_message(check_result)}\n\n"
             f"{total_result_message}\n\n"
-            "Якщо у тебе є ще питання, задай їх. Або введи /next для наступного речення."
+            "Якщо у тебе є ще питання, задай їх. "
+            "Або введи /next для наступного речення чи /exam для екзамену."
         )
 
-    await message.answer(answer_message)
+    if verdict_message is not None:
+        await verdict_message.edit_text(answer_message)
+    else:
+        await message.answer(answer_message)
+    await state.set_state(TranslationTraining.answer_question)
+    await state.update_data(sentence_translation=sentence_translation)
+
+
+@router.message(TranslationTraining.answer_question, Command("exam"))
+async def start_exam(message: Message, state: FSMContext) -> None:
+    sentence_translation = await state.get_value("sentence_translation")
+    assert isinstance(sentence_translation, SentenceTranslationState)
+
+    async with progress(message, "Готую екзамен"):
+        exam_sentences = await _generate_exam_sentences(
+            sentence_translation, message.chat.id, settings.EXAM_SENTENCES_NUMBER
+        )
+    sentence_translation.exam = ExamState(sentences=exam_sentences)
+
+    sentences_list = "\n".join(
+        f"{index}. {sentence.ukrainian_sentence} <i>({sentence.tense.value})</i>"
+        for index, sentence in enumerate(exam_sentences, 1)
+    )
+    await message.answer(
+        f"<b>Екзамен: переклади {len(exam_sentences)} речень</b>\n\n{sentences_list}\n\n"
+        "Надсилай переклади по порядку: кожен з нового рядка або окремим повідомленням. "
+        "Перевірю всі переклади разом."
+    )
+    await state.set_state(TranslationTraining.answer_exam)
+    await state.update_data(sentence_translation=sentence_translation)
+
+
+@router.message(TranslationTraining.answer_exam)
+async def answer_exam(message: Message, state: FSMContext) -> None:
+    deutsch_level = await state.get_value("deutsch_level")
+    assert isinstance(deutsch_level, DeutschLevel)
+    sentence_translation = await state.get_value("sentence_translation")
+    assert isinstance(sentence_translation, SentenceTranslationState)
+    exam = sentence_translation.exam
+    assert exam is not None
+    assert message.text is not None
+
+    exam.answers.extend(line.strip() for line in message.text.splitlines() if line.strip())
+    if len(exam.answers) < len(exam.sentences):
+        await message.answer(f"Прийнято {len(exam.answers)} з {len(exam.sentences)}.")
+        await state.update_data(sentence_translation=sentence_translation)
+        return
+
+    answers = exam.answers[: len(exam.sentences)]
+    async with progress(message, "Перевіряю екзамен"):
+        check_results = await evaluate_translations_batch_with_ai(
+            deutsch_level, list(zip(exam.sentences, answers))
+        )
+
+    report_lines = []
+    for index, (sentence, answer, check_result) in enumerate(
+        zip(exam.sentences, answers, check_results), 1
+    ):
+        sentence.is_translation_correct = check_result.is_translation_correct
+        # Generated reference is kept if the evaluation has no correct translation
+        if check_result.correct_translation:
+            sentence.german_sentence = check_result.correct_translation
+        sentence_translation.add_sentence(sentence)
+        sentence_translation.review_scheduler.advance()
+        if check_result.is_translation_correct:
+            sentence_translation.correct_answers_number += 1
+            report_lines.append(f"{index}. ✅ {html.quote(answer)}")
+        else:
+            sentence_translation.review_scheduler.add_mistake(sentence)
+            correct_translation = html.code(html.quote(sentence.german_sentence))
+            report_lines.append(f"{index}. ❌ {html.quote(answer)}\n    → {correct_translation}")
+
+    exam_correct_number = sum(check_result.is_translation_correct for check_result in check_results)
+    sentence_translation.exam = None
+    sentence_translation.last_translation_check_result = check_results[-1]
+    report = "\n".join(report_lines)
+    await message.answer(
+        f"<b>Результат екзамену:</b> {exam_correct_number} з {len(check_results)}\n\n{report}\n\n"
+        f"<b>Загальний результат:</b> {sentence_translation.correct_answers_number}"
+        f" з {sentence_translation.sentences_number}\n\n"
+        "Помилки повторимо пізніше. Введи /next для наступного речення чи /exam для екзамену."
+    )
+
+    if not load_shedder.is_active(LoadLevel.NO_PREFETCH):
+        _ensure_sentence_prefetch(sentence_translation, message.chat.id)
     await state.set_state(TranslationTraining.answer_question)
     await state.update_data(sentence_translation=sentence_translation)
 
@@ -165,27 +303,135 @@ async def answer_question(message: Message, state: FSMContext) -> None:
         )
 
     answer_message = (
-        f"{html.code(ai_reply)}"
-        "\n\nЯкщо у тебе є ще питання, задай їх. Або введи /next для наступного речення."
+        f"{html.code(html.quote(ai_reply))}"
+        "\n\nЯкщо у тебе є ще питання, задай їх. Або введи /next для наступного речення"
+        " чи /exam для екзамену."
     )
     await message.answer(answer_message)
     await state.update_data(sentence_translation=sentence_translation)
 
 
+async def _generate_exam_sentences(
+    sentence_translation: SentenceTranslationState, chat_id: int, sentences_number: int
+) -> list[Sentence]:
+    """Prefetched sentence goes first, the rest are taken from the corpus or generated concurrently."""
+    _ensure_sentence_prefetch(sentence_translation, chat_id)
+    prefetch_task = sentence_translation.new_sentence_generation_task
+    assert prefetch_task is not None
+    sentence_translation.new_sentence_generation_task = None
+    ai_scheduler.promote_chat(chat_id, AIPriority.INTERACTIVE)
+    return list(
+        await asyncio.gather(
+            prefetch_task,
+            *(
+                _generate_new_sentence(sentence_translation, chat_id)
+                for _ in range(sentences_number - 1)
+            ),
+        )
+    )
+
+
+def _ensure_sentence_prefetch(sentence_translation: SentenceTranslationState, chat_id: int) -> None:
+    """Start generation of the next sentence, unless it is already pending."""
+    task = sentence_translation.new_sentence_generation_task
+    # Prefetch is cancelled by session task registry, e.g. after idle timeout
+    if task is None or task.cancelled():
+        sentence_translation.new_sentence_generation_task = session_tasks.create_task(
+            chat_id,
+            run_with_ai_priority(
+                AIPriority.PREFETCH, _generate_new_sentence(sentence_translation, chat_id)
+            ),
+            kind="sentence_generation",
+        )
+
+
+def _cancel_sentence_prefetch(sentence_translation: SentenceTranslationState) -> None:
+    """Drop the pending sentence, e.g. generated before the constraint was entered."""
+    task = sentence_translation.new_sentence_generation_task
+    if task is not None:
+        task.cancel()
+        sentence_translation.new_sentence_generation_task = None
+
+
 async def _generate_new_sentence(
-    deutsch_level: DeutschLevel, sentence_translation: SentenceTranslationState
+    sentence_translation: SentenceTranslationState, user_id: int
 ) -> Sentence:
-    random_tense_selector = sentence_translation.random_tense_selector
-    random_sentence_type_selector = sentence_translation.random_sentence_type_selector
-
-    sentence_generator_params = get_sentence_generator_params(
-        level=deutsch_level,
-        tense=random_tense_selector.select(),
-        sentence_type=random_sentence_type_selector.select(),
-        sentences_history=sentence_translation.sentences_history,
-        optional_constraint=sentence_translation.sentence_constraint,
+    sentence_spec = sentence_translation.sentence_spec_selector.select()
+    new_sentence = await _get_unseen_sentence_from_corpus(
+        sentence_translation, user_id, sentence_spec
     )
-    new_sentence = await generate_sentence_with_ai(sentence_generator_params)
+    # Under heavy load other specs are tried too, an AI call is the last resort
+    if new_sentence is None and load_shedder.is_active(LoadLevel.LOCAL_SENTENCES):
+        for _ in range(settings.LOAD_SHEDDING_CORPUS_ATTEMPTS):
+            new_sentence = await _get_unseen_sentence_from_corpus(
+                sentence_translation, user_id, sentence_translation.sentence_spec_selector.select()
+            )
+            if new_sentence is not None:
+                break
+    if new_sentence is None:
+        new_sentence = await _generate_unique_sentence(sentence_translation, sentence_spec)
+
+        sentence_corpus = get_sentence_corpus()
+        if sentence_corpus is not None and sentence_translation.sentence_constraint is None:
+            sentence_id = await sentence_corpus.add_sentence_async(
+                new_sentence, get_sentence_generator_prompt_version()
+            )
+            if sentence_id is not None:
+                await sentence_corpus.mark_seen_async(user_id, sentence_id)
+
+    add_sentence_to_indexes(new_sentence, sentence_translation.sentence_deduplicator)
+    return new_sentence
+
+
+async def _get_unseen_sentence_from_corpus(
+    sentence_translation: SentenceTranslationState, user_id: int, sentence_spec: SentenceSpec
+) -> Sentence | None:
+    """Sentences with user's constraint are always generated."""
+    sentence_corpus = get_sentence_corpus()
+    if sentence_corpus is None or sentence_translation.sentence_constraint is not None:
+        return None
+
+    candidates = await sentence_corpus.sample_unseen_sentences_async(
+        user_id, sentence_spec, get_sentence_generator_prompt_version()
+    )
+    for sentence_id, sentence in candidates:
+        # Duplicates are marked as seen too, so they are not sampled again.
+        # Only user's index is checked: corpus sentences are shared between users by design,
+        # while the global index rejects generated sentences close to other users' ones.
+        await sentence_corpus.mark_seen_async(user_id, sentence_id)
+        if sentence_translation.sentence_deduplicator.find_duplicate(sentence) is None:
+            return sentence
+    return None
+
+
+async def _generate_unique_sentence(
+    sentence_translation: SentenceTranslationState, sentence_spec: SentenceSpec
+) -> Sentence:
+    # Near-duplicates are rejected and generated again with newly selected parameters,
+    # instead of sending a longer history of recent sentences to the model.
+    for attempt in range(settings.SENTENCE_DUPLICATE_MAX_RETRIES + 1):
+        if attempt > 0:
+            sentence_spec = sentence_translation.sentence_spec_selector.select()
+        sentence_generator_params = get_sentence_generator_params(
+            sentence_spec=sentence_spec,
+            sentences_history=sentence_translation.sentences_history,
+            optional_constraint=sentence_translation.sentence_constraint,
+        )
+        with ai_call_retries(attempt):
+            new_sentence = await generate_sentence_with_ai(sentence_generator_params)
+        duplicate = find_sentence_duplicate(
+            new_sentence, sentence_translation.sentence_deduplicator
+        )
+        if duplicate is None:
+            break
+        rprint(
+            Panel(
+                f"{new_sentence.german_sentence}\nduplicates\n{duplicate}",
+                title="Duplicate Sentence Rejected",
+                border_style="red",
+            )
+        )
+
     return new_sentence
 
 
@@ -197,6 +443,8 @@ def _translation_check_result_to_message(
 
     correct_translation = translation_check_result.correct_translation
 
-    message = f"\n\n<b>Правильний переклад:</b>\n{html.code(correct_translation)}"
-    message += f"\n\n<b>Пояснення:</b>\n{html.code(translation_check_result.explanation)}"
+    message = f"\n\n<b>Правильний переклад:</b>\n{html.code(html.quote(correct_translation))}"
+    message += (
+        f"\n\n<b>Пояснення:</b>\n{html.code(html.quote(translation_check_result.explanation))}"
+    )
     return message
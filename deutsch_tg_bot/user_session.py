@@ -1,36 +1,87 @@
 from __future__ import annotations
 
 import asyncio
+import sys
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, TypedDict
+from typing import TYPE_CHECKING, Any
 
 from google.genai import chats
 
+from deutsch_tg_bot.config import settings
 from deutsch_tg_bot.data_types import Sentence
-from deutsch_tg_bot.deutsh_enums import DeutschTense, SentenceType
-from deutsch_tg_bot.utils.random_selector import BalancedRandomSelector
+from deutsch_tg_bot.situation_training.message_memory import MessageMemory
+from deutsch_tg_bot.situation_training.npc_registry import NPCRegistry
+from deutsch_tg_bot.translation_training.review_scheduler import ReviewItem, ReviewScheduler
+from deutsch_tg_bot.translation_training.sentence_deduplication import SentenceDeduplicator
+from deutsch_tg_bot.translation_training.sentence_spec_selection import SentenceSpecSelector
 
 if TYPE_CHECKING:
-    from deutsch_tg_bot.situation_training.ai.data_types import GameState, NPCState, PlayerState
+    from deutsch_tg_bot.situation_training.ai.data_types import (
+        GameState,
+        NarratorResponse,
+        NPCState,
+        PlayerState,
+    )
+    from deutsch_tg_bot.situation_training.ai.scene_context import SceneContext
     from deutsch_tg_bot.translation_training.ai.translation_evaluation import (
         TranslationEvaluationResult,
     )
 
 
-class HistoryMessage(TypedDict):
+@dataclass(slots=True)
+class HistoryMessage:
     sender: str  # "player", "narrator" or npc_id
     text: str
 
+    def __post_init__(self) -> None:
+        # Few senders repeat in every message of the session
+        self.sender = sys.intern(self.sender)
+
+
+@dataclass
+class ExamState:
+    sentences: list[Sentence]
+    answers: list[str] = field(default_factory=list)
+
 
 @dataclass
 class SentenceTranslationState:
-    random_tense_selector: BalancedRandomSelector[DeutschTense]
-    random_sentence_type_selector: BalancedRandomSelector[SentenceType]
+    sentence_spec_selector: SentenceSpecSelector
     sentences_history: list[Sentence] = field(default_factory=list)
     sentence_constraint: str | None = None
     genai_chat: chats.AsyncChat | None = None
     last_translation_check_result: TranslationEvaluationResult | None = None
     new_sentence_generation_task: asyncio.Task[Sentence] | None = None
+    sentence_deduplicator: SentenceDeduplicator = field(
+        default_factory=lambda: SentenceDeduplicator(
+            threshold=settings.SENTENCE_DUPLICATE_THRESHOLD
+        )
+    )
+    review_scheduler: ReviewScheduler = field(
+        default_factory=lambda: ReviewScheduler(
+            first_interval=settings.REVIEW_FIRST_INTERVAL,
+            second_interval=settings.REVIEW_SECOND_INTERVAL,
+            interleave_every=settings.REVIEW_INTERLEAVE_EVERY,
+        )
+    )
+    current_review_item: ReviewItem | None = None
+    # Totals of the session, the history keeps only recent sentences
+    sentences_number: int = 0
+    correct_answers_number: int = 0
+    exam: ExamState | None = None
+
+    def add_sentence(self, sentence: Sentence) -> None:
+        self.sentences_history.append(sentence)
+        self.sentences_number += 1
+        if len(self.sentences_history) > settings.SENTENCES_HISTORY_LIMIT:
+            del self.sentences_history[: -settings.SENTENCES_HISTORY_LIMIT]
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Running prefetch and AI chat are not stored when the session is spilled to disk."""
+        state = self.__dict__.copy()
+        state["new_sentence_generation_task"] = None
+        state["genai_chat"] = None
+        return state
 
 
 @dataclass
@@ -39,7 +90,36 @@ class SituationTrainingState:
     npc_states: list[NPCState]
     player_state: PlayerState
 
+    # Indexes the same NPC states. Change NPC states only through the registry
+    npc_registry: NPCRegistry = field(init=False)
+
     messages_history: list[HistoryMessage] = field(default_factory=list)
+    # Index of a longer history, agents get relevant messages from it
+    message_memory: MessageMemory = field(init=False)
 
     player_message_count: int = 0
     last_narrator_event_index: int = 0
+
+    grammar_check_enabled: bool = field(default_factory=lambda: settings.GRAMMAR_CHECK_ENABLED)
+    # Narrator event of the next narrator turn, generated while the player types
+    speculative_narrator_task: asyncio.Task[NarratorResponse] | None = None
+    # Rendered immutable part of the scene, see `get_scene_context`
+    scene_context: SceneContext | None = None
+
+    def __post_init__(self) -> None:
+        self.npc_registry = NPCRegistry(self.npc_states)
+        self.message_memory = MessageMemory(settings.MEMORY_MESSAGES_LIMIT)
+        for message in self.messages_history:
+            self.message_memory.add(message)
+
+    def add_message(self, sender: str, text: str) -> None:
+        message = HistoryMessage(sender=sender, text=text)
+        self.messages_history.append(message)
+        self.message_memory.add(message)
+        if len(self.messages_history) > settings.MESSAGES_HISTORY_LIMIT:
+            del self.messages_history[: -settings.MESSAGES_HISTORY_LIMIT]
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        state["speculative_narrator_task"] = None
+        return state
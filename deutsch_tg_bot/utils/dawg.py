@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import gzip
+import struct
+from array import array
+from collections.abc import Iterable, Iterator
+
+_HEADER = struct.Struct("<4Q")
+
+
+class DAWG:
+    """
+    Directed acyclic word graph: a trie with shared suffixes, built incrementally
+    from sorted words (Daciuk et al. algorithm) and packed into flat arrays.
+    German inflection endings are shared between words, so the graph is several times
+    smaller than a plain trie.
+
+    Node `n` has outgoing edges `edge_first[n] : edge_first[n + 1]`, sorted by label,
+    so lookups use binary search over edge labels.
+    """
+
+    def __init__(
+        self,
+        edge_first: array[int],
+        edge_labels: str,
+        edge_targets: array[int],
+        terminal: bytes,
+    ) -> None:
+        self._edge_first = edge_first
+        self._edge_labels = edge_labels
+        self._edge_targets = edge_targets
+        self._terminal = terminal
+
+    @classmethod
+    def from_words(cls, sorted_words: Iterable[str]) -> DAWG:
+        builder = _DAWGBuilder()
+        for word in sorted_words:
+            builder.insert(word)
+        return cls(*builder.finish())
+
+    @classmethod
+    def load(cls, path: str) -> DAWG:
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+        edge_first_size, labels_size, edge_targets_size, terminal_size = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        edge_first = array("I")
+        edge_first.frombytes(data[offset : offset + edge_first_size])
+        offset += edge_first_size
+        edge_labels = data[offset : offset + labels_size].decode()
+        offset += labels_size
+        edge_targets = array("I")
+        edge_targets.frombytes(data[offset : offset + edge_targets_size])
+        offset += edge_targets_size
+        terminal = data[offset : offset + terminal_size]
+        return cls(edge_first, edge_labels, edge_targets, terminal)
+
+    def save(self, path: str) -> None:
+        edge_first = self._edge_first.tobytes()
+        edge_labels = self._edge_labels.encode()
+        edge_targets = self._edge_targets.tobytes()
+        header = _HEADER.pack(
+            len(edge_first), len(edge_labels), len(edge_targets), len(self._terminal)
+        )
+        with gzip.open(path, "wb") as f:
+            for blob in (header, edge_first, edge_labels, edge_targets, self._terminal):
+                f.write(blob)
+
+    def __contains__(self, word: object) -> bool:
+        if not isinstance(word, str):
+            return False
+        node = 0
+        for char in word:
+            next_node = self._get_child(node, char)
+            if next_node is None:
+                return False
+            node = next_node
+        return bool(self._terminal[node])
+
+    def __iter__(self) -> Iterator[str]:
+        stack: list[tuple[int, str]] = [(0, "")]
+        while stack:
+            node, prefix = stack.pop()
+            if self._terminal[node]:
+                yield prefix
+            for edge in range(self._edge_first[node + 1] - 1, self._edge_first[node] - 1, -1):
+                stack.append((self._edge_targets[edge], prefix + self._edge_labels[edge]))
+
+    def find_within_one_edit(self, word: str) -> set[str]:
+        """Words at Damerau-Levenshtein distance 1: one insertion, deletion, substitution
+        or transposition of adjacent characters."""
+        results: set[str] = set()
+        self._search(0, word, 0, "", True, results)
+        results.discard(word)
+        return results
+
+    def _search(
+        self, node: int, word: str, position: int, prefix: str, can_edit: bool, results: set[str]
+    ) -> None:
+        if position == len(word):
+            if self._terminal[node]:
+                results.add(prefix)
+            if can_edit:
+                # Insertion at the end
+                for label, child in self._iter_edges(node):
+                    if self._terminal[child]:
+                        results.add(prefix + label)
+            return
+
+        char = word[position]
+        next_node = self._get_child(node, char)
+        if next_node is not None:
+            self._search(next_node, word, position + 1, prefix + char, can_edit, results)
+        if not can_edit:
+            return
+
+        # Deletion of `char`
+        self._search(node, word, position + 1, prefix, False, results)
+        for label, child in self._iter_edges(node):
+            # Substitution of `char` and insertion before it
+            if label != char:
+                self._search(child, word, position + 1, prefix + label, False, results)
+                self._search(child, word, position, prefix + label, False, results)
+        # Transposition of `char` with the next one
+        if position + 1 < len(word) and word[position] != word[position + 1]:
+            swapped = self._get_child(node, word[position + 1])
+            if swapped is not None:
+                swapped = self._get_child(swapped, char)
+            if swapped is not None:
+                self._search(
+                    swapped,
+                    word,
+                    position + 2,
+                    prefix + word[position + 1] + char,
+                    False,
+                    results,
+                )
+
+    def _iter_edges(self, node: int) -> Iterator[tuple[str, int]]:
+        for edge in range(self._edge_first[node], self._edge_first[node + 1]):
+            yield self._edge_labels[edge], self._edge_targets[edge]
+
+    def _get_child(self, node: int, char: str) -> int | None:
+        low, high = self._edge_first[node], self._edge_first[node + 1]
+        while low < high:
+            middle = (low + high) // 2
+            label = self._edge_labels[middle]
+            if label < char:
+                low = middle + 1
+            elif label > char:
+                high = middle
+            else:
+                return self._edge_targets[middle]
+        return None
+
+
+class _BuilderNode:
+    __slots__ = ("children", "terminal", "index")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _BuilderNode] = {}
+        self.terminal = False
+        self.index = -1
+
+    def signature(self) -> tuple[bool, tuple[tuple[str, int], ...]]:
+        return self.terminal, tuple(
+            (label, id(child)) for label, child in sorted(self.children.items())
+        )
+
+
+class _DAWGBuilder:
+    def __init__(self) -> None:
+        self._root = _BuilderNode()
+        self._previous_word = ""
+        # Path of nodes of the previous word which are not minimized yet
+        self._unchecked: list[tuple[_BuilderNode, str, _BuilderNode]] = []
+        self._minimized: dict[tuple[bool, tuple[tuple[str, int], ...]], _BuilderNode] = {}
+
+    def insert(self, word: str) -> None:
+        if word <= self._previous_word and self._previous_word:
+            if word == self._previous_word:
+                return
+            raise ValueError("Words must be inserted in sorted order")
+
+        common_prefix = 0
+        for a, b in zip(word, self._previous_word):
+            if a != b:
+                break
+            common_prefix += 1
+
+        self._minimize(common_prefix)
+
+        node = self._unchecked[-1][2] if self._unchecked else self._root
+        for char in word[common_prefix:]:
+            child = _BuilderNode()
+            node.children[char] = child
+            self._unchecked.append((node, char, child))
+            node = child
+        node.terminal = True
+        self._previous_word = word
+
+    def finish(self) -> tuple[array[int], str, array[int], bytes]:
+        self._minimize(0)
+
+        # Number nodes in BFS order, the root is 0
+        nodes = [self._root]
+        self._root.index = 0
+        for node in nodes:
+            for _, child in sorted(node.children.items()):
+                if child.index == -1:
+                    child.index = len(nodes)
+                    nodes.append(child)
+
+        edge_first = array("I", [0])
+        edge_labels: list[str] = []
+        edge_targets = array("I")
+        terminal = bytearray(len(nodes))
+        for node in nodes:
+            for label, child in sorted(node.children.items()):
+                edge_labels.append(label)
+                edge_targets.append(child.index)
+            edge_first.append(len(edge_labels))
+            terminal[node.index] = node.terminal
+        return edge_first, "".join(edge_labels), edge_targets, bytes(terminal)
+
+    def _minimize(self, down_to: int) -> None:
+        while len(self._unchecked) > down_to:
+            parent, char, child = self._unchecked.pop()
+            signature = child.signature()
+            existing = self._minimized.get(signature)
+            if existing is not None:
+                parent.children[char] = existing
+            else:
+                self._minimized[signature] = child
@@ -0,0 +1,53 @@
+import json
+import threading
+from collections.abc import Sequence
+from typing import TextIO
+
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+
+class JsonlSpanExporter(SpanExporter):
+    """Write finished spans to a JSON lines file, so traces can be inspected offline."""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._file: TextIO | None = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = [json.dumps(_span_to_dict(span), ensure_ascii=False, default=str) for span in spans]
+        with self._lock:
+            if self._file is None:
+                self._file = open(self._path, "a", encoding="utf-8")
+            self._file.write("".join(line + "\n" for line in lines))
+            self._file.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+        return True
+
+
+def _span_to_dict(span: ReadableSpan) -> dict[str, object]:
+    span_context = span.context
+    start_time = span.start_time or 0
+    end_time = span.end_time or start_time
+    return {
+        "name": span.name,
+        "trace_id": f"{span_context.trace_id:032x}" if span_context else None,
+        "span_id": f"{span_context.span_id:016x}" if span_context else None,
+        "parent_span_id": f"{span.parent.span_id:016x}" if span.parent else None,
+        "start_time": start_time / 1e9,
+        "duration_seconds": (end_time - start_time) / 1e9,
+        "status": span.status.status_code.name,
+        "attributes": dict(span.attributes or {}),
+    }
@@ -0,0 +1,133 @@
+import hashlib
+import random
+import re
+import unicodedata
+from collections import OrderedDict
+
+# Mersenne prime used for the universal hash family of MinHash permutations
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text for near-duplicate detection. Works for both Ukrainian and German:
+    unicode normalization, lowercase, apostrophe and punctuation removal, collapsed whitespace.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = text.replace("'", "").replace("ʼ", "").replace("’", "")
+    text = _NON_WORD_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def get_shingles(text: str, shingle_size: int = 3) -> frozenset[str]:
+    """Character n-grams of normalized text. Short texts produce a single shingle."""
+    normalized = f" {normalize_text(text)} "
+    if len(normalized) <= shingle_size:
+        return frozenset([normalized])
+    return frozenset(
+        normalized[i : i + shingle_size] for i in range(len(normalized) - shingle_size + 1)
+    )
+
+
+def jaccard_similarity(a: frozenset[str], b: frozenset[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index over shingled text.
+
+    Candidates are looked up in the LSH buckets and then verified with the exact
+    Jaccard similarity of their shingle sets, so false positives of LSH never reject a text.
+    With `max_items` set, the oldest items are evicted first.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.6,
+        bands: int = 16,
+        rows_per_band: int = 2,
+        shingle_size: int = 3,
+        max_items: int | None = None,
+        seed: int = 42,
+    ) -> None:
+        self._threshold = threshold
+        self._bands = bands
+        self._rows_per_band = rows_per_band
+        self._shingle_size = shingle_size
+        self._max_items = max_items
+
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(bands * rows_per_band)
+        ]
+
+        self._items: OrderedDict[str, tuple[frozenset[str], tuple[int, ...]]] = OrderedDict()
+        self._buckets: list[dict[tuple[int, ...], set[str]]] = [{} for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._items
+
+    def add(self, key: str, text: str) -> None:
+        if key in self._items:
+            self.remove(key)
+
+        shingles = get_shingles(text, self._shingle_size)
+        signature = self._get_signature(shingles)
+        self._items[key] = (shingles, signature)
+        for band_index, band in enumerate(self._iter_bands(signature)):
+            self._buckets[band_index].setdefault(band, set()).add(key)
+
+        if self._max_items is not None:
+            while len(self._items) > self._max_items:
+                self.remove(next(iter(self._items)))
+
+    def remove(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        for band_index, band in enumerate(self._iter_bands(item[1])):
+            bucket = self._buckets[band_index].get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_index][band]
+
+    def find_duplicate(self, text: str) -> str | None:
+        """Return the key of the most similar indexed text above the threshold, if any."""
+        shingles = get_shingles(text, self._shingle_size)
+        signature = self._get_signature(shingles)
+
+        candidates: set[str] = set()
+        for band_index, band in enumerate(self._iter_bands(signature)):
+            candidates.update(self._buckets[band_index].get(band, ()))
+
+        best_key, best_similarity = None, self._threshold
+        for key in candidates:
+            similarity = jaccard_similarity(shingles, self._items[key][0])
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key
+
+    def _get_signature(self, shingles: frozenset[str]) -> tuple[int, ...]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest()) for s in shingles
+        ]
+        return tuple(
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+            for a, b in self._permutations
+        )
+
+    def _iter_bands(self, signature: tuple[int, ...]) -> list[tuple[int, ...]]:
+        rows = self._rows_per_band
+        return [signature[i * rows : (i + 1) * rows] for i in range(self._bands)]
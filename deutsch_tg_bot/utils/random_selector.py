@@ -1,16 +1,54 @@
 import random
-from typing import Iterable
+from array import array
+from collections.abc import Iterable
+from typing import Any
+
+
+class _FenwickTree:
+    """Binary indexed tree of floats with O(log n) point updates and prefix sums."""
+
+    def __init__(self, values: Iterable[float]) -> None:
+        self._tree = array("d", [0.0])
+        self._tree.extend(values)
+        self._size = len(self._tree) - 1
+        # Linear-time build: push each node's value to its parent
+        for i in range(1, self._size + 1):
+            parent = i + (i & -i)
+            if parent <= self._size:
+                self._tree[parent] += self._tree[i]
+        self.top_bit = 1 << (self._size.bit_length() - 1) if self._size else 0
+
+    def add(self, index: int, delta: float) -> None:
+        i = index + 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def node(self, i: int) -> float:
+        return self._tree[i]
 
 
 class BalancedRandomSelector[T]:
+    """
+    Weighted random selector which decays the probability of the selected item by `decay_factor`
+    and redistributes the difference to other items proportionally to their initial probabilities.
+    So recently selected items are less likely to be selected again.
+
+    Current probabilities are stored as `p[i] = offsets[i] + scale * initial[i]`. Redistribution to
+    all other items is a single update of `scale`, and selection is a descent over two Fenwick
+    trees, so `select` costs O(log n) regardless of the number of items.
+    """
+
     def __init__(
         self,
         items: Iterable[T],
         weights: Iterable[float] | None = None,
         decay_factor: float = 0.25,
+        seed: int | None = None,
     ) -> None:
         self._items = list(items)
         self._decay_factor = decay_factor
+        self._random = random.Random(seed)
 
         if weights is None:
             weights = [1.0] * len(self._items)
@@ -19,29 +57,93 @@ class BalancedRandomSelector[T]:
 
         # Normalize weights to probabilities (sum = 1)
         total = sum(weights)
-        self._initial_probabilities = [w / total for w in weights]
-        self._current_probabilities = self._initial_probabilities.copy()
+        self._initial_probabilities = array("d", (w / total for w in weights))
+        self._initial_tree = _FenwickTree(self._initial_probabilities)
+        self._reset_offsets(self._initial_probabilities)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def items(self) -> list[T]:
+        return self._items
+
+    @property
+    def probabilities(self) -> list[float]:
+        return [self._get_probability(i) for i in range(len(self._items))]
 
     def select(self) -> T:
-        selected_item = random.choices(self._items, weights=self._current_probabilities, k=1)[0]
-        selected_index = self._items.index(selected_item)
-        old_prob = self._current_probabilities[selected_index]
+        selected_index = self._find_index(self._random.random() * self._get_total())
+        old_prob = self._get_probability(selected_index)
         new_prob = old_prob * self._decay_factor
         prob_diff = old_prob - new_prob
 
         # Redistribute difference proportionally to initial probabilities of other items
-        other_initial_sum = sum(
-            self._initial_probabilities[i] for i in range(len(self._items)) if i != selected_index
-        )
-
-        # Update probabilities
-        for i in range(len(self._items)):
-            if i == selected_index:
-                self._current_probabilities[i] = new_prob
-            else:
-                # Add portion proportionally to initial probability
-                if other_initial_sum > 0:
-                    proportion = self._initial_probabilities[i] / other_initial_sum
-                    self._current_probabilities[i] += prob_diff * proportion
-
-        return selected_item
+        other_initial_sum = 1.0 - self._initial_probabilities[selected_index]
+        if other_initial_sum > 0:
+            self._scale += prob_diff / other_initial_sum
+
+        new_offset = new_prob - self._scale * self._initial_probabilities[selected_index]
+        self._offsets_tree.add(selected_index, new_offset - self._offsets[selected_index])
+        self._offsets[selected_index] = new_offset
+
+        # Fold the accumulated scale into offsets once per n selections to keep float error low.
+        # Amortized cost per selection stays O(1).
+        self._selections_since_rebuild += 1
+        if self._selections_since_rebuild >= len(self._items):
+            self._reset_offsets(array("d", self.probabilities))
+
+        return self._items[selected_index]
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {
+            "items": self._items,
+            "decay_factor": self._decay_factor,
+            "initial_probabilities": self._initial_probabilities.tobytes(),
+            "current_probabilities": array("d", self.probabilities).tobytes(),
+            "random_state": self._random.getstate(),
+        }
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self._items = state["items"]
+        self._decay_factor = state["decay_factor"]
+        self._random = random.Random()
+        self._random.setstate(state["random_state"])
+        self._initial_probabilities = array("d")
+        self._initial_probabilities.frombytes(state["initial_probabilities"])
+        self._initial_tree = _FenwickTree(self._initial_probabilities)
+        current_probabilities = array("d")
+        current_probabilities.frombytes(state["current_probabilities"])
+        self._reset_offsets(current_probabilities)
+
+    def _reset_offsets(self, current_probabilities: array[float]) -> None:
+        self._scale = 0.0
+        self._offsets = array("d", current_probabilities)
+        self._offsets_tree = _FenwickTree(self._offsets)
+        self._selections_since_rebuild = 0
+
+    def _get_probability(self, index: int) -> float:
+        return self._offsets[index] + self._scale * self._initial_probabilities[index]
+
+    def _get_total(self) -> float:
+        total, i = 0.0, len(self._items)
+        while i > 0:
+            total += self._offsets_tree.node(i) + self._scale * self._initial_tree.node(i)
+            i -= i & -i
+        return total
+
+    def _find_index(self, value: float) -> int:
+        """Find the first index where the prefix sum of probabilities exceeds `value`."""
+        position = 0
+        step = self._offsets_tree.top_bit
+        while step:
+            next_position = position + step
+            if next_position <= len(self._items):
+                node_sum = self._offsets_tree.node(next_position) + self._scale * (
+                    self._initial_tree.node(next_position)
+                )
+                if node_sum <= value:
+                    position = next_position
+                    value -= node_sum
+            step >>= 1
+        return min(position, len(self._items) - 1)
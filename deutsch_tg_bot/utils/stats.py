@@ -0,0 +1,11 @@
+import math
+from collections.abc import Sequence
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile, `q` is in [0, 100]. Returns 0 for no values."""
+    if not values:
+        return 0.0
+    sorted_values = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
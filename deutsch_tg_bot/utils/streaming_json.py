@@ -0,0 +1,172 @@
+"""Incremental parsing of streamed JSON objects, so fields are used as soon as they complete."""
+
+import json
+import re
+from collections.abc import AsyncIterable, Awaitable, Callable
+from enum import Enum, auto
+from typing import Any
+
+_STRING_SPECIAL_RE = re.compile(r'["\\]')
+_CONTAINER_SPECIAL_RE = re.compile(r'["\\\[\]{}]')
+
+
+class _State(Enum):
+    BEFORE_OBJECT = auto()
+    EXPECT_KEY = auto()
+    IN_KEY = auto()
+    EXPECT_COLON = auto()
+    EXPECT_VALUE = auto()
+    IN_STRING_VALUE = auto()
+    IN_CONTAINER_VALUE = auto()
+    IN_SCALAR_VALUE = auto()
+    DONE = auto()
+
+
+class StreamingJSONObjectParser:
+    """
+    Parser of a JSON object which arrives in chunks. `feed` returns top-level fields
+    completed by the chunk. Nested values are returned whole, once they are complete.
+
+    Strings are scanned with regex jumps to the next quote or backslash, and the
+    processed part of the buffer is dropped, so parsing is linear in the response length.
+    """
+
+    def __init__(self) -> None:
+        self.fields: dict[str, Any] = {}
+        self._buffer = ""
+        self._position = 0
+        self._token_start = 0
+        self._state = _State.BEFORE_OBJECT
+        self._key = ""
+        self._depth = 0
+        self._in_nested_string = False
+
+    @property
+    def is_done(self) -> bool:
+        return self._state is _State.DONE
+
+    def feed(self, chunk: str) -> list[tuple[str, Any]]:
+        buffer = self._buffer = self._buffer + chunk
+        completed_fields: list[tuple[str, Any]] = []
+        i = self._position
+
+        while i < len(buffer):
+            state = self._state
+            char = buffer[i]
+
+            if state in (_State.IN_KEY, _State.IN_STRING_VALUE) or (
+                state is _State.IN_CONTAINER_VALUE and self._in_nested_string
+            ):
+                match = _STRING_SPECIAL_RE.search(buffer, i)
+                if match is None:
+                    i = len(buffer)
+                    break
+                i = match.end()
+                if match.group() == "\\":
+                    if i == len(buffer):
+                        # Escaped character is in the next chunk
+                        i -= 1
+                        break
+                    i += 1
+                    continue
+                if state is _State.IN_KEY:
+                    self._key = json.loads(buffer[self._token_start : i])
+                    self._state = _State.EXPECT_COLON
+                elif state is _State.IN_STRING_VALUE:
+                    self._complete_field(buffer[self._token_start : i], completed_fields)
+                else:
+                    self._in_nested_string = False
+
+            elif state is _State.IN_CONTAINER_VALUE:
+                match = _CONTAINER_SPECIAL_RE.search(buffer, i)
+                if match is None:
+                    i = len(buffer)
+                    break
+                i = match.end()
+                special_char = match.group()
+                if special_char == '"':
+                    self._in_nested_string = True
+                elif special_char in "[{":
+                    self._depth += 1
+                elif special_char in "]}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._complete_field(buffer[self._token_start : i], completed_fields)
+
+            elif state is _State.IN_SCALAR_VALUE:
+                if char in ",}" or char.isspace():
+                    # The terminating character is processed in the next state
+                    self._complete_field(buffer[self._token_start : i], completed_fields)
+                else:
+                    i += 1
+
+            elif char.isspace():
+                i += 1
+
+            elif state is _State.BEFORE_OBJECT and char == "{":
+                self._state = _State.EXPECT_KEY
+                i += 1
+
+            elif state is _State.EXPECT_KEY and char == '"':
+                self._state = _State.IN_KEY
+                self._token_start = i
+                i += 1
+
+            elif state is _State.EXPECT_KEY and char in ",}":
+                if char == "}":
+                    self._state = _State.DONE
+                i += 1
+
+            elif state is _State.EXPECT_COLON and char == ":":
+                self._state = _State.EXPECT_VALUE
+                i += 1
+
+            elif state is _State.EXPECT_VALUE:
+                self._token_start = i
+                if char == '"':
+                    self._state = _State.IN_STRING_VALUE
+                elif char in "[{":
+                    self._state = _State.IN_CONTAINER_VALUE
+                    self._depth = 1
+                    self._in_nested_string = False
+                else:
+                    self._state = _State.IN_SCALAR_VALUE
+                i += 1
+
+            else:
+                raise ValueError(f"Unexpected character {char!r} in JSON object at {state.name}")
+
+        # Keep only the unfinished token
+        if self._state in (
+            _State.IN_KEY,
+            _State.IN_STRING_VALUE,
+            _State.IN_CONTAINER_VALUE,
+            _State.IN_SCALAR_VALUE,
+        ):
+            self._buffer = buffer[self._token_start :]
+            self._position = i - self._token_start
+            self._token_start = 0
+        else:
+            self._buffer = buffer[i:]
+            self._position = 0
+        return completed_fields
+
+    def _complete_field(self, token: str, completed_fields: list[tuple[str, Any]]) -> None:
+        value = json.loads(token)
+        self.fields[self._key] = value
+        completed_fields.append((self._key, value))
+        self._state = _State.EXPECT_KEY
+
+
+type FieldCallback = Callable[[str, Any], Awaitable[None]]
+
+
+async def stream_json_fields(chunks: AsyncIterable[str], on_field: FieldCallback) -> str:
+    """Call `on_field` for each top-level field once it completes. Return the whole JSON text."""
+    parser = StreamingJSONObjectParser()
+    text_parts: list[str] = []
+    async for chunk in chunks:
+        text_parts.append(chunk)
+        for name, value in parser.feed(chunk):
+            await on_field(name, value)
+    return "".join(text_parts)
@@ -1,6 +1,10 @@
 from cyclopts import App
 
+from deutsch_tg_bot.benchmarks.suite import run_benchmarks
 from deutsch_tg_bot.bot import start_bot
+from deutsch_tg_bot.golden_eval.harness import run_golden_eval
+from deutsch_tg_bot.situation_training.grammar_precheck import build_german_lexicon
+from deutsch_tg_bot.situation_training.situation_library import generate_situation_presets
 
 cli_app = App(
     name="deutsch_tg_bot",
@@ -9,6 +13,10 @@ cli_app = App(
 cli_app.register_install_completion_command()
 
 cli_app.command(start_bot)
+cli_app.command(generate_situation_presets)
+cli_app.command(build_german_lexicon)
+cli_app.command(run_golden_eval)
+cli_app.command(run_benchmarks)
 
 
 if __name__ == "__main__":